@@ -0,0 +1,108 @@
+"""
+backtest_checkpoint.py
+    Salvataggio e ripristino dello stato finale del test di una strategia (checkpoint),
+    per estendere i risultati alle settimane aggiunte successivamente senza ripetere
+    l'intera simulazione.
+"""
+import datetime
+import json
+import pathlib
+
+from commons import atomic_output_path, make_dir_if_not_exists
+
+# Nome della sottocartella (della cartella dei dati) che contiene i checkpoint
+CHECKPOINT_DIR_NAME = "checkpoints"
+# Versione del formato dei checkpoint (un checkpoint di versione diversa viene ignorato)
+CHECKPOINT_VERSION = 3
+# Valori settimanali salvati nel checkpoint (stessi valori di StrategyTestResult.add_valueset)
+CHECKPOINT_VALUES = ['amount_usd', 'amount_btc', 'transactions', 'transactions_amount_usd', 'transactions_amount_btc',
+                     'transaction_fees_usd', 'transaction_fees_btc']
+
+
+def checkpoint_file_path(checkpoint_dir, strategy, start_date, initial_amount_usd):
+    """
+    Restituisce il percorso del checkpoint di una strategia.
+    """
+    file_name = "s-%s_au-%d_f-%.2f_rpw-%d_cn-%d_wc-%d.json" % (start_date, initial_amount_usd, strategy.transaction_fee,
+                                                                strategy.rebalance_period_weeks, strategy.crypto_number,
+                                                                strategy.weight_cap_perc)
+    return pathlib.Path(checkpoint_dir, file_name)
+
+
+class StrategyCheckpoint:
+    """
+    Stato del test di una strategia al termine dell'ultima settimana analizzata: quantità
+    detenute per coin (simbolo e nome), numero di settimane analizzate, valori settimanali (da cui sono
+    ricalcolati totali cumulati, drawdown e Sharpe ratio) ed hash dei file sorgente di
+    tutte le settimane del periodo, che invalidano il checkpoint se i dati cambiano.
+    [Resumable strategy test state.]
+    """
+
+    def __init__(self, parameters, last_date, week_number, holdings, digests, dates, values):
+        # Parametri del test (strategia, capitale iniziale, data di inizio, ...)
+        self.parameters = parameters
+        # Ultima data del periodo analizzato
+        self.last_date = last_date
+        # Numero di settimane analizzate (usato per il periodo di ribilanciamento)
+        self.week_number = week_number
+        # Quantità detenuta di ciascuna coin (lista di terne simbolo, nome, quantità)
+        self.holdings = holdings
+        # Hash del file sorgente di ogni data del periodo (None se la settimana non era disponibile)
+        self.digests = digests
+        # Date delle settimane analizzate e valori settimanali (nome -> lista)
+        self.dates = dates
+        self.values = values
+
+    @classmethod
+    def load(cls, checkpoint_path):
+        """
+        Legge un checkpoint da file. Restituisce None se il file non esiste, non è leggibile
+        o ha un formato diverso da quello corrente.
+        """
+        try:
+            with open(str(checkpoint_path)) as checkpoint_file:
+                data = json.load(checkpoint_file)
+            if data.get('version') != CHECKPOINT_VERSION:
+                return None
+            parse_date = lambda text: datetime.datetime.strptime(text, "%Y-%m-%d").date()
+            return cls(data['parameters'], parse_date(data['last_date']), data['week_number'], data['holdings'],
+                       {parse_date(date): digest for date, digest in data['digests']},
+                       [parse_date(date) for date in data['dates']], data['values'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, checkpoint_path):
+        """
+        Scrive il checkpoint su file (in modo atomico).
+        """
+        make_dir_if_not_exists(pathlib.Path(checkpoint_path).parent)
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'parameters': self.parameters,
+            'last_date': self.last_date.strftime("%Y-%m-%d"),
+            'week_number': self.week_number,
+            'holdings': self.holdings,
+            'digests': [[date.strftime("%Y-%m-%d"), digest] for date, digest in sorted(self.digests.items())],
+            'dates': [date.strftime("%Y-%m-%d") for date in self.dates],
+            'values': self.values
+        }
+        with atomic_output_path(checkpoint_path) as output_path:
+            with open(str(output_path), "w") as checkpoint_file:
+                json.dump(data, checkpoint_file)
+
+    def is_valid(self, parameters, digests, end_date):
+        """
+        Verifica che il checkpoint sia stato generato con gli stessi parametri e che i file
+        sorgente delle settimane fino alla data end_date non siano cambiati (digests:
+        data -> hash, con None per le settimane non disponibili).
+        """
+        if self.parameters != parameters:
+            return False
+        return all(digests.get(date) == digest for date, digest in self.digests.items() if date <= end_date)
+
+    def get_values(self, end_date):
+        """
+        Restituisce date e valori settimanali fino alla data specificata inclusa.
+        """
+        count = sum(1 for date in self.dates if date <= end_date)
+        return self.dates[:count], {name: self.values[name][:count] for name in CHECKPOINT_VALUES}
@@ -5,24 +5,45 @@ backtest_strategy.py
     Effettua il backtest di una strategia di investimento.
 """
 import argparse
+import concurrent.futures
 import datetime
 import pathlib
 import re
+import time
 
 import pandas as pd
 import numpy as np
 
-from commons import annualized_sharpe, daterange, FIRST_DATE, PERC_FACTOR, Config
+from backtest_checkpoint import checkpoint_file_path, CHECKPOINT_DIR_NAME, CHECKPOINT_VALUES, StrategyCheckpoint
+from batch_backtest import simulate_batch
+from commons import atomic_output_path, daterange, FIRST_DATE, PERC_FACTOR, Config
+from index_weights import capped_weights, WeightsTable
+from market_data import CACHE_DIR_NAME, SnapshotPanel
+from holdings import SparseHoldings
+from metrics import METRICS_VALUES, OnlineMetrics
+from parameter_search import search_strategies, SEARCH_OBJECTIVES, SEARCH_VALUES
+from profiling import Profiler
+from result_cache import DEFAULT_MAX_MB, RESULT_CACHE_DIR_NAME, result_key, ResultCache
+from robustness_analysis import get_confidence_interval, ROBUSTNESS_VALUES, simulate_bootstrap
+from results_store import ResultsStore, RESULTS_STORE_NAME, write_json_records, write_json_values
+from rolling_analysis import get_distribution, rolling_windows, ROLLING_VALUES, simulate_rolling
+from snapshot_store import SnapshotStore
 
 # Configurazione (global)
 config = Config()
+# Misura dei tempi per fase (global, abilitata con --profile)
+profiler = Profiler()
+# Fasi misurate, nell'ordine del riepilogo
+PROFILE_PHASES = ['load', 'weights', 'join', 'rebalance', 'fees', 'metrics', 'export']
 
-def log(level, text):
+def log(level, fmt, *args):
     """
-    Logga una stringa su standard output (se il livello è congruo).
+    Logga un messaggio su standard output (se il livello è congruo).
+    La formattazione (fmt % args, oppure la conversione in stringa di fmt se non ci sono
+    argomenti) avviene solo se il messaggio viene effettivamente stampato.
     """
     if level <= config.verbosity:
-        print (text)
+        print (fmt % args if args else fmt)
 
 class StrategyConfiguration:
     """
@@ -43,22 +64,12 @@ class StrategyConfiguration:
         """
         Calcola il peso di ciascuna coin.
         """
-        total_market_cap = data.loc[:self.crypto_number,['marketcapusd']].astype(float).sum()[0]
-        log(4, "Total market cap: %d" % total_market_cap)
-        reweight_factor = 1
-        weights_sum = 0
-        weight_cap = self.weight_cap_perc / 100.0
+        market_caps = data.loc[:self.crypto_number, 'marketcapusd'].astype(float)
+        log(4, "Total market cap: %d", market_caps.sum())
         data['weight'] = 0.0
-        # Il calcolo dei pesi con il cap deve essere effettuato in modo
-        # iterativo.
-        while weights_sum < 0.999999:
-            data.loc[:self.crypto_number, 'weight'] = data['marketcapusd'].astype(float) / total_market_cap * reweight_factor
-            data.loc[data.weight > weight_cap, 'weight'] = weight_cap
-            weights_sum = data.weight.sum()
-            log(4, "weights_sum: %.5f, reweight_factor: %.2f" % (weights_sum, reweight_factor))
-            reweight_factor = reweight_factor * (1 / weights_sum)
-            log(4, "new reweight_factor: %.2f" % reweight_factor)
-        
+        data.loc[:self.crypto_number, 'weight'] = capped_weights(market_caps.values, self.weight_cap_perc / 100.0)
+        log(4, "weights_sum: %.5f", data.weight.sum())
+
     def __str__(self):
         """
         Restituisce una descrizione testuale della strategia.
@@ -82,6 +93,9 @@ class StrategyTestResult:
         self.transaction_fees_btc = []
         self.transaction_fees_usd = []
         self.strategy = strategy_configuration
+        # Indicatori aggiornati ad ogni settimana (nome -> valori settimanali)
+        self.metrics = OnlineMetrics()
+        self.metric_values = {name: [] for name in METRICS_VALUES}
 
     def add_valueset(self, snapshot):
         """
@@ -95,41 +109,67 @@ class StrategyTestResult:
         self.transactions_amount_btc.append(snapshot.get_transactions_amount_btc())
         self.transaction_fees_usd.append(snapshot.get_transaction_fees_usd())
         self.transaction_fees_btc.append(snapshot.get_transaction_fees_btc())
+        self.update_metrics(self.amount_usd[-1], self.amount_btc[-1], self.transactions_amount_usd[-1])
+
+    def update_metrics(self, amount_usd, amount_btc, transactions_amount_usd):
+        """
+        Aggiorna gli indicatori con i valori di una settimana.
+        """
+        step = self.metrics.update(np.array([amount_usd]), np.array([amount_btc]), np.array([transactions_amount_usd]))
+        for name in METRICS_VALUES:
+            self.metric_values[name].append(step[name][0])
+
+    def add_values(self, dates, values):
+        """
+        Aggiunge ai risultati i valori settimanali di più settimane (dizionario nome -> valori),
+        calcolati da batch_backtest.simulate_batch o letti da un checkpoint. Se i valori non
+        comprendono gli indicatori (già calcolati da simulate_batch), questi vengono aggiornati
+        settimana per settimana.
+        """
+        self.date.extend(dates)
+        self.amount_usd.extend(values['amount_usd'])
+        self.amount_btc.extend(values['amount_btc'])
+        self.transactions.extend(values['transactions'])
+        self.transactions_amount_usd.extend(values['transactions_amount_usd'])
+        self.transactions_amount_btc.extend(values['transactions_amount_btc'])
+        self.transaction_fees_usd.extend(values['transaction_fees_usd'])
+        self.transaction_fees_btc.extend(values['transaction_fees_btc'])
+        if all(name in values for name in METRICS_VALUES):
+            for name in METRICS_VALUES:
+                self.metric_values[name].extend(values[name])
+        else:
+            for amount_usd, amount_btc, transactions_amount_usd in zip(values['amount_usd'], values['amount_btc'],
+                                                                       values['transactions_amount_usd']):
+                self.update_metrics(amount_usd, amount_btc, transactions_amount_usd)
 
     def end_of_computation(self):
         """
         Notifica la fine dell'analisi. Completa con il calcolo dei valori aggregati.
         """
-        self.snapshots = pd.DataFrame(
-            {
-                'date': self.date,
-                'amount_usd': self.amount_usd,
-                'amount_btc': self.amount_btc,
-                'transactions': self.transactions,
-                'transactions_amount_usd': self.transactions_amount_usd,
-                'transactions_amount_btc': self.transactions_amount_btc,
-                'transaction_fees_usd': self.transaction_fees_usd,
-                'transaction_fees_btc': self.transaction_fees_btc
-            }
-        )
-        self.snapshots['profit_usd'] = self.snapshots.amount_usd - config.initial_amount_usd
-        self.snapshots['profit_btc'] = self.snapshots.amount_btc - self.snapshots.amount_btc[0]
-        self.snapshots['roi_usd'] = self.snapshots.profit_usd / config.initial_amount_usd * PERC_FACTOR
-        self.snapshots['roi_btc'] = self.snapshots.profit_btc / self.snapshots.amount_btc[0] * PERC_FACTOR
-        self.snapshots['tot_transactions_number'] = self.snapshots.transactions.cumsum()
-        self.snapshots['tot_transactions_amount_usd'] = self.snapshots.transactions_amount_usd.cumsum()
-        self.snapshots['tot_transactions_amount_btc'] = self.snapshots.transactions_amount_btc.cumsum()
-        self.snapshots['tot_transaction_fees_usd'] = self.snapshots.transaction_fees_usd.cumsum()
-        self.snapshots['tot_transaction_fees_btc'] = self.snapshots.transaction_fees_btc.cumsum()
-        self.snapshots['expanding_max'] = self.snapshots.amount_usd.expanding().max()
-        self.snapshots['drawdown'] = self.snapshots.amount_usd - self.snapshots.expanding_max
-        self.snapshots['drawdown_perc'] = self.snapshots.drawdown / self.snapshots.expanding_max * PERC_FACTOR
-        self.snapshots['max_drawdown'] = self.snapshots.drawdown.expanding().min()
-        self.snapshots['max_drawdown_perc'] = self.snapshots.drawdown_perc.expanding().min()
-        self.snapshots['amount_usd_weekly_returns'] = self.snapshots.amount_usd.pct_change()
-        self.snapshots['amount_btc_weekly_returns'] = self.snapshots.amount_btc.pct_change()
-        self.snapshots['amount_usd_sharpe_ratio'] = annualized_sharpe(self.snapshots.amount_usd_weekly_returns)
-        self.snapshots['amount_btc_sharpe_ratio'] = annualized_sharpe(self.snapshots.amount_btc_weekly_returns)
+        # Le colonne vengono calcolate su array NumPy ed il DataFrame costruito una sola volta
+        columns = {
+            'date': list(self.date),
+            'amount_usd': np.asarray(self.amount_usd, dtype=float),
+            'amount_btc': np.asarray(self.amount_btc, dtype=float),
+            'transactions': np.asarray(self.transactions, dtype=np.int64),
+            'transactions_amount_usd': np.asarray(self.transactions_amount_usd, dtype=float),
+            'transactions_amount_btc': np.asarray(self.transactions_amount_btc, dtype=float),
+            'transaction_fees_usd': np.asarray(self.transaction_fees_usd, dtype=float),
+            'transaction_fees_btc': np.asarray(self.transaction_fees_btc, dtype=float)
+        }
+        columns['profit_usd'] = columns['amount_usd'] - config.initial_amount_usd
+        columns['profit_btc'] = columns['amount_btc'] - columns['amount_btc'][0]
+        columns['roi_usd'] = columns['profit_usd'] / config.initial_amount_usd * PERC_FACTOR
+        columns['roi_btc'] = columns['profit_btc'] / columns['amount_btc'][0] * PERC_FACTOR
+        columns['tot_transactions_number'] = np.cumsum(columns['transactions'])
+        columns['tot_transactions_amount_usd'] = np.cumsum(columns['transactions_amount_usd'])
+        columns['tot_transactions_amount_btc'] = np.cumsum(columns['transactions_amount_btc'])
+        columns['tot_transaction_fees_usd'] = np.cumsum(columns['transaction_fees_usd'])
+        columns['tot_transaction_fees_btc'] = np.cumsum(columns['transaction_fees_btc'])
+        # Drawdown, Sharpe ratio e gli altri indicatori sono già stati calcolati settimana per settimana
+        for name in METRICS_VALUES:
+            columns[name] = np.asarray(self.metric_values[name], dtype=float)
+        self.snapshots = pd.DataFrame(columns)
         log(1, self.snapshots)
 
 
@@ -137,91 +177,115 @@ class StrategyTestResult:
         """
         Esporta i risultati su un foglio Excel.
         """
-        writer = pd.ExcelWriter(excel_file_name)
-        self.snapshots.to_excel(writer,'Snapshots')
-        writer.save()
-        log(2, "Results saved to excel file '%s'" % excel_file_name)
+        with atomic_output_path(excel_file_name) as output_path:
+            writer = pd.ExcelWriter(output_path)
+            self.snapshots.to_excel(writer,'Snapshots')
+            writer.save()
+        log(2, "Results saved to excel file '%s'", excel_file_name)
 
     def export_equity_line_usd_to_json(self, json_file_path):
         """
         Esporta la equity line in usd su file json.
         """
-        self.snapshots.loc[:,"amount_usd"].to_json(path_or_buf=json_file_path, orient='values')
-        log(2, "Equity line USD saved to json file '%s'" % json_file_path)
+        write_json_values(self.snapshots.amount_usd.values, json_file_path)
+        log(2, "Equity line USD saved to json file '%s'", json_file_path)
 
     def export_equity_line_btc_to_json(self, json_file_path):
         """
         Esporta la equity line in BTC su file json.
         """
-        self.snapshots.loc[:,"amount_btc"].to_json(path_or_buf=json_file_path, orient='values')
-        log(2, "Equity line BTC saved to json file '%s'" % json_file_path)
+        write_json_values(self.snapshots.amount_btc.values, json_file_path)
+        log(2, "Equity line BTC saved to json file '%s'", json_file_path)
 
     def get_summary(self):
         """
         Restituisce i principali dati di riepilogo del test.
         """
+        first = self.snapshots.iloc[0]
+        last = self.snapshots.iloc[-1]
         result = {}
         result['crypto_number'] = self.strategy.crypto_number
         result['weight_cap_perc'] = self.strategy.weight_cap_perc
         result['rebalance_period_weeks'] = self.strategy.rebalance_period_weeks
         result['initial_amount_usd'] = config.initial_amount_usd
-        result['start_date'] = self.snapshots.iloc[0]['date']
-        result['end_date'] = self.snapshots.iloc[-1]['date']
-        result['profit_usd'] = self.snapshots.iloc[-1]['profit_usd']
-        result['profit_btc'] = self.snapshots.iloc[-1]['profit_btc']
-        result['roi_usd'] = self.snapshots.iloc[-1]['roi_usd']
-        result['roi_btc'] = self.snapshots.iloc[-1]['roi_btc']
-        result['tot_transactions_number'] = self.snapshots.iloc[-1]['tot_transactions_number']
-        result['tot_transactions_amount_usd'] = self.snapshots.iloc[-1]['tot_transactions_amount_usd']
-        result['tot_transactions_amount_btc'] = self.snapshots.iloc[-1]['tot_transactions_amount_btc']
-        result['tot_transaction_fees_usd'] = self.snapshots.iloc[-1]['tot_transaction_fees_usd']
-        result['tot_transaction_fees_btc'] = self.snapshots.iloc[-1]['tot_transaction_fees_btc']
-        result['max_drawdown'] = self.snapshots.iloc[-1]['max_drawdown']
-        result['max_drawdown_perc'] = self.snapshots.iloc[-1]['max_drawdown_perc']
-        result['amount_usd_sharpe_ratio'] = self.snapshots.iloc[-1]['amount_usd_sharpe_ratio']
-        result['amount_btc_sharpe_ratio'] = self.snapshots.iloc[-1]['amount_btc_sharpe_ratio']
+        result['start_date'] = first['date']
+        result['end_date'] = last['date']
+        result['profit_usd'] = last['profit_usd']
+        result['profit_btc'] = last['profit_btc']
+        result['roi_usd'] = last['roi_usd']
+        result['roi_btc'] = last['roi_btc']
+        result['tot_transactions_number'] = last['tot_transactions_number']
+        result['tot_transactions_amount_usd'] = last['tot_transactions_amount_usd']
+        result['tot_transactions_amount_btc'] = last['tot_transactions_amount_btc']
+        result['tot_transaction_fees_usd'] = last['tot_transaction_fees_usd']
+        result['tot_transaction_fees_btc'] = last['tot_transaction_fees_btc']
+        result['max_drawdown'] = last['max_drawdown']
+        result['max_drawdown_perc'] = last['max_drawdown_perc']
+        result['amount_usd_sharpe_ratio'] = last['amount_usd_sharpe_ratio']
+        result['amount_btc_sharpe_ratio'] = last['amount_btc_sharpe_ratio']
+        result['amount_usd_sortino_ratio'] = last['amount_usd_sortino_ratio']
+        result['amount_btc_sortino_ratio'] = last['amount_btc_sortino_ratio']
+        result['amount_usd_volatility'] = last['amount_usd_volatility']
+        result['amount_btc_volatility'] = last['amount_btc_volatility']
+        result['calmar_ratio'] = last['calmar_ratio']
+        result['turnover'] = last['turnover']
         return result
 
 class StrategyTestSnapshot:
     """
     Risultato parziale del test di una strategia.
+    I valori di ciascuna coin sono memorizzati in array NumPy (una posizione per ogni riga
+    dello snapshot); i DataFrame con il dettaglio di allocazioni e transazioni vengono
+    costruiti solo su richiesta (ad esempio per l'output verboso).
     """
 
-    def __init__(self, date):
+    def __init__(self, date, rank, symbols, symbol_id):
         self.date = date
+        # Rank, tabella id -> simbolo ed id del simbolo di ciascuna riga
+        self.rank = rank
+        self.symbols = symbols
+        self.symbol_id = symbol_id
+        # Valori per coin (nome colonna -> array)
+        self.columns = {}
+        self.sell_to_btc = np.zeros(len(symbol_id), dtype=bool)
+        self.buy_from_btc = np.zeros(len(symbol_id), dtype=bool)
+        self.transactions_amount_usd = np.zeros(0)
+        self.transactions_amount_btc = np.zeros(0)
+        self.transaction_fees_btc = 0.0
+        self.transaction_fees_usd = 0.0
 
     def get_amount_usd(self):
         """
         Restituisce l'importo totale attualmente investito (equity) in USD.
         """
-        return self.data.allocation_usd.sum()
+        return np.nansum(self.columns['allocation_usd'])
 
     def get_amount_btc(self):
         """
         Restituisce l'importo totale attualmente investito (equity) in bitcoin.
         """
-        return self.data.allocation_btc.sum()
+        return np.nansum(self.columns['allocation_btc'])
 
     def get_transactions_amount_usd(self):
         """
         Restituisce l'importo totale in USD delle transazioni effettuate a seguito del
         ribilanciamento in questo snapshot.
         """
-        return self.transactions.amount_usd.sum()
+        return np.nansum(self.transactions_amount_usd)
 
     def get_transactions_amount_btc(self):
         """
         Restituisce l'importo totale in bitcoin delle transazioni effettuate a seguito del
         ribilanciamento in questo snapshot.
         """
-        return self.transactions.amount_btc.sum()
+        return np.nansum(self.transactions_amount_btc)
 
     def get_transactions_number(self):
         """
         Restituisce il numero totale di transazioni effettuate a seguito del ribilanciamento
         in questo snapshot.
         """
-        return len(self.transactions)
+        return len(self.transactions_amount_usd)
 
         
     def get_transaction_fees_btc(self):
@@ -238,11 +302,52 @@ class StrategyTestSnapshot:
         """
         return self.transaction_fees_usd
 
+    def get_data(self):
+        """
+        Restituisce i valori dello snapshot come DataFrame (una riga per coin).
+        """
+        data = pd.DataFrame(self.columns)
+        data.insert(0, 'date', self.date.strftime("%Y-%m-%d"))
+        data.insert(1, 'symbol', [self.symbols[sid] for sid in self.symbol_id])
+        data.index = pd.Index(self.rank, name='rank')
+        return data
+
+    def get_transactions(self):
+        """
+        Restituisce le transazioni effettuate in questo snapshot come DataFrame.
+        """
+        columns = ['date', 'source_curr', 'dest_curr', 'size', 'priceusd', 'pricebtc', 'amount_usd', 'amount_btc']
+        if 'diff_allocation_size' not in self.columns:
+            return pd.DataFrame(columns=columns)
+        data = self.get_data()
+        transactions = []
+        for mask, source, dest in [(self.sell_to_btc, None, 'BTC'), (self.buy_from_btc, 'BTC', None)]:
+            rows = data.loc[mask]
+            transactions.append(pd.DataFrame({
+                'date': rows.date,
+                'source_curr': rows.symbol if source is None else source,
+                'dest_curr': rows.symbol if dest is None else dest,
+                'size': rows.diff_allocation_size.abs(),
+                'priceusd': rows.priceusd,
+                'pricebtc': rows.pricebtc
+            }, columns=columns[:-2]))
+        transactions = pd.concat(transactions)
+        transactions['amount_usd'] = self.transactions_amount_usd
+        transactions['amount_btc'] = self.transactions_amount_btc
+        return transactions
+
     def print_status(self):
+        """
+        Stampa il dettaglio dello snapshot (con verbosità 2 o superiore): i DataFrame vengono
+        costruiti solo se stampati.
+        """
+        if config.verbosity < 2:
+            return
+        data = self.get_data()
         log(2, "\nAsset allocation:\n-----")
-        log(2, self.data.loc[self.data.req_allocation_size > 0])
+        log(2, data.loc[data.req_allocation_size > 0])
         log(2, "\nTransactions:\n-----")
-        log(2, self.transactions)
+        log(2, self.get_transactions())
         log(2, "\nAmount USD:\n-----")
         log(2, self.get_amount_usd())
         log(2, "\nAmount BTC:\n-----")
@@ -251,133 +356,649 @@ class StrategyTestSnapshot:
         log(2, self.get_transaction_fees_btc())
         log(2, "\nTransaction fees USD:\n----")
         log(2, self.get_transaction_fees_usd())
+        if config.verbosity < 4:
+            return
         log(4, "\nData size:\n-----")
-        log(4, self.data.shape)
+        log(4, data.shape)
         log(4, "\nSnapshot data memory usage:\n-----")
-        log(4, self.data.memory_usage())
+        log(4, data.memory_usage())
 
     
-def test_strategy(strategy):
+def test_strategy(strategy, start_date, panel, weights_table=None):
     """
-    Esegue il test della strategia specificata.
+    Esegue il test della strategia specificata, a partire dalla data indicata, sui dati
+    del pannello condiviso. Se specificata, la tabella dei pesi precalcolati evita di
+    ricalcolare i pesi ad ogni test.
+    Le quantità detenute sono mantenute in forma sparsa (id della coin -> quantità) e di
+    ogni snapshot vengono elaborate solo le righe che possono avere un peso nel paniere e
+    quelle delle coin detenute (vedi SnapshotPanel.get_active_rows).
+    Con l'opzione --checkpoint il test riprende dallo stato salvato da un'esecuzione
+    precedente (se ancora valido) e simula solo le settimane successive.
     [Performs the test on the specified strategy.]
     """
     result = StrategyTestResult(strategy)
-    
-    # Creo uno snapshot iniziale fittizio
-    prev_snapshot = None
+
+    if weights_table is None:
+        weights_table = WeightsTable(panel)
+    weights = weights_table.get_weights(strategy.crypto_number, strategy.weight_cap_perc)
+    basket_columns = weights.shape[1]
+    btc_id = panel.get_symbol_id('BTC')
+
+    # Quantità detenuta di ciascuna coin (per id della coin)
+    holdings = SparseHoldings()
     current_week_idx = 0
+    dates = list(daterange(start_date, config.end_date, 7))
 
-    for date in daterange(config.start_date, config.end_date, 7):
-        log(1, "Analyzing date: %s" % date)
-        csv_file_path = pathlib.Path(config.data_dir, date.strftime("%Y-%m-%d.csv"))
-        log(2, "Looking from file: %s" % csv_file_path)
+    checkpoint = load_checkpoint(strategy, start_date, panel) if config.checkpoint else None
+    if checkpoint is not None:
+        checkpoint_dates, checkpoint_values = checkpoint.get_values(config.end_date)
+        result.add_values(checkpoint_dates, checkpoint_values)
+        if checkpoint.last_date >= config.end_date:
+            log(1, "Results up to %s read from checkpoint", config.end_date)
+            with profiler.phase('metrics'):
+                result.end_of_computation()
+            return result
+        log(1, "Resuming from checkpoint of %s", checkpoint.last_date)
+        coin_ids = np.array([panel.get_coin_id(symbol, name) for symbol, name, _ in checkpoint.holdings], dtype=np.int64)
+        sizes = np.array([[size for _, _, size in checkpoint.holdings]])
+        holdings.set([0], coin_ids[coin_ids >= 0], sizes[:, coin_ids >= 0])
+        current_week_idx = checkpoint.week_number
+        dates = [date for date in dates if date > checkpoint.last_date]
+
+    for date in dates:
+        log(1, "Analyzing date: %s", date)
         try:
-            df = pd.read_csv(csv_file_path, ";", index_col='rank', nrows=150)
-            strategy.add_weights_column(df)
-            
-            snapshot = StrategyTestSnapshot(date)
-
-            if not prev_snapshot:
-                snapshot.initial_amount_usd = config.initial_amount_usd
-                snapshot.data = df
-                snapshot.data['initial_allocation_size'] = 0
-                # Assumo che inizialmente il capitale sia interamente allocato su BTC
-                snapshot.data.at[snapshot.data.symbol == 'BTC', 'initial_allocation_size'] = snapshot.initial_amount_usd / snapshot.data.loc[snapshot.data.symbol == 'BTC','priceusd']
-            else:
-                prev_data = prev_snapshot.data.loc[prev_snapshot.data.allocation_size > 0].filter(items=['symbol','allocation_size'])
-                prev_data.columns = ['symbol', 'initial_allocation_size']
-
-                log(4, "Prev data:\n-----\n%s" % str(prev_data))
-                log(4, "Prev_data shape: %s" % str(prev_data.shape))
-                log(4, "Pre-join data:\n-----\n%s" % str(df))
-                log(4, "Pre join data shape: %s" % str(df.shape))
-                snapshot.data = df.join(prev_data.set_index('symbol'), on='symbol')
-                snapshot.data.initial_allocation_size.fillna(0, inplace=True)
-                log(3, "Post-join data:\n-----\n%s" % str(snapshot.data))
-                log(3, "Post join data shape: %s" % str(snapshot.data.shape))
-
-            snapshot.data['initial_amount_usd'] = snapshot.data.initial_allocation_size * snapshot.data.priceusd
-            snapshot.data['initial_amount_btc'] = snapshot.data.initial_allocation_size * snapshot.data.pricebtc
-            snapshot.initial_amount_usd = snapshot.data.initial_amount_usd.sum()                
-            
-            log(3, snapshot.data.loc[:25])
-            
-            # Compute required allocations
-            snapshot.data['req_allocation_usd'] = snapshot.data.weight * snapshot.initial_amount_usd
-            snapshot.data['req_allocation_size'] = snapshot.data.req_allocation_usd / snapshot.data.priceusd
-            snapshot.data['req_allocation_btc'] = snapshot.data.req_allocation_size * snapshot.data.pricebtc
-            
-            do_rebalance = current_week_idx % strategy.rebalance_period_weeks == 0
-
-            if (do_rebalance):
-                log(3, "Rebalancing.")
-                snapshot.data['diff_allocation_size'] = snapshot.data.req_allocation_size - snapshot.data.initial_allocation_size
-                log(2, "Required transactions:")
-                log(2, snapshot.data.loc[snapshot.data.diff_allocation_size != 0])
-                transactions_sell_to_btc = snapshot.data.loc[(snapshot.data.diff_allocation_size < 0) & (snapshot.data.symbol != 'BTC'), ['date', 'symbol', 'diff_allocation_size', 'priceusd', 'pricebtc']]
-                transactions_sell_to_btc.insert(2, 'dest_curr', 'BTC')
-                transactions_sell_to_btc.diff_allocation_size = transactions_sell_to_btc.diff_allocation_size.abs()
-                transactions_sell_to_btc['amount_usd'] = transactions_sell_to_btc.diff_allocation_size * transactions_sell_to_btc.priceusd
-                transactions_sell_to_btc['amount_btc'] = transactions_sell_to_btc.diff_allocation_size * transactions_sell_to_btc.pricebtc
-                transactions_sell_to_btc.columns = ['date','source_curr','dest_curr','size','priceusd', 'pricebtc', 'amount_usd', 'amount_btc']
-                log(2, "transactions_sell_to_btc:")
-                log(2, transactions_sell_to_btc)
-                transactions_buy_from_btc = snapshot.data.loc[(snapshot.data.diff_allocation_size > 0) & (snapshot.data.symbol != 'BTC'), ['date', 'symbol', 'diff_allocation_size', 'priceusd', 'pricebtc']]
-                transactions_buy_from_btc.insert(1, 'source_curr', 'BTC')
-                transactions_buy_from_btc['amount_usd'] = transactions_buy_from_btc.diff_allocation_size * transactions_buy_from_btc.priceusd
-                transactions_buy_from_btc['amount_btc'] = transactions_buy_from_btc.diff_allocation_size * transactions_buy_from_btc.pricebtc
-                transactions_buy_from_btc.columns = ['date','source_curr','dest_curr','size', 'priceusd', 'pricebtc', 'amount_usd', 'amount_btc']
-                log(2, "transactions_buy_from_btc:")
-                log(2, transactions_buy_from_btc)
-                snapshot.transactions = pd.concat([transactions_sell_to_btc, transactions_buy_from_btc])
-                
-                # Set current allocation
-                snapshot.data['allocation_usd'] = snapshot.data.req_allocation_usd
-                snapshot.data['allocation_size'] = snapshot.data.req_allocation_size
-                snapshot.data['allocation_btc'] = snapshot.data.req_allocation_btc
-
-                # Compute fees
-                if strategy.transaction_fee > 0:
-                    snapshot.transaction_fees_btc = snapshot.get_transactions_amount_btc() * strategy.transaction_fee / 100
-                    snapshot.transaction_fees_usd = snapshot.get_transactions_amount_usd() * strategy.transaction_fee / 100
-                    log(2, "Transaction fees: %.5f BTC (%.2f USD)" % (snapshot.transaction_fees_btc, snapshot.transaction_fees_usd))
-                    log(2, "Snapshot data before:\n---")
-                    log(2, snapshot.data.head(3))
-                    snapshot.data.at[1, 'allocation_usd'] = snapshot.data.iloc[0]['allocation_usd'] - snapshot.transaction_fees_usd
-                    snapshot.data.at[1, 'allocation_size'] = snapshot.data.iloc[0]['allocation_size'] - snapshot.transaction_fees_btc
-                    snapshot.data.at[1, 'allocation_btc'] = snapshot.data.iloc[0]['allocation_btc'] - snapshot.transaction_fees_btc                    
-                    log(2, "Snapshot data after:\n---")
-                    log(2, snapshot.data.head(3))
+            profiler.switch('join')
+            week_idx = panel.get_week_index(date)
+            # Righe dello snapshot elaborate: coin del paniere, coin detenute e BTC
+            week_rows = panel.get_rows(week_idx)
+            positions, coin_rows = panel.get_active_rows(week_idx, basket_columns, np.append(holdings.get_coin_ids(), btc_id))
+            rows = len(positions)
+            symbol_id = panel.symbol_id[week_rows][positions]
+            priceusd = panel.fields['priceusd'][week_rows][positions]
+            pricebtc = panel.fields['pricebtc'][week_rows][positions]
+            in_basket = positions < basket_columns
+            weight = np.zeros(rows)
+            weight[in_basket] = weights[week_idx, positions[in_basket]]
+            is_btc = symbol_id == btc_id
+
+            snapshot = StrategyTestSnapshot(date, panel.rank[week_rows][positions], panel.symbols, symbol_id)
+            columns = snapshot.columns
+            columns['priceusd'] = priceusd
+            columns['pricebtc'] = pricebtc
+            columns['weight'] = weight
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if current_week_idx == 0:
+                    # Assumo che inizialmente il capitale sia interamente allocato su BTC
+                    initial_allocation_size = np.zeros(rows)
+                    initial_allocation_size[is_btc] = config.initial_amount_usd / priceusd[is_btc]
+                else:
+                    initial_allocation_size = holdings.get([0], coin_rows[:-1], rows)[0]
+                columns['initial_allocation_size'] = initial_allocation_size
+                columns['initial_amount_usd'] = initial_allocation_size * priceusd
+                columns['initial_amount_btc'] = initial_allocation_size * pricebtc
+                snapshot.initial_amount_usd = np.nansum(columns['initial_amount_usd'])
+
+                profiler.switch('rebalance')
+                # Compute required allocations
+                columns['req_allocation_usd'] = weight * snapshot.initial_amount_usd
+                columns['req_allocation_size'] = columns['req_allocation_usd'] / priceusd
+                columns['req_allocation_btc'] = columns['req_allocation_size'] * pricebtc
+
+                do_rebalance = current_week_idx % strategy.rebalance_period_weeks == 0
+
+                if (do_rebalance):
+                    log(3, "Rebalancing.")
+                    diff_allocation_size = columns['req_allocation_size'] - initial_allocation_size
+                    columns['diff_allocation_size'] = diff_allocation_size
+                    snapshot.sell_to_btc = (diff_allocation_size < 0) & ~is_btc
+                    snapshot.buy_from_btc = (diff_allocation_size > 0) & ~is_btc
+                    sell, buy = snapshot.sell_to_btc, snapshot.buy_from_btc
+                    snapshot.transactions_amount_usd = np.concatenate([np.abs(diff_allocation_size[sell]) * priceusd[sell],
+                                                                       diff_allocation_size[buy] * priceusd[buy]])
+                    snapshot.transactions_amount_btc = np.concatenate([np.abs(diff_allocation_size[sell]) * pricebtc[sell],
+                                                                       diff_allocation_size[buy] * pricebtc[buy]])
+
+                    # Set current allocation
+                    columns['allocation_usd'] = columns['req_allocation_usd'].copy()
+                    columns['allocation_size'] = columns['req_allocation_size'].copy()
+                    columns['allocation_btc'] = columns['req_allocation_btc'].copy()
+
+                    # Compute fees (dedotte dalla prima coin per rank, BTC)
+                    profiler.switch('fees')
+                    if strategy.transaction_fee > 0:
+                        snapshot.transaction_fees_btc = snapshot.get_transactions_amount_btc() * strategy.transaction_fee / 100
+                        snapshot.transaction_fees_usd = snapshot.get_transactions_amount_usd() * strategy.transaction_fee / 100
+                        log(2, "Transaction fees: %.5f BTC (%.2f USD)", snapshot.transaction_fees_btc, snapshot.transaction_fees_usd)
+                        columns['allocation_usd'][0] -= snapshot.transaction_fees_usd
+                        columns['allocation_size'][0] -= snapshot.transaction_fees_btc
+                        columns['allocation_btc'][0] -= snapshot.transaction_fees_btc
                 else:
-                    snapshot.transaction_fees_btc = 0.0
-                    snapshot.transaction_fees_usd = 0.0
-
-            else:
-                log(3, "Not rebalancing.")
-                snapshot.data['allocation_usd'] = snapshot.data.initial_amount_usd
-                snapshot.data['allocation_size'] = snapshot.data.initial_allocation_size
-                snapshot.data['allocation_btc'] = snapshot.data.initial_amount_btc
-                snapshot.transactions = pd.DataFrame(columns = ['date','source_curr','dest_curr','size','amount_btc','amount_usd'])
-                snapshot.transaction_fees_btc = 0.0
-                snapshot.transaction_fees_usd = 0.0
-
-            result.add_valueset(snapshot)
+                    log(3, "Not rebalancing.")
+                    columns['allocation_usd'] = columns['initial_amount_usd']
+                    columns['allocation_size'] = initial_allocation_size
+                    columns['allocation_btc'] = columns['initial_amount_btc']
+
+                # Le coin non più presenti nello snapshot vengono perse
+                holdings.set([0], symbol_id, columns['allocation_size'][np.newaxis])
+
+            profiler.stop()
+            if config.verbosity >= 2:
+                snapshot.print_status()
+
+            with profiler.phase('metrics'):
+                result.add_valueset(snapshot)
     
             # Preparo per nuova iterazione
-            log(1, "End of analysis of date %s" % date)
+            log(1, "End of analysis of date %s", date)
             if config.interactive:
                 input("Press any key")
-            #result.snapshots.append(snapshot)
-            prev_snapshot = snapshot
             current_week_idx += 1
         except Exception as e:
+            profiler.stop()
             print("Exception while analyzing file:")
             print(e)
 
-    result.end_of_computation()
+    if config.checkpoint:
+        save_checkpoint(result, start_date, panel, holdings, current_week_idx)
+    with profiler.phase('metrics'):
+        result.end_of_computation()
     return result
 
+def get_checkpoint_path(strategy, start_date):
+    """
+    Restituisce il percorso del checkpoint di una strategia.
+    """
+    return checkpoint_file_path(pathlib.Path(config.data_dir, CHECKPOINT_DIR_NAME), strategy, start_date,
+                                config.initial_amount_usd)
+
+def get_test_parameters(strategy, start_date, panel):
+    """
+    Restituisce i parametri che identificano il test di una strategia (nei checkpoint e
+    nella cache dei risultati).
+    """
+    return {
+        'crypto_number': strategy.crypto_number,
+        'weight_cap_perc': strategy.weight_cap_perc,
+        'rebalance_period_weeks': strategy.rebalance_period_weeks,
+        'transaction_fee': strategy.transaction_fee,
+        'initial_amount_usd': config.initial_amount_usd,
+        'start_date': start_date.strftime("%Y-%m-%d"),
+        'max_rank': panel.max_rank
+    }
+
+def load_checkpoint(strategy, start_date, panel):
+    """
+    Legge il checkpoint di una strategia, se esiste ed è ancora valido per i parametri
+    del test e per i file sorgente delle settimane già analizzate.
+    """
+    checkpoint_path = get_checkpoint_path(strategy, start_date)
+    checkpoint = StrategyCheckpoint.load(checkpoint_path)
+    if checkpoint is None:
+        return None
+    digests = {date: panel.get_digest(date) for date in daterange(start_date, min(checkpoint.last_date, config.end_date), 7)}
+    if not checkpoint.is_valid(get_test_parameters(strategy, start_date, panel), digests, config.end_date):
+        log(1, "Ignoring invalid checkpoint '%s'", checkpoint_path)
+        return None
+    return checkpoint
+
+def save_checkpoint(result, start_date, panel, holdings, week_number):
+    """
+    Salva il checkpoint di una strategia al termine del test.
+    """
+    values = {name: [value.item() if isinstance(value, np.generic) else value for value in getattr(result, name)]
+              for name in CHECKPOINT_VALUES}
+    checkpoint = StrategyCheckpoint(get_test_parameters(result.strategy, start_date, panel), config.end_date, week_number,
+                                    [[panel.symbols[coin_id], panel.names[coin_id], size] for coin_id, size in holdings.get_run_holdings(0).items()],
+                                    {date: panel.get_digest(date) for date in daterange(start_date, config.end_date, 7)},
+                                    list(result.date), values)
+    checkpoint_path = get_checkpoint_path(result.strategy, start_date)
+    checkpoint.save(checkpoint_path)
+    log(2, "Checkpoint saved to file '%s'", checkpoint_path)
+
+def run_strategy(strategy, start_date, panel, weights_table):
+    """
+    Esegue il test di una strategia ed esporta i risultati su file.
+    Restituisce i dati di riepilogo del test.
+    """
+    result = test_strategy(strategy, start_date, panel, weights_table)
+    with profiler.phase('export'):
+        summary = export_results(result, start_date)
+        store_result(result, summary, start_date, panel)
+    return summary
+
+def run_strategies_in_batch(tests, panel, weights_table):
+    """
+    Esegue insieme i test di tutte le strategie (batch_backtest) ed esporta i risultati su file.
+    Restituisce i dati di riepilogo dei test, nello stesso ordine dei test.
+    """
+    batch_results = simulate_batch(panel, weights_table, [(strategy, start_date) for _, strategy, start_date in tests],
+                                   config.end_date, config.initial_amount_usd, profiler)
+    summaries = []
+    for (test_number, strategy, start_date), (dates, values) in zip(tests, batch_results):
+        with profiler.phase('metrics'):
+            result = StrategyTestResult(strategy)
+            result.add_values(dates, values)
+            result.end_of_computation()
+        with profiler.phase('export'):
+            summary = export_results(result, start_date)
+            store_result(result, summary, start_date, panel)
+        summaries.append(summary)
+    return summaries
+
+def open_result_cache():
+    """
+    Restituisce la cache dei risultati (None se disabilitata).
+    """
+    if not config.result_cache:
+        return None
+    return ResultCache(pathlib.Path(config.data_dir, CACHE_DIR_NAME, RESULT_CACHE_DIR_NAME), config.result_cache_mb * 1024 * 1024)
+
+def get_result_key(strategy, start_date, panel):
+    """
+    Restituisce la chiave del risultato del test di una strategia nella cache dei risultati.
+    """
+    parameters = get_test_parameters(strategy, start_date, panel)
+    parameters['end_date'] = config.end_date.strftime("%Y-%m-%d")
+    return result_key(parameters, {date: panel.get_digest(date) for date in daterange(start_date, config.end_date, 7)})
+
+def store_result(result, summary, start_date, panel):
+    """
+    Salva nella cache dei risultati il riepilogo ed i valori settimanali del test di una strategia.
+    """
+    result_cache = open_result_cache()
+    if result_cache is None:
+        return
+    entry = {
+        'summary': summary,
+        'dates': list(result.date),
+        'values': {name: list(getattr(result, name)) for name in CHECKPOINT_VALUES}
+    }
+    result_cache.put(get_result_key(result.strategy, start_date, panel), entry)
+
+def load_cached_result(result_cache, strategy, start_date, panel):
+    """
+    Restituisce il riepilogo del test di una strategia dalla cache dei risultati (None se
+    non presente). I file di output mancanti vengono rigenerati dai valori settimanali
+    salvati, senza ripetere la simulazione.
+    """
+    entry = result_cache.get(get_result_key(strategy, start_date, panel))
+    if entry is None:
+        return None
+    if not open_results_store().has_test(get_test_name(strategy, start_date)) or \
+            not all(output_path.exists() for output_path in get_output_paths(strategy, start_date).values()):
+        with profiler.phase('metrics'):
+            result = StrategyTestResult(strategy)
+            result.add_values(entry['dates'], entry['values'])
+            result.end_of_computation()
+        with profiler.phase('export'):
+            export_results(result, start_date)
+    return entry['summary']
+
+def open_results_store():
+    """
+    Restituisce l'archivio dei risultati (nella cartella dei dati).
+    """
+    return ResultsStore(pathlib.Path(config.data_dir, RESULTS_STORE_NAME))
+
+def get_test_name(strategy, start_date):
+    """
+    Restituisce il nome del test di una strategia (nell'archivio dei risultati e nei nomi dei file).
+    """
+    return "s-%s_e-%s_au-%d_f-%.2f_rpw-%d_cn-%d_wc-%d" % (start_date, config.end_date, config.initial_amount_usd, strategy.transaction_fee,
+                                                         strategy.rebalance_period_weeks, strategy.crypto_number, strategy.weight_cap_perc)
+
+def get_suite_name(start_date, transaction_fee):
+    """
+    Restituisce il nome della suite di test di una data di inizio e fee.
+    """
+    return "test_suite_results-s-%s_e-%s_au-%d_f-%.2f" % (start_date, config.end_date, config.initial_amount_usd, transaction_fee)
+
+def get_output_paths(strategy, start_date):
+    """
+    Restituisce i percorsi dei file di output richiesti del test di una strategia: i file
+    JSON delle equity line in USD e BTC ed il file Excel (tipo di output -> percorso).
+    """
+    test_name = get_test_name(strategy, start_date)
+    output_paths = {}
+    if (config.json_output):
+        output_paths['equity_usd'] = pathlib.Path(config.data_dir, "equity-usd_%s.json" % test_name)
+        output_paths['equity_btc'] = pathlib.Path(config.data_dir, "equity-btc_%s.json" % test_name)
+    if (config.excel_output):
+        output_paths['excel'] = pathlib.Path(config.data_dir, "%s.xlsx" % test_name)
+    return output_paths
+
+def export_results(result, start_date):
+    """
+    Salva nell'archivio dei risultati ed esporta sui file richiesti i risultati del test di
+    una strategia. Restituisce i dati di riepilogo del test.
+    """
+    summary = result.get_summary()
+    open_results_store().put_test(get_test_name(result.strategy, start_date), summary, result.snapshots)
+    output_paths = get_output_paths(result.strategy, start_date)
+
+    # Esporto i risultati su JSON
+    if (config.json_output):
+        result.export_equity_line_usd_to_json(output_paths['equity_usd'])
+        result.export_equity_line_btc_to_json(output_paths['equity_btc'])
+
+    # Esporto i risultati su Excel
+    if (config.excel_output):
+        result.export_to_excel(output_paths['excel'])
+
+    return summary
+
+def export_analysis(name, sheets):
+    """
+    Esporta sui file richiesti i risultati di un'analisi (walk-forward, robustezza, ricerca dei
+    parametri): sheets contiene le tabelle dei risultati (nome del foglio -> DataFrame). La prima
+    tabella viene salvata nel file JSON <name>.json e le successive in <name>-<foglio>.json (con
+    il nome del foglio in minuscolo); il file Excel <name>.xlsx contiene un foglio per tabella.
+    """
+    if (config.json_output):
+        for idx, (sheet, data) in enumerate(sheets.items()):
+            json_name = name if idx == 0 else "%s-%s" % (name, sheet.lower())
+            write_json_records(data, pathlib.Path(config.data_dir, "%s.json" % json_name))
+            log(2, "Results saved to json file '%s.json'", json_name)
+
+    if (config.excel_output):
+        with atomic_output_path(pathlib.Path(config.data_dir, "%s.xlsx" % name)) as output_path:
+            writer = pd.ExcelWriter(output_path)
+            for sheet, data in sheets.items():
+                data.to_excel(writer, sheet)
+            writer.save()
+
+def get_admissible_strategies(weights_table):
+    """
+    Restituisce le strategie ammissibili fra tutte le combinazioni di parametri richieste
+    (numero di coin per cap almeno pari al 100%), calcolandone i pesi.
+    """
+    strategies = []
+    for transaction_fee in config.transaction_fees:
+        for crypto_number in config.crypto_number_set:
+            for weight_cap_percentage in config.weight_cap_percentage_set:
+                for rebalance_period_weeks in config.rebalance_period_weeks_set:
+                    strategy = StrategyConfiguration(crypto_number, weight_cap_percentage, rebalance_period_weeks, transaction_fee)
+                    if crypto_number * weight_cap_percentage < 100:
+                        log(1, "Ignoring unadmissible strategy %s", strategy)
+                        continue
+                    with profiler.phase('weights'):
+                        weights_table.get_weights(crypto_number, weight_cap_percentage)
+                    strategies.append(strategy)
+    return strategies
+
+def get_rolling_name(first_start_date, last_start_date):
+    """
+    Restituisce il nome dei file di output dell'analisi walk-forward.
+    """
+    return "rolling_results-s-%s_%s_e-%s_au-%d_w-%d_st-%d" % (first_start_date, last_start_date, config.end_date, config.initial_amount_usd,
+                                                             config.rolling_window_weeks or 0, config.rolling_step_weeks)
+
+def run_rolling_analysis(panel, weights_table):
+    """
+    Analisi walk-forward (opzione --rolling): testa ogni strategia a partire da ogni settimana
+    compresa fra la prima e l'ultima data di inizio (fino alla data finale se è specificata una
+    sola data di inizio), vedi rolling_analysis. Esporta per ogni strategia i valori di ciascuna
+    finestra e la distribuzione di ROI, massimo drawdown e Sharpe ratio fra le date di inizio.
+    """
+    first_start_date = min(config.start_dates)
+    last_start_date = max(config.start_dates) if len(config.start_dates) > 1 else config.end_date
+    windows = rolling_windows(panel.dates, first_start_date, last_start_date, config.end_date, config.rolling_window_weeks, config.rolling_step_weeks)
+    if not windows:
+        log(1, "No windows to analyze between %s and %s", first_start_date, last_start_date)
+        return
+
+    strategies = get_admissible_strategies(weights_table)
+
+    log(1, "Walk-forward analysis of %d strategies over %d windows (%s - %s)", len(strategies), len(windows),
+            panel.dates[windows[0][0]], panel.dates[windows[-1][0]])
+    results, simulated_weeks, total_weeks = simulate_rolling(panel, weights_table, strategies, windows, config.initial_amount_usd, profiler)
+    log(1, "Simulated %d of %d strategy-weeks (%.1f%%)", simulated_weeks, total_weeks, simulated_weeks / max(total_weeks, 1) * PERC_FACTOR)
+
+    with profiler.phase('export'):
+        window_rows = []
+        distribution_rows = []
+        for strategy, values in zip(strategies, results):
+            parameters = {'crypto_number': strategy.crypto_number, 'weight_cap_perc': strategy.weight_cap_perc,
+                          'rebalance_period_weeks': strategy.rebalance_period_weeks, 'transaction_fee': strategy.transaction_fee}
+            for window_idx, (start_idx, end_idx) in enumerate(windows):
+                row = dict(parameters, start_date=panel.dates[start_idx].strftime("%Y-%m-%d"), end_date=panel.dates[end_idx].strftime("%Y-%m-%d"))
+                row.update({name: values[name][window_idx] for name in ROLLING_VALUES})
+                window_rows.append(row)
+            row = dict(parameters, windows=len(windows))
+            for name in ROLLING_VALUES:
+                row.update({"%s_%s" % (name, statistic): value for statistic, value in get_distribution(values[name]).items()})
+            distribution_rows.append(row)
+        window_results = pd.DataFrame(window_rows)
+        distribution = pd.DataFrame(distribution_rows)
+
+        export_analysis(get_rolling_name(first_start_date, last_start_date), {'Distribution': distribution, 'Windows': window_results})
+
+    log(1, distribution)
+
+def get_robustness_name(start_date):
+    """
+    Restituisce il nome dei file di output dell'analisi di robustezza di una data di inizio.
+    """
+    return "robustness_results-s-%s_e-%s_au-%d_p-%d_bw-%d_seed-%d" % (start_date, config.end_date, config.initial_amount_usd,
+                                                                     config.bootstrap_paths, config.bootstrap_block_weeks, config.seed)
+
+def run_robustness_analysis(panel, weights_table):
+    """
+    Analisi di robustezza (opzione --bootstrap): per ogni data di inizio testa insieme tutte le
+    strategie (batch_backtest) e le valuta sui percorsi ricampionati a blocchi dai rendimenti
+    settimanali (vedi robustness_analysis). Esporta per ogni strategia i valori storici e
+    gli intervalli di confidenza di ROI, massimo drawdown e Sharpe ratio.
+    """
+    strategies = get_admissible_strategies(weights_table)
+    runs = [(strategy, start_date) for start_date in config.start_dates for strategy in strategies]
+    log(1, "Testing %d strategies in batch mode", len(runs))
+    batch_results = simulate_batch(panel, weights_table, runs, config.end_date, config.initial_amount_usd, profiler)
+
+    for start_idx, start_date in enumerate(config.start_dates):
+        with profiler.phase('metrics'):
+            results = []
+            for strategy, (dates, values) in zip(strategies, batch_results[start_idx * len(strategies):(start_idx + 1) * len(strategies)]):
+                result = StrategyTestResult(strategy)
+                result.add_values(dates, values)
+                results.append(result)
+            if not results or not results[0].date:
+                log(1, "No weeks to analyze from %s", start_date)
+                continue
+            log(1, "Bootstrap of %d strategies from %s: %d paths of %d weeks (blocks of %d weeks)", len(results), start_date,
+                    config.bootstrap_paths, len(results[0].date), config.bootstrap_block_weeks)
+            historical, paths = simulate_bootstrap(results, config.initial_amount_usd, config.bootstrap_paths, config.bootstrap_block_weeks, config.seed)
+
+        with profiler.phase('export'):
+            rows = []
+            for strategy_idx, strategy in enumerate(strategies):
+                row = {'crypto_number': strategy.crypto_number, 'weight_cap_perc': strategy.weight_cap_perc,
+                       'rebalance_period_weeks': strategy.rebalance_period_weeks, 'transaction_fee': strategy.transaction_fee}
+                for name in ROBUSTNESS_VALUES:
+                    row["%s_historical" % name] = historical[name][strategy_idx]
+                    interval = get_confidence_interval(paths[name][:, strategy_idx], config.confidence_perc)
+                    row.update({"%s_%s" % (name, statistic): value for statistic, value in interval.items()})
+                row['roi_usd_loss_perc'] = np.mean(paths['roi_usd'][:, strategy_idx] < 0) * PERC_FACTOR
+                rows.append(row)
+            robustness_results = pd.DataFrame(rows)
+
+            export_analysis(get_robustness_name(start_date), {'Robustness s-%s_e-%s' % (start_date, config.end_date): robustness_results})
+
+        log(1, robustness_results)
+
+def get_search_name(start_date, transaction_fee):
+    """
+    Restituisce il nome dei file di output della ricerca dei parametri di una data di inizio e fee.
+    """
+    return "search_results-s-%s_e-%s_au-%d_f-%.2f_o-%s_eta-%d" % (start_date, config.end_date, config.initial_amount_usd, transaction_fee,
+                                                                 config.search_objective, config.search_eta)
+
+def run_parameter_search(panel, weights_table):
+    """
+    Ricerca dei parametri (opzione --search): per ogni data di inizio e fee, invece di testare
+    tutte le strategie sull'intero periodo, le testa su periodi via via più lunghi scartando ad
+    ogni turno quelle peggiori (successive halving, vedi parameter_search). Esporta i valori di
+    ogni strategia alla fine del periodo su cui è stata testata e riporta le migliori.
+    """
+    strategies = get_admissible_strategies(weights_table)
+    for start_date in config.start_dates:
+        for transaction_fee in config.transaction_fees:
+            fee_strategies = [strategy for strategy in strategies if strategy.transaction_fee == transaction_fee]
+            candidates, simulated_weeks, total_weeks = search_strategies(panel, weights_table, fee_strategies, start_date, config.end_date,
+                                                                         config.initial_amount_usd, config.search_objective, config.search_eta,
+                                                                         config.search_min_weeks, config.search_top, profiler)
+            log(1, "Search from %s, fee %.2f: %d strategies, simulated %d of %d strategy-weeks (%.1f%%)", start_date, transaction_fee,
+                    len(fee_strategies), simulated_weeks, total_weeks, simulated_weeks / max(total_weeks, 1) * PERC_FACTOR)
+
+            with profiler.phase('export'):
+                rows = []
+                for strategy, candidate in zip(fee_strategies, candidates):
+                    row = {'crypto_number': strategy.crypto_number, 'weight_cap_perc': strategy.weight_cap_perc,
+                           'rebalance_period_weeks': strategy.rebalance_period_weeks, 'transaction_fee': strategy.transaction_fee,
+                           'weeks': candidate['weeks'], 'full_period': candidate['full_period']}
+                    row.update({name: candidate.get(name, np.nan) for name in SEARCH_VALUES})
+                    rows.append(row)
+                # Prima le strategie testate sull'intero periodo, dalla migliore
+                search_results = pd.DataFrame(rows, columns=['crypto_number', 'weight_cap_perc', 'rebalance_period_weeks', 'transaction_fee',
+                                                             'weeks', 'full_period'] + SEARCH_VALUES)
+                search_results = search_results.sort_values(['weeks', config.search_objective], ascending=False, kind='stable', na_position='last')
+                search_results = search_results.reset_index(drop=True)
+
+                export_analysis(get_search_name(start_date, transaction_fee),
+                                {'Search s-%s_e-%s_f-%.2f' % (start_date, config.end_date, transaction_fee): search_results})
+
+            log(1, search_results[search_results.full_period].head(config.search_top))
+
+# Dati condivisi dai processi worker (impostati da init_worker)
+worker_panel = None
+worker_weights_table = None
+
+def init_worker(parent_config, parent_panel, parent_weights_table):
+    """
+    Inizializza un processo worker con la configurazione ed i dati del processo principale.
+    """
+    global config, worker_panel, worker_weights_table
+    config = parent_config
+    profiler.enabled = config.profile
+    worker_panel = parent_panel
+    worker_weights_table = parent_weights_table
+
+def run_strategy_in_worker(strategy, start_date):
+    """
+    Esegue il test di una strategia in un processo worker.
+    Restituisce i dati di riepilogo del test ed i tempi per fase (da sommare a quelli del
+    processo principale).
+    """
+    profiler.reset()
+    summary = run_strategy(strategy, start_date, worker_panel, worker_weights_table)
+    return summary, profiler.get_stats()
+
+def run_strategies_in_parallel(tests, total_tests, panel, weights_table):
+    """
+    Esegue i test delle strategie su un pool di processi.
+    I riepiloghi sono restituiti nello stesso ordine dell'esecuzione seriale.
+    """
+    summaries = [None] * len(tests)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=config.workers, initializer=init_worker,
+                                                initargs=(config, panel, weights_table)) as executor:
+        futures = {}
+        for idx, (test_number, strategy, start_date) in enumerate(tests):
+            futures[executor.submit(run_strategy_in_worker, strategy, start_date)] = (idx, test_number, strategy, start_date)
+        completed = 0
+        for future in concurrent.futures.as_completed(futures):
+            idx, test_number, strategy, start_date = futures[future]
+            summaries[idx], worker_stats = future.result()
+            profiler.merge(worker_stats)
+            completed += 1
+            log(1, "Completed strategy %d of %d (%d/%d done): %s, start date %s, fee %.2f%%", test_number, total_tests, completed, len(tests),
+                    strategy, start_date, strategy.transaction_fee)
+    return summaries
+
+def run_test_suites(panel, weights_table):
+    """
+    Esegue i test di tutte le strategie richieste per ogni data di inizio e fee (leggendo dalla
+    cache i risultati già calcolati) ed esporta i riepiloghi delle suite di test.
+    """
+    total_tests = len(config.start_dates) * len(config.transaction_fees) * len(config.crypto_number_set) * \
+                  len(config.weight_cap_percentage_set) * len(config.rebalance_period_weeks_set)
+    curr_test = 1
+    suites = []
+    tests = []
+    for start_date in config.start_dates:
+        for transaction_fee in config.transaction_fees:
+            suite_tests = []
+            for crypto_number in config.crypto_number_set:
+                for weight_cap_percentage in config.weight_cap_percentage_set:
+                    for rebalance_period_weeks in config.rebalance_period_weeks_set:
+                        strategy = StrategyConfiguration(crypto_number, weight_cap_percentage, rebalance_period_weeks, transaction_fee)
+                        if crypto_number * weight_cap_percentage < 100:
+                            log(1, "Ignoring unadmissible strategy %s", strategy)
+                            curr_test += 1
+                            continue
+                        with profiler.phase('weights'):
+                            weights_table.get_weights(crypto_number, weight_cap_percentage)
+                        suite_tests.append(len(tests))
+                        tests.append((curr_test, strategy, start_date))
+                        curr_test += 1
+            suites.append((start_date, transaction_fee, suite_tests))
+
+    # Creo l'archivio dei risultati prima di avviare i processi worker che vi scrivono
+    results_store = open_results_store()
+    results_store.connect().close()
+
+    # Risultati già calcolati (con gli stessi parametri e dati) letti dalla cache
+    summaries = [None] * len(tests)
+    result_cache = open_result_cache()
+    if result_cache is not None:
+        for idx, (test_number, strategy, start_date) in enumerate(tests):
+            summaries[idx] = load_cached_result(result_cache, strategy, start_date, panel)
+            if summaries[idx] is not None:
+                log(1, "Strategy %d of %d read from result cache: %s", test_number, total_tests, strategy)
+    pending = [idx for idx in range(len(tests)) if summaries[idx] is None]
+    pending_tests = [tests[idx] for idx in pending]
+
+    if not pending_tests:
+        pending_summaries = []
+    elif config.batch:
+        log(1, "Testing %d strategies in batch mode", len(pending_tests))
+        pending_summaries = run_strategies_in_batch(pending_tests, panel, weights_table)
+    elif config.workers > 1:
+        pending_summaries = run_strategies_in_parallel(pending_tests, total_tests, panel, weights_table)
+    else:
+        pending_summaries = []
+        for test_number, strategy, start_date in pending_tests:
+            log(1, "Testing strategy %d of %d: %s", test_number, total_tests, strategy)
+            pending_summaries.append(run_strategy(strategy, start_date, panel, weights_table))
+    for idx, summary in zip(pending, pending_summaries):
+        summaries[idx] = summary
+
+    if result_cache is not None:
+        result_cache.evict()
+        stats = result_cache.get_stats()
+        log(1, "Result cache: %d hits, %d misses, %d bytes read, %d evicted, %d entries (%d bytes)", stats['hits'], stats['misses'],
+                stats['bytes_read'], stats['evictions'], stats['entries'], stats['bytes'])
+
+    # Un riepilogo per ogni combinazione di data di inizio e fee, salvato nell'archivio dei
+    # risultati ed esportato sui file richiesti
+    for start_date, transaction_fee, suite_tests in suites:
+        with profiler.phase('export'):
+            suite_name = get_suite_name(start_date, transaction_fee)
+            results_store.put_suite(suite_name, [get_test_name(tests[test_idx][1], start_date) for test_idx in suite_tests])
+            test_suite_results = results_store.get_suite(suite_name)
+
+            if (config.json_output):
+                write_json_records(test_suite_results, pathlib.Path(config.data_dir, "%s.json" % suite_name))
+                log(2, "Test suite summary saved to json file '%s.json'", suite_name)
+
+            if (config.excel_output):
+                with atomic_output_path(pathlib.Path(config.data_dir, "%s.xlsx" % suite_name)) as output_path:
+                    writer = pd.ExcelWriter(output_path)
+                    test_suite_results.to_excel(writer,'Test suite s-%s_e-%s_au-%d_f-%.2f' % (start_date, config.end_date, config.initial_amount_usd, transaction_fee))
+                    writer.save()
+
+        log (2, test_suite_results)
+
 def parse_options(args):
     """
     Estrae e analizza la configurazione passata come argomento da riga di comando.
@@ -388,17 +1009,20 @@ def parse_options(args):
     # String validation
     pattern = re.compile('[2][0][1][0-9]-[0-1][0-9]-[0-3][0-9]')
 
-    # Data di inizio
+    # Date di inizio
     if args.start_date:
-        start_date = args.start_date
-        start_date_split = start_date.split('-')
-        start_year = int(start_date_split[0])
-        if not re.match(pattern, start_date):
-            raise ValueError("Invalid format for the start_date: "
-                + start_date + ". Should be of the form: yyyy-mm-dd.")
-        config.start_date = datetime.date(start_year,int(start_date_split[1]),int(start_date_split[2]))
+        config.start_dates = []
+        for start_date in args.start_date:
+            start_date_split = start_date.split('-')
+            start_year = int(start_date_split[0])
+            if not re.match(pattern, start_date):
+                raise ValueError("Invalid format for the start_date: "
+                    + start_date + ". Should be of the form: yyyy-mm-dd.")
+            start_date = datetime.date(start_year,int(start_date_split[1]),int(start_date_split[2]))
+            if start_date not in config.start_dates:
+                config.start_dates.append(start_date)
     else:
-        config.start_date = FIRST_DATE
+        config.start_dates = [FIRST_DATE]
 
     # Data finale     
     if args.end_date:
@@ -434,9 +1058,12 @@ def parse_options(args):
     config.crypto_number_set = set(args.crypto_number)
     
     # Commissioni di transazione [Transaction fee]
-    config.transaction_fee = args.transaction_fee
-    if config.transaction_fee < 0 or config.transaction_fee > 100:
-        raise ValueError("Invalid transaction_fee parameter (must be between 0.0 and 100.0)")
+    config.transaction_fees = []
+    for transaction_fee in args.transaction_fee:
+        if transaction_fee < 0 or transaction_fee > 100:
+            raise ValueError("Invalid transaction_fee parameter (must be between 0.0 and 100.0)")
+        if transaction_fee not in config.transaction_fees:
+            config.transaction_fees.append(transaction_fee)
 
     # Verbosity
     if args.verbosity_level < 0 or args.verbosity_level > 4:
@@ -445,14 +1072,72 @@ def parse_options(args):
 
     config.initial_amount_usd = args.initial_amount_usd
     config.json_output = args.json_output
+    config.excel_output = args.excel
     config.interactive = args.interactive
+    config.use_cache = not args.no_cache
+    config.store = pathlib.Path(args.store) if args.store else None
+    if args.max_rank is not None and args.max_rank < 1:
+        raise ValueError("Invalid max_rank parameter (must be >= 1)")
+    config.max_rank = args.max_rank
+
+    # Numero di processi per l'esecuzione in parallelo
+    if args.workers < 1:
+        raise ValueError("Invalid workers parameter (must be >= 1)")
+    config.workers = args.workers
+    config.batch = args.batch
+    config.checkpoint = args.checkpoint
+    config.profile = args.profile
+    profiler.enabled = config.profile
+
+    # Analisi walk-forward
+    if args.rolling_window is not None and args.rolling_window < 1:
+        raise ValueError("Invalid rolling_window parameter (must be >= 1)")
+    if args.rolling_step < 1:
+        raise ValueError("Invalid rolling_step parameter (must be >= 1)")
+    config.rolling = args.rolling
+    config.rolling_window_weeks = args.rolling_window
+    config.rolling_step_weeks = args.rolling_step
+
+    # Analisi di robustezza
+    if args.bootstrap is not None and args.bootstrap < 1:
+        raise ValueError("Invalid bootstrap parameter (must be >= 1)")
+    if args.bootstrap_block < 1:
+        raise ValueError("Invalid bootstrap_block parameter (must be >= 1)")
+    if args.confidence <= 0 or args.confidence >= 100:
+        raise ValueError("Invalid confidence parameter (must be between 0 and 100)")
+    config.bootstrap_paths = args.bootstrap
+    config.bootstrap_block_weeks = args.bootstrap_block
+    config.confidence_perc = args.confidence
+    config.seed = args.seed
+
+    # Ricerca dei parametri
+    if args.search_eta < 2:
+        raise ValueError("Invalid search_eta parameter (must be >= 2)")
+    if args.search_min_weeks < 1:
+        raise ValueError("Invalid search_min_weeks parameter (must be >= 1)")
+    if args.search_top < 1:
+        raise ValueError("Invalid search_top parameter (must be >= 1)")
+    config.search = args.search
+    config.search_objective = args.search_objective
+    config.search_eta = args.search_eta
+    config.search_min_weeks = args.search_min_weeks
+    config.search_top = args.search_top
+
+    if sum([config.rolling, config.bootstrap_paths is not None, config.search]) > 1:
+        raise ValueError("Only one of the rolling, bootstrap and search analyses can be run at a time")
+
+    # Cache dei risultati
+    if args.result_cache_mb < 0:
+        raise ValueError("Invalid result_cache_mb parameter (must be >= 0)")
+    config.result_cache = not args.no_result_cache
+    config.result_cache_mb = args.result_cache_mb
 
 def main(args=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-d",   "--data_dir", help="Specify data directory. If not specified ./data/ is used.")
-    parser.add_argument("-s",   "--start_date", help="Start date from which you wish to test the strategy. For example, "
-                                                "'2017-10-01'.", type=str, required=True)
+    parser.add_argument("-s",   "--start_date", help="Start date(s) from which you wish to test the strategy. For example, "
+                                                "'2017-10-01'.", nargs="+", type=str, required=True)
     parser.add_argument("-e",   "--end_date", help="End date for strategy analysis. If not defined, performs the test until today. Same format as in start_date "
                                                 "'yyyy-mm-dd'.", type=str)
     parser.add_argument("-au",  "--initial_amount_usd", help="Initial available amount in USD", type=int, required=True)
@@ -460,9 +1145,38 @@ def main(args=None):
     parser.add_argument("-rpw", "--rebalance_period_weeks", help="Period in weeks between weights rebalancing", nargs="+", type=int, default=[1])
     parser.add_argument("-cn",  "--crypto_number", help="Number of cryptos composing the index", nargs="+", type=int, required=True)
     parser.add_argument("-wc",  "--weight_cap_percentage", help="Maximum weight (in percentage) of each single crypto", nargs="+", type=int, default=[100])
-    parser.add_argument("-f",   "--transaction_fee", help="Transaction fee (as a percentage of tansated BTC", type=float, default=0.0)
+    parser.add_argument("-f",   "--transaction_fee", help="Transaction fee(s) (as a percentage of tansated BTC", nargs="+", type=float, default=[0.0])
     parser.add_argument("-v",   "--verbosity_level", help="Verbosity level (0=None, 1=Minimal, 2=Info, 3=Debug, 4=Trace", type=int, default=1)
     parser.add_argument("-j",   "--json_output", help="Produces json outputs", action="store_true")
+    parser.add_argument("-x",   "--excel", help="Also exports the results of each strategy and the test suite summaries to Excel files", action="store_true")
+    parser.add_argument("-w",   "--workers", help="Number of worker processes used to test the strategies in parallel", type=int, default=1)
+    parser.add_argument("-b",   "--batch", help="Tests all the strategies together, with vectorized operations on a (strategies x coins) matrix", action="store_true")
+    parser.add_argument("-c",   "--checkpoint", help="Saves the final state of each test and resumes from it in later runs (not used with --batch)", action="store_true")
+    parser.add_argument("--no_cache", help="Reads the CSV files directly, without using the binary snapshot cache", action="store_true")
+    parser.add_argument("--store", help="Reads the snapshots from the consolidated store (SQLite database) instead of the CSV files")
+    parser.add_argument("--max_rank", help="Maximum number of coins (by rank) read from each snapshot. If not specified all the listed coins are read.", type=int)
+    parser.add_argument("--no_result_cache", help="Always tests the strategies, without using the cache of the results of previous runs", action="store_true")
+    parser.add_argument("--profile", help="Measures wall time and memory allocations of each phase (load, weights, join, rebalance, fees, "
+                                          "metrics, export) and prints a summary at the end", action="store_true")
+    parser.add_argument("--rolling", help="Walk-forward analysis: tests each strategy from every week between the first and the last start date "
+                                          "(or the end date, if a single start date is given) in a single batch pass, and reports the distribution "
+                                          "of ROI, max drawdown and Sharpe ratio across the start dates", action="store_true")
+    parser.add_argument("--rolling_window", help="Length in weeks of the windows of the walk-forward analysis. If not specified each window ends at the end date.", type=int)
+    parser.add_argument("--rolling_step", help="Weeks between consecutive start dates of the walk-forward analysis", type=int, default=1)
+    parser.add_argument("--bootstrap", help="Robustness analysis: number of paths obtained by block-bootstrapping the weekly returns of the strategies, "
+                                            "on which ROI, max drawdown and Sharpe ratio confidence intervals are computed", type=int)
+    parser.add_argument("--bootstrap_block", help="Length in weeks of the resampled blocks of the robustness analysis (1 resamples single weeks)", type=int, default=4)
+    parser.add_argument("--confidence", help="Confidence level (in percentage) of the intervals of the robustness analysis", type=float, default=95.0)
+    parser.add_argument("--seed", help="Seed of the random number generator of the robustness analysis", type=int, default=0)
+    parser.add_argument("--search", help="Adaptive parameter search (successive halving): tests all the strategies on the first weeks and "
+                                         "only the best ones on longer periods, up to the whole period", action="store_true")
+    parser.add_argument("--search_objective", help="Indicator used to compare the strategies in the parameter search (higher is better)",
+                        choices=SEARCH_OBJECTIVES, default='amount_usd_sharpe_ratio')
+    parser.add_argument("--search_eta", help="Reduction factor of the parameter search: 1/eta of the strategies passes to each next round, "
+                                             "tested on a period eta times longer", type=int, default=3)
+    parser.add_argument("--search_min_weeks", help="Minimum number of weeks of the first round of the parameter search", type=int, default=13)
+    parser.add_argument("--search_top", help="Number of best strategies tested on the whole period and reported by the parameter search", type=int, default=5)
+    parser.add_argument("--result_cache_mb", help="Maximum size (in MB) of the cache of the results; least recently used results are removed", type=int, default=DEFAULT_MAX_MB)
 
     # assert that args is a list
     if(args is not None):
@@ -471,51 +1185,32 @@ def main(args=None):
         args = parser.parse_args()
     
     parse_options(args)
+    start_time = time.perf_counter()
 
-    total_tests = len(config.crypto_number_set) * len(config.weight_cap_percentage_set) * len(config.rebalance_period_weeks_set)
-    curr_test = 1
-    test_suite_results = pd.DataFrame(columns=['start_date', 'end_date', 'initial_amount_usd', 'crypto_number', 'weight_cap_perc',
-                'rebalance_period_weeks', 'profit_usd', 'profit_btc', 'roi_usd', 'roi_btc', 'tot_transactions_number',
-                'tot_transactions_amount_usd', 'tot_transactions_amount_btc', 
-                'tot_transaction_fees_usd', 'tot_transaction_fees_btc',
-                'max_drawdown', 'max_drawdown_perc', 'amount_usd_sharpe_ratio', 'amount_btc_sharpe_ratio'])
-    for crypto_number in config.crypto_number_set:
-        for weight_cap_percentage in config.weight_cap_percentage_set:
-            for rebalance_period_weeks in config.rebalance_period_weeks_set:
-                strategy = StrategyConfiguration(crypto_number, weight_cap_percentage, rebalance_period_weeks, config.transaction_fee)
-                if crypto_number * weight_cap_percentage < 100:
-                    log(1, "Ignoring unadmissible strategy %s" % strategy)
-                    curr_test += 1
-                    continue
-                log(1, "Testing strategy %d of %d: %s" % (curr_test, total_tests, strategy))
-                curr_test += 1
-                result = test_strategy(strategy)
-
-                # Esporto i risultati su Excel
-                excel_file_name = "s-%s_e-%s_au-%d_f-%.2f_rpw-%d_cn-%d_wc-%d.xlsx" % (config.start_date, config.end_date, config.initial_amount_usd, config.transaction_fee,
-                                                                            rebalance_period_weeks, crypto_number, weight_cap_percentage)
-                excel_file_path = pathlib.Path(config.data_dir, excel_file_name)
-                result.export_to_excel(excel_file_path)
-
-                # Esporto i risultati su JSON
-                if (config.json_output):
-                    json_equity_usd_file_name = "equity-usd_s-%s_e-%s_au-%d_f-%.2f_rpw-%d_cn-%d_wc-%d.json" % (config.start_date, config.end_date, config.initial_amount_usd, config.transaction_fee,
-                                                                            rebalance_period_weeks, crypto_number, weight_cap_percentage)
-                    json_equity_usd_file_path = pathlib.Path(config.data_dir, json_equity_usd_file_name)
-                    result.export_equity_line_usd_to_json(json_equity_usd_file_path)
-                    json_equity_btc_file_name = "equity-btc_s-%s_e-%s_au-%d_f-%.2f_rpw-%d_cn-%d_wc-%d.json" % (config.start_date, config.end_date, config.initial_amount_usd, config.transaction_fee,
-                                                                            rebalance_period_weeks, crypto_number, weight_cap_percentage)
-                    json_equity_btc_file_path = pathlib.Path(config.data_dir, json_equity_btc_file_name)
-                    result.export_equity_line_btc_to_json(json_equity_btc_file_path)
-
-                test_suite_results = test_suite_results.append(result.get_summary(), ignore_index=True)
-
-    test_suite_results_file_path = pathlib.Path(config.data_dir, "test_suite_results-s-%s_e-%s_au-%d_f-%.2f.xlsx" % (config.start_date, config.end_date, config.initial_amount_usd, config.transaction_fee))
-    writer = pd.ExcelWriter(test_suite_results_file_path)
-    test_suite_results.to_excel(writer,'Test suite s-%s_e-%s_au-%d_f-%.2f' % (config.start_date, config.end_date, config.initial_amount_usd, config.transaction_fee))
-    writer.save()
-
-    log (2, test_suite_results)
+    # Carico una sola volta i dati di tutte le settimane analizzate (per tutte le date di inizio)
+    dates = [date for start_date in config.start_dates for date in daterange(start_date, config.end_date, 7)]
+    with profiler.phase('load'):
+        if config.store:
+            panel = SnapshotStore(config.store).get_panel(dates, config.max_rank)
+        else:
+            panel = SnapshotPanel.load(config.data_dir, dates, max_rank=config.max_rank, use_cache=config.use_cache)
+    log(2, "Loaded %d weekly snapshots from '%s'", len(panel.dates), config.store or config.data_dir)
+    # I pesi non dipendono da fee e data di inizio: li calcolo una sola volta, da un indice
+    # delle coin per rank condiviso da tutti i numeri di coin testati
+    with profiler.phase('weights'):
+        weights_table = WeightsTable(panel, max(config.crypto_number_set))
+
+    if config.rolling:
+        run_rolling_analysis(panel, weights_table)
+    elif config.bootstrap_paths is not None:
+        run_robustness_analysis(panel, weights_table)
+    elif config.search:
+        run_parameter_search(panel, weights_table)
+    else:
+        run_test_suites(panel, weights_table)
+
+    if config.profile:
+        print("\n".join(profiler.get_report(time.perf_counter() - start_time, PROFILE_PHASES)))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
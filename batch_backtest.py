@@ -0,0 +1,170 @@
+"""
+batch_backtest.py
+    Backtest simultaneo di più strategie sugli stessi dati.
+    Le quantità detenute da tutte le strategie sono mantenute in un'unica matrice sparsa
+    (strategie x coin detenute) ed ogni settimana viene elaborata con operazioni vettoriali
+    su tutte le strategie insieme, limitate alle righe dello snapshot che possono avere un
+    peso nel paniere ed a quelle delle coin detenute.
+"""
+import numpy as np
+
+from holdings import SparseHoldings
+from metrics import METRICS_VALUES, OnlineMetrics
+from profiling import Profiler
+
+# Valori settimanali calcolati per ogni strategia (stessi valori di StrategyTestResult.add_valueset)
+BATCH_VALUES = ['amount_usd', 'amount_btc', 'transactions', 'transactions_amount_usd', 'transactions_amount_btc',
+                'transaction_fees_usd', 'transaction_fees_btc']
+# Tolleranza relativa (su ogni coin) con cui le quantità detenute da due run sono considerate proporzionali
+PROPORTIONAL_RTOL = 1e-12
+
+
+def simulate_batch(panel, weights_table, runs, end_date, initial_amount_usd, profiler=None, end_dates=None, proportional_to=None):
+    """
+    Esegue il test di un insieme di strategie.
+    runs è una lista di coppie (strategia, data di inizio); la strategia deve fornire gli
+    attributi crypto_number, weight_cap_perc, rebalance_period_weeks e transaction_fee.
+    end_dates, se specificato, contiene la data finale di ciascun run (al posto di end_date).
+    Per ogni run restituisce la coppia (date, valori), dove valori è un dizionario
+    nome -> array con un elemento per ogni settimana analizzata (vedi BATCH_VALUES), compresi
+    gli indicatori aggiornati settimana per settimana per tutti i run insieme (vedi metrics.METRICS_VALUES).
+    Le settimane non presenti nel pannello vengono saltate, come in test_strategy.
+    Se specificato, profiler misura i tempi delle fasi di ogni settimana (join, rebalance,
+    fees, metrics).
+
+    proportional_to, se specificato, contiene per ogni run l'indice di un run di riferimento
+    (-1 se nessuno) con la stessa strategia, i ribilanciamenti nelle stesse settimane ed una
+    data finale non precedente. Tutte le operazioni del test sono omogenee nel capitale: quando
+    le quantità detenute da un run diventano proporzionali a quelle del suo run di riferimento
+    (vedi PROPORTIONAL_RTOL), i valori successivi sono quelli del run di riferimento moltiplicati
+    per il rapporto dei valori in tale settimana. Il run non viene quindi più simulato ed i suoi
+    valori si fermano a tale settimana.
+    """
+    if profiler is None:
+        profiler = Profiler()
+    runs_number = len(runs)
+    weeks_number = len(panel.dates)
+
+    # Settimane del pannello analizzate da ciascun run: le date da quella di inizio a quella
+    # finale con passo settimanale (come daterange), presenti nel pannello
+    days = np.array([date.toordinal() for date in panel.dates], dtype=np.int64)[:, np.newaxis]
+    start_days = np.array([start_date.toordinal() for _, start_date in runs], dtype=np.int64)
+    end_days = np.array([date.toordinal() for date in end_dates] if end_dates is not None else [end_date.toordinal()] * runs_number, dtype=np.int64)
+    active = (days >= start_days) & (days <= end_days) & ((days - start_days) % 7 == 0)
+    # Ultima settimana analizzata da ciascun run (dopo la quale le sue quantità vengono azzerate)
+    last_week = np.where(active.any(axis=0), weeks_number - 1 - np.argmax(active[::-1], axis=0), -1)
+
+    # Pesi: una matrice (settimane x righe iniziali degli snapshot) per ogni combinazione
+    # (numero di coin, cap), completate con pesi nulli fino al numero massimo di righe
+    weight_keys = sorted(set((strategy.crypto_number, strategy.weight_cap_perc) for strategy, _ in runs))
+    key_weights = [weights_table.get_weights(*key) for key in weight_keys]
+    basket_columns = max([key_weight.shape[1] for key_weight in key_weights], default=0)
+    weights = np.zeros((len(key_weights), weeks_number, basket_columns))
+    for key_idx, key_weight in enumerate(key_weights):
+        weights[key_idx, :, :key_weight.shape[1]] = key_weight
+    weight_index = np.array([weight_keys.index((strategy.crypto_number, strategy.weight_cap_perc)) for strategy, _ in runs], dtype=np.int64)
+    rebalance_period = np.array([strategy.rebalance_period_weeks for strategy, _ in runs], dtype=np.int64)
+    fee = np.array([strategy.transaction_fee for strategy, _ in runs], dtype=float)
+    btc_id = panel.get_symbol_id('BTC')
+
+    # Quantità detenuta di ciascuna coin (run x id della coin) e settimane analizzate per run
+    holdings = SparseHoldings(runs_number)
+    run_week_idx = np.zeros(runs_number, dtype=np.int64)
+    # Valori di ogni settimana, solo per i run analizzati nella settimana (settimana, run, nome -> valori)
+    week_values = []
+    metrics = OnlineMetrics(runs_number)
+
+    for week_idx in range(weeks_number):
+        run_idx = np.flatnonzero(active[week_idx])
+        if len(run_idx) == 0:
+            continue
+        first_week = run_week_idx[run_idx] == 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profiler.switch('join')
+            # Righe dello snapshot elaborate: coin dei panieri, coin detenute e BTC
+            week_rows = panel.get_rows(week_idx)
+            positions, coin_rows = panel.get_active_rows(week_idx, basket_columns, np.append(holdings.get_coin_ids(), btc_id))
+            symbol_id = panel.symbol_id[week_rows][positions]
+            priceusd = panel.fields['priceusd'][week_rows][positions]
+            pricebtc = panel.fields['pricebtc'][week_rows][positions]
+            is_btc = symbol_id == btc_id
+            in_basket = positions < basket_columns
+            weight = np.zeros((len(run_idx), len(positions)))
+            weight[:, in_basket] = weights[weight_index[run_idx], week_idx][:, positions[in_basket]]
+            initial_allocation_size = holdings.get(run_idx, coin_rows[:-1], len(positions))
+            # Al primo passo il capitale è interamente allocato su BTC
+            initial_allocation_size[first_week] = np.where(is_btc, initial_amount_usd / priceusd, 0.0)
+            initial_allocation_usd = initial_allocation_size * priceusd
+            initial_allocation_btc = initial_allocation_size * pricebtc
+            total_amount_usd = np.nansum(initial_allocation_usd, axis=1)
+
+            profiler.switch('rebalance')
+
+            req_allocation_usd = weight * total_amount_usd[:, np.newaxis]
+            req_allocation_size = req_allocation_usd / priceusd
+            req_allocation_btc = req_allocation_size * pricebtc
+
+            rebalance = (run_week_idx[run_idx] % rebalance_period[run_idx] == 0)[:, np.newaxis]
+            diff_allocation_size = req_allocation_size - initial_allocation_size
+            traded = rebalance & ((diff_allocation_size < 0) | (diff_allocation_size > 0)) & ~is_btc
+            traded_size = np.abs(diff_allocation_size)
+            transactions_amount_usd = np.nansum(np.where(traded, traded_size * priceusd, 0.0), axis=1)
+            transactions_amount_btc = np.nansum(np.where(traded, traded_size * pricebtc, 0.0), axis=1)
+
+            allocation_usd = np.where(rebalance, req_allocation_usd, initial_allocation_usd)
+            allocation_size = np.where(rebalance, req_allocation_size, initial_allocation_size)
+            allocation_btc = np.where(rebalance, req_allocation_btc, initial_allocation_btc)
+
+            # Commissioni, dedotte dalla prima coin per rank (BTC)
+            profiler.switch('fees')
+            run_fee = np.where(rebalance[:, 0], fee[run_idx], 0.0)
+            transaction_fees_btc = transactions_amount_btc * run_fee / 100
+            transaction_fees_usd = transactions_amount_usd * run_fee / 100
+            allocation_usd[:, 0] -= transaction_fees_usd
+            allocation_size[:, 0] -= transaction_fees_btc
+            allocation_btc[:, 0] -= transaction_fees_btc
+
+            # Le coin non più presenti nello snapshot vengono perse
+            profiler.switch('join')
+            holdings.set(run_idx, symbol_id, allocation_size)
+
+            # Run non più simulati perché proporzionali al proprio run di riferimento
+            if proportional_to is not None:
+                followers = run_idx[proportional_to[run_idx] >= 0]
+                followers = followers[active[week_idx, proportional_to[followers]]]
+                stopped = followers[holdings.get_proportional(followers, proportional_to[followers], PROPORTIONAL_RTOL)]
+                active[week_idx + 1:, stopped] = False
+                last_week[stopped] = week_idx
+            finished = run_idx[last_week[run_idx] == week_idx]
+            if len(finished) > 0:
+                holdings.clear(finished)
+
+        values = {}
+        values['amount_usd'] = np.nansum(allocation_usd, axis=1)
+        values['amount_btc'] = np.nansum(allocation_btc, axis=1)
+        values['transactions'] = np.count_nonzero(traded, axis=1)
+        values['transactions_amount_usd'] = transactions_amount_usd
+        values['transactions_amount_btc'] = transactions_amount_btc
+        values['transaction_fees_usd'] = transaction_fees_usd
+        values['transaction_fees_btc'] = transaction_fees_btc
+        profiler.switch('metrics')
+        values.update(metrics.update(values['amount_usd'], values['amount_btc'], transactions_amount_usd, run_idx))
+        week_values.append((week_idx, run_idx, values))
+        run_week_idx[run_idx] += 1
+        profiler.stop()
+
+    # Valori raggruppati per run (nell'ordine delle settimane)
+    week_idx = np.concatenate([np.full(len(run_idx), week) for week, run_idx, _ in week_values] or [np.zeros(0, dtype=np.int64)])
+    run_idx = np.concatenate([run_idx for _, run_idx, _ in week_values] or [np.zeros(0, dtype=np.int64)])
+    order = np.argsort(run_idx, kind='stable')
+    bounds = np.searchsorted(run_idx[order], np.arange(runs_number + 1))
+    values = {name: np.concatenate([values[name] for _, _, values in week_values] or [np.zeros(0)])[order] for name in BATCH_VALUES + METRICS_VALUES}
+    week_idx = week_idx[order]
+
+    results = []
+    for run in range(runs_number):
+        run_slice = slice(bounds[run], bounds[run + 1])
+        dates = [panel.dates[idx] for idx in week_idx[run_slice]]
+        results.append((dates, {name: values[name][run_slice] for name in BATCH_VALUES + METRICS_VALUES}))
+    return results
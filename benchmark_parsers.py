@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+"""
+benchmark_parsers.py
+    Confronta l'estrazione dei dati dalle pagine HTML degli snapshot con BeautifulSoup
+    sull'intera pagina (implementazione originale di extract_data) con l'estrazione
+    veloce di fetch_cmc_historical_data.extract_data, verificando che i risultati
+    coincidano e riportando le righe elaborate al secondo.
+    Le pagine (file .html o .html.gz, con nome yyyy-mm-dd) vengono lette da una cartella.
+"""
+import argparse
+import datetime
+import gzip
+import pathlib
+import time
+
+from bs4 import BeautifulSoup
+
+import fetch_cmc_historical_data
+from fetch_cmc_historical_data import extract_data, HEADINGS
+
+
+def soup_extract_data(html, date):
+    """
+    Estrazione con BeautifulSoup sull'intera pagina (implementazione originale, usata come riferimento).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find("table", attrs={"class":"summary-table"})
+
+    headings = list(HEADINGS)
+
+    rows = []
+    for row in table.find_all("tr")[1:]:
+        dataset = {}
+        dataset["date"] = date.strftime("%Y-%m-%d")
+        dataset["rank"] = row.find("td").get_text().replace("\n", "").strip()
+        dataset["name"] = row.find("a", attrs = {"class": "currency-name-container"}).get_text().strip()
+        dataset["symbol"] = row.find("td", attrs = {"class": "col-symbol"}).get_text().strip()
+        dataset["marketcapusd"] = row.find("td", attrs = {"class": "market-cap"})['data-usd']
+        if dataset["marketcapusd"].strip() == "?":
+            dataset["marketcapusd"] = "0.0"
+        dataset["priceusd"] = row.find("a", attrs = {"class": "price"})['data-usd']
+        dataset["pricebtc"] = row.find("a", attrs = {"class": "price"})['data-btc']
+        dataset["circulatingsupply"] = row.find("td", attrs = {"class": "circulating-supply"})['data-sort']
+        dataset["volume24h"] = row.find("a", attrs = {"class": "volume"})['data-usd']
+        try:
+            dataset["perf1h"] = row.find("td",
+                attrs = {"class": "percent-change", "data-timespan": "1h"})['data-sort']
+        except:
+            dataset["perf1h"] = ""
+        try:
+            dataset["perf24h"] = row.find("td",
+                attrs = {"class": "percent-change", "data-timespan": "24h"})['data-sort']
+        except:
+            dataset["perf24h"] = ""
+        try:
+            dataset["perf7d"] = row.find("td",
+                attrs = {"class": "percent-change", "data-timespan": "7d"})['data-sort']
+        except:
+            dataset["perf7d"] = ""
+
+        rows.append(dataset)
+
+    return headings, rows
+
+
+def strainer_extract_data(html, date):
+    """
+    Estrazione veloce senza lxml (BeautifulSoup limitato alla tabella con SoupStrainer).
+    """
+    lxml_etree = fetch_cmc_historical_data.lxml_etree
+    fetch_cmc_historical_data.lxml_etree = None
+    try:
+        return extract_data(html, date)
+    finally:
+        fetch_cmc_historical_data.lxml_etree = lxml_etree
+
+
+def read_corpus(pages_dir):
+    """
+    Legge le pagine HTML della cartella specificata. Restituisce la lista di coppie (data, html).
+    """
+    pages = []
+    for page_path in sorted(pathlib.Path(pages_dir).iterdir()):
+        if page_path.name.endswith(".html.gz"):
+            with gzip.open(str(page_path), "rt", encoding="utf-8") as page_file:
+                html = page_file.read()
+        elif page_path.name.endswith(".html"):
+            html = page_path.read_text(encoding="utf-8")
+        else:
+            continue
+        date = datetime.datetime.strptime(page_path.name[:10], "%Y-%m-%d").date()
+        pages.append((date, html))
+    return pages
+
+
+def timed(parser, pages, repeat):
+    """
+    Estrae i dati da tutte le pagine più volte. Restituisce i risultati ed il tempo medio.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [parser(html, date) for date, html in pages]
+    return results, (time.perf_counter() - start) / repeat
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-p",   "--pages_dir", help="Directory containing the saved HTML pages (yyyy-mm-dd.html or yyyy-mm-dd.html.gz)", required=True)
+    parser.add_argument("-r",   "--repeat", help="Number of repetitions of each measure", type=int, default=3)
+
+    # assert that args is a list
+    if(args is not None):
+        args = parser.parse_args(args)
+    else:
+        args = parser.parse_args()
+
+    pages = read_corpus(args.pages_dir)
+    if not pages:
+        raise ValueError("No HTML pages found in %s" % args.pages_dir)
+
+    parsers = [("BeautifulSoup (html.parser, whole page)", soup_extract_data),
+               ("SoupStrainer (summary table only)", strainer_extract_data)]
+    if fetch_cmc_historical_data.lxml_etree is not None:
+        parsers.append(("lxml (single pass per row)", extract_data))
+
+    reference = None
+    reference_time = None
+    print("Pages: %d" % len(pages))
+    for name, function in parsers:
+        results, elapsed = timed(function, pages, args.repeat)
+        rows = sum(len(result[1]) for result in results)
+        if reference is None:
+            reference, reference_time = results, elapsed
+        print("%-42s %10.3f ms %12.0f rows/s (x%.1f)%s" % (name, elapsed * 1000, rows / elapsed, reference_time / elapsed,
+                                                          "" if results == reference else "  RESULTS DIFFER"))
+
+if __name__ == "__main__":
+    main()
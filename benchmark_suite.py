@@ -0,0 +1,215 @@
+#!/usr/bin/python
+
+"""
+benchmark_suite.py
+    Misura i tempi delle operazioni principali del backtest (lettura dei dati, calcolo dei
+    pesi, test di una strategia, esecuzione completa di backtest_strategy.py ed esportazione
+    dei risultati) su dati sintetici di dimensione crescente (generate_synthetic_data.py).
+    I tempi vengono confrontati con quelli di un'esecuzione precedente salvati in un file
+    JSON (baseline), segnalando le regressioni oltre la tolleranza indicata.
+"""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest_strategy
+from backtest_strategy import export_results, StrategyConfiguration, test_strategy
+from commons import atomic_output_path, FIRST_DATE
+from generate_synthetic_data import write_synthetic_data
+from index_weights import WeightsTable
+from market_data import SnapshotPanel
+
+# Versione del formato del file di baseline
+BASELINE_VERSION = 1
+# Nome predefinito del file di baseline (nella cartella dello script)
+BASELINE_FILE_NAME = "benchmark_baseline.json"
+# Dimensioni dei dati sintetici (nome -> settimane, numero iniziale di coin)
+SIZES = {
+    'small': (52, 200),
+    'medium': (260, 500),
+    'large': (520, 1500)
+}
+# Benchmark eseguiti per ogni dimensione (nell'ordine del riepilogo)
+BENCHMARKS = ['load_csv', 'load_cache', 'add_weights_column', 'weights_table', 'test_strategy',
+              'export_json', 'export_excel', 'main_sweep', 'main_sweep_batch']
+# Strategia usata nei benchmark di una singola strategia
+BENCHMARK_STRATEGY = (20, 10, 4, 0.1)
+# Parametri della griglia di strategie di main() (numero di coin, cap, periodi di ribilanciamento)
+SWEEP_ARGS = ['-au', '10000', '-f', '0.1', '-cn', '5', '10', '20', '-wc', '15', '30', '50', '-rpw', '1', '4', '13']
+
+
+def best_time(function, repeat):
+    """
+    Esegue più volte una funzione e restituisce il tempo minimo di esecuzione (in secondi).
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def configure_backtest(data_dir, end_date, json_output=False, excel_output=False):
+    """
+    Imposta la configurazione di backtest_strategy necessaria per eseguire test_strategy
+    ed export_results senza passare da main().
+    """
+    config = backtest_strategy.config
+    config.data_dir = data_dir
+    config.end_date = end_date
+    config.initial_amount_usd = 10000
+    config.verbosity = 0
+    config.interactive = False
+    config.checkpoint = False
+    config.json_output = json_output
+    config.excel_output = excel_output
+    config.profile = False
+
+
+def run_benchmarks(data_dir, dates, repeat):
+    """
+    Esegue i benchmark sui dati della cartella specificata.
+    Restituisce i tempi (nome del benchmark -> secondi).
+    """
+    results = {}
+    start_date, end_date = dates[0], dates[-1]
+    sweep_args = ['-d', str(data_dir), '-s', start_date.strftime("%Y-%m-%d"), '-e', end_date.strftime("%Y-%m-%d"),
+                  '-v', '0', '--no_result_cache'] + SWEEP_ARGS
+
+    results['load_csv'] = best_time(lambda: SnapshotPanel.load(data_dir, dates, use_cache=False), repeat)
+    # La prima lettura costruisce la cache binaria, le successive la leggono
+    panel = SnapshotPanel.load(data_dir, dates)
+    results['load_cache'] = best_time(lambda: SnapshotPanel.load(data_dir, dates), repeat)
+
+    strategy = StrategyConfiguration(*BENCHMARK_STRATEGY)
+    configure_backtest(data_dir, end_date)
+    frames = [panel.get_dataframe(date) for date in panel.dates]
+    results['add_weights_column'] = best_time(lambda: [strategy.add_weights_column(df) for df in frames], repeat)
+    results['weights_table'] = best_time(lambda: WeightsTable(panel).get_weights(strategy.crypto_number, strategy.weight_cap_perc), repeat)
+
+    weights_table = WeightsTable(panel)
+    results['test_strategy'] = best_time(lambda: test_strategy(strategy, start_date, panel, weights_table), repeat)
+
+    result = test_strategy(strategy, start_date, panel, weights_table)
+    configure_backtest(data_dir, end_date, json_output=True)
+    results['export_json'] = best_time(lambda: export_results(result, start_date), repeat)
+    configure_backtest(data_dir, end_date, excel_output=True)
+    results['export_excel'] = best_time(lambda: export_results(result, start_date), repeat)
+
+    results['main_sweep'] = best_time(lambda: backtest_strategy.main(sweep_args), repeat)
+    results['main_sweep_batch'] = best_time(lambda: backtest_strategy.main(sweep_args + ['-b']), repeat)
+    return results
+
+
+def load_baseline(baseline_path):
+    """
+    Legge il file di baseline. Restituisce None se assente o non compatibile.
+    """
+    try:
+        with baseline_path.open() as infile:
+            baseline = json.load(infile)
+    except (OSError, ValueError):
+        return None
+    if baseline.get('version') != BASELINE_VERSION:
+        return None
+    return baseline
+
+
+def save_baseline(baseline_path, results, repeat):
+    """
+    Salva i tempi misurati come nuova baseline (con la descrizione dell'ambiente di esecuzione).
+    """
+    baseline = {
+        'version': BASELINE_VERSION,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                        'platform': platform.platform(), 'processor': platform.processor()},
+        'repeat': repeat,
+        'sizes': {size: {'weeks': SIZES[size][0], 'coins': SIZES[size][1]} for size in results},
+        'results': results
+    }
+    with atomic_output_path(baseline_path) as output_path:
+        with output_path.open('w') as outfile:
+            json.dump(baseline, outfile, indent=2, sort_keys=True)
+
+
+def compare_results(results, baseline, tolerance_perc):
+    """
+    Confronta i tempi misurati con la baseline.
+    Restituisce le righe del riepilogo e l'elenco delle regressioni (dimensione, benchmark, rapporto).
+    """
+    lines = ["%-8s %-20s %12s %12s %8s" % ("size", "benchmark", "time (ms)", "base (ms)", "ratio")]
+    regressions = []
+    for size, size_results in results.items():
+        base_results = baseline['results'].get(size, {}) if baseline else {}
+        for name in BENCHMARKS:
+            seconds = size_results[name]
+            if name not in base_results:
+                lines.append("%-8s %-20s %12.1f %12s %8s" % (size, name, seconds * 1000, "-", "-"))
+                continue
+            ratio = seconds / base_results[name]
+            flag = ""
+            if ratio > 1 + tolerance_perc / 100.0:
+                regressions.append((size, name, ratio))
+                flag = " REGRESSION"
+            lines.append("%-8s %-20s %12.1f %12.1f %7.2fx%s" % (size, name, seconds * 1000, base_results[name] * 1000, ratio, flag))
+    return lines, regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-sz", "--sizes", help="Sizes of the synthetic data (" + ", ".join("%s: %d weeks, %d coins" % ((name,) + size) for name, size in SIZES.items()) + ")",
+                        nargs="+", choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument("-r",  "--repeat", help="Number of repetitions of each measure (the best time is reported)", type=int, default=3)
+    parser.add_argument("-b",  "--baseline", help="Baseline file (JSON). If not specified " + BASELINE_FILE_NAME + " in the directory of this script is used "
+                                                  "(created by running once with --save_baseline).")
+    parser.add_argument("-sb", "--save_baseline", help="Saves the measured times as the new baseline", action="store_true")
+    parser.add_argument("-t",  "--tolerance_perc", help="Slowdown (in percentage) over the baseline reported as a regression", type=float, default=20.0)
+    parser.add_argument("-d",  "--data_dir", help="Directory where the synthetic data are generated (and kept for later runs). "
+                                                  "If not specified a temporary directory is used.")
+
+    # assert that args is a list
+    if(args is not None):
+        args = parser.parse_args(args)
+    else:
+        args = parser.parse_args()
+
+    if args.repeat < 1:
+        raise ValueError("Invalid repeat parameter (must be >= 1)")
+    baseline_path = pathlib.Path(args.baseline) if args.baseline else pathlib.Path(__file__).resolve().parent / BASELINE_FILE_NAME
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root_dir = pathlib.Path(args.data_dir) if args.data_dir else pathlib.Path(temp_dir)
+        for size in args.sizes:
+            weeks, coins = SIZES[size]
+            data_dir = pathlib.Path(root_dir, "%s-%dw-%dc" % (size, weeks, coins))
+            dates = write_synthetic_data(data_dir, FIRST_DATE, weeks, coins)
+            print("Size %s: %d weeks, %d initial coins" % (size, weeks, coins))
+            results[size] = run_benchmarks(data_dir, dates, args.repeat)
+
+    baseline = load_baseline(baseline_path)
+    lines, regressions = compare_results(results, baseline, args.tolerance_perc)
+    print("\n".join(lines))
+    if baseline is None:
+        print("No baseline found in '%s': run once with --save_baseline (-sb) to create it" % baseline_path)
+    elif regressions:
+        print("%d regressions over %.0f%% of the baseline" % (len(regressions), args.tolerance_perc))
+
+    if args.save_baseline:
+        save_baseline(baseline_path, results, args.repeat)
+        print("Baseline saved to '%s'" % baseline_path)
+    return regressions
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
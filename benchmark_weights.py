@@ -0,0 +1,103 @@
+#!/usr/bin/python
+
+"""
+benchmark_weights.py
+    Confronta il calcolo iterativo dei pesi con cap (implementazione originale di
+    StrategyConfiguration.add_weights_column) con il calcolo in forma chiusa di
+    index_weights.capped_weights e con il calcolo dall'indice delle coin per rank
+    (index_weights.BasketIndex), verificando che i risultati coincidano.
+"""
+import argparse
+import datetime
+import pathlib
+import time
+
+import numpy as np
+
+from commons import daterange, FIRST_DATE
+from index_weights import BasketIndex, capped_weights
+from market_data import SnapshotPanel
+
+
+def iterative_capped_weights(data, crypto_number, weight_cap_perc):
+    """
+    Calcolo iterativo dei pesi (implementazione originale, usata come riferimento).
+    """
+    total_market_cap = data.loc[:crypto_number, ['marketcapusd']].astype(float).sum().iloc[0]
+    reweight_factor = 1
+    weights_sum = 0
+    weight_cap = weight_cap_perc / 100.0
+    data['weight'] = 0.0
+    while weights_sum < 0.999999:
+        data.loc[:crypto_number, 'weight'] = data['marketcapusd'].astype(float) / total_market_cap * reweight_factor
+        data.loc[data.weight > weight_cap, 'weight'] = weight_cap
+        weights_sum = data.weight.sum()
+        reweight_factor = reweight_factor * (1 / weights_sum)
+    return data.weight.values
+
+
+def timed(function, repeat):
+    """
+    Esegue più volte una funzione e restituisce il risultato ed il tempo medio di esecuzione.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-d",   "--data_dir", help="Specify data directory. If not specified ./data/ is used.")
+    parser.add_argument("-s",   "--start_date", help="Start date (yyyy-mm-dd). If not specified the first available date is used.", type=str)
+    parser.add_argument("-e",   "--end_date", help="End date (yyyy-mm-dd). If not specified today is used.", type=str)
+    parser.add_argument("-cn",  "--crypto_number", help="Number of cryptos composing the index", type=int, default=20)
+    parser.add_argument("-wc",  "--weight_cap_percentage", help="Maximum weight (in percentage) of each single crypto", nargs="+", type=int, default=[10, 15, 20, 30, 50])
+    parser.add_argument("-r",   "--repeat", help="Number of repetitions of each measure", type=int, default=3)
+
+    # assert that args is a list
+    if(args is not None):
+        args = parser.parse_args(args)
+    else:
+        args = parser.parse_args()
+
+    data_dir = pathlib.Path(args.data_dir) if args.data_dir else pathlib.Path("data")
+    start_date = datetime.datetime.strptime(args.start_date, "%Y-%m-%d").date() if args.start_date else FIRST_DATE
+    end_date = datetime.datetime.strptime(args.end_date, "%Y-%m-%d").date() if args.end_date else datetime.date.today()
+    crypto_number = args.crypto_number
+    caps = [cap for cap in args.weight_cap_percentage if cap * crypto_number >= 100]
+
+    panel = SnapshotPanel.load(data_dir, daterange(start_date, end_date, 7))
+    frames = [panel.get_dataframe(date) for date in panel.dates]
+    market_caps = panel.get_columns('marketcapusd', crypto_number)
+    print("Weeks: %d, crypto number: %d, weight caps: %s" % (len(frames), crypto_number, caps))
+
+    # Implementazione iterativa: una settimana ed un cap alla volta
+    iterative, iterative_time = timed(
+        lambda: np.array([[iterative_capped_weights(df, crypto_number, cap)[:crypto_number] for df in frames] for cap in caps]),
+        args.repeat)
+    # Forma chiusa: una settimana ed un cap alla volta
+    _, closed_form_time = timed(
+        lambda: [[capped_weights(market_caps[week_idx], cap / 100.0) for week_idx in range(len(frames))] for cap in caps],
+        args.repeat)
+    # Forma chiusa: tutte le settimane e tutti i cap in una sola chiamata
+    vectorized, vectorized_time = timed(
+        lambda: capped_weights(market_caps, np.array(caps)[:, np.newaxis] / 100.0),
+        args.repeat)
+    # Indice delle coin per rank: costruzione (una sola volta per tutti i numeri di coin) e pesi di ogni cap
+    index, index_time = timed(lambda: BasketIndex(panel, crypto_number), args.repeat)
+    indexed, indexed_time = timed(
+        lambda: np.array([index.get_weights(crypto_number, cap)[:, :crypto_number] for cap in caps]),
+        args.repeat)
+
+    print("Iterative (pandas, per week and cap):   %10.3f ms" % (iterative_time * 1000))
+    print("Closed form (per week and cap):         %10.3f ms (x%.1f)" % (closed_form_time * 1000, iterative_time / closed_form_time))
+    print("Closed form (vectorized, single call):  %10.3f ms (x%.1f)" % (vectorized_time * 1000, iterative_time / vectorized_time))
+    print("Rank index (build, once per panel):     %10.3f ms" % (index_time * 1000))
+    print("Rank index (all caps, from the index):  %10.3f ms (x%.1f)" % (indexed_time * 1000, iterative_time / indexed_time))
+    print("Max absolute difference: %.3e" % np.nanmax(np.abs(iterative - vectorized)))
+    print("Max absolute difference (rank index): %.3e" % np.nanmax(np.abs(vectorized[..., :indexed.shape[-1]] - indexed)))
+
+if __name__ == "__main__":
+    main()
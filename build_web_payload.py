@@ -0,0 +1,192 @@
+#!/usr/bin/python
+
+"""
+build_web_payload.py
+    Genera dall'archivio dei risultati (results_store.py) i dati per la pagina Web in pochi
+    file JSON compatti e precompressi (gzip), al posto dei file JSON separati di riepiloghi
+    ed equity line:
+    - summaries.json.gz: i riepiloghi di tutte le suite, in formato tabellare (colonne + righe),
+      ed eventualmente le equity line ridotte (a un numero massimo di punti) per i grafici di insieme;
+    - equity-<suite>.json.gz: le date e le equity line complete (USD e BTC) dei test di una suite,
+      nello stesso ordine dei riepiloghi;
+    - index.json: l'elenco dei file, con suite, dimensione ed hash (per la validazione della cache
+      del browser).
+    Le equity line sono salvate come interi (centesimi di USD e satoshi) codificati per
+    differenze: il valore di ogni settimana è la somma cumulata della serie divisa per la scala.
+    La pagina Web carica indice e riepiloghi, ed i file delle equity line solo quando necessari.
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from commons import atomic_output_path, make_dir_if_not_exists
+from results_store import ResultsStore, RESULTS_STORE_NAME, SUMMARY_COLUMNS
+
+# Versione del formato dei file generati
+WEB_PAYLOAD_VERSION = 1
+# Nome della sottocartella (della cartella dei dati) con i file generati
+WEB_PAYLOAD_DIR_NAME = "web"
+# Cifre decimali delle equity line in USD (centesimi) e BTC (satoshi)
+USD_DECIMALS = 2
+BTC_DECIMALS = 8
+# Cifre decimali delle equity line ridotte (per i grafici di insieme)
+OVERVIEW_USD_DECIMALS = 0
+OVERVIEW_BTC_DECIMALS = 4
+# Cifre decimali dei valori dei riepiloghi
+SUMMARY_DECIMALS = 6
+
+
+def to_json_value(value):
+    """
+    Converte un valore del riepilogo (anche di tipo NumPy o data) in un valore JSON
+    (NaN -> null, numeri decimali arrotondati a SUMMARY_DECIMALS cifre).
+    """
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, (np.integer, int)):
+        return int(value)
+    if value is None or not math.isfinite(value):
+        return None
+    return round(float(value), SUMMARY_DECIMALS)
+
+
+def delta_encode(values, decimals):
+    """
+    Converte una serie di valori in interi (valore * 10^decimals) codificati per differenze:
+    il primo elemento è il primo valore, i successivi le differenze dal valore precedente.
+    """
+    values = np.asarray(values, dtype=float)
+    if not np.isfinite(values).all():
+        raise ValueError("Cannot encode a series with missing values")
+    scaled = np.round(values * 10 ** decimals).astype(np.int64)
+    return np.diff(scaled, prepend=0).tolist()
+
+
+def overview_indexes(length, points):
+    """
+    Restituisce le posizioni dei valori della versione ridotta di una serie: al più points
+    posizioni equidistanti, sempre comprese la prima e l'ultima.
+    """
+    if length <= points:
+        return list(range(length))
+    return sorted(set(np.linspace(0, length - 1, points).round().astype(int).tolist()))
+
+
+def write_bundle(output_dir, file_name, content, gzip_level):
+    """
+    Scrive un file JSON compatto compresso con gzip (in modo atomico e riproducibile).
+    Restituisce la voce dell'indice del file.
+    """
+    data = json.dumps(content, separators=(',', ':'), allow_nan=False).encode('utf-8')
+    compressed = gzip.compress(data, compresslevel=gzip_level, mtime=0)
+    with atomic_output_path(pathlib.Path(output_dir, file_name)) as output_path:
+        output_path.write_bytes(compressed)
+    return {'file': file_name, 'bytes': len(compressed), 'raw_bytes': len(data), 'sha1': hashlib.sha1(compressed).hexdigest()}
+
+
+def legacy_payload_bytes(summaries, equity_lines):
+    """
+    Restituisce la dimensione complessiva dei file JSON separati (riepilogo della suite ed
+    equity line dei test) nel formato precedente.
+    """
+    total = len(summaries.to_json(orient='records'))
+    for equity_usd, equity_btc in equity_lines:
+        total += len(pd.Series(equity_usd).to_json(orient='values')) + len(pd.Series(equity_btc).to_json(orient='values'))
+    return total
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-d", "--data_dir", help="Specify data directory. If not specified ./data/ is used.")
+    parser.add_argument("-r", "--results_store", help="Results store (SQLite database). If not specified " + RESULTS_STORE_NAME + " in the data directory is used.")
+    parser.add_argument("-o", "--output_dir", help="Output directory. If not specified the '" + WEB_PAYLOAD_DIR_NAME + "' subdirectory of the data directory is used.")
+    parser.add_argument("-p", "--overview_points", help="Adds to the summaries of each suite the equity lines downsampled to at most this "
+                                                        "number of points, for chart overviews", type=int)
+    parser.add_argument("-z", "--gzip_level", help="Gzip compression level (1-9)", type=int, default=9)
+
+    # assert that args is a list
+    if(args is not None):
+        args = parser.parse_args(args)
+    else:
+        args = parser.parse_args()
+
+    if args.overview_points is not None and args.overview_points < 2:
+        raise ValueError("Invalid overview_points parameter (must be >= 2)")
+    if args.gzip_level < 1 or args.gzip_level > 9:
+        raise ValueError("Invalid gzip_level parameter (must be between 1 and 9)")
+    data_dir = pathlib.Path(args.data_dir) if args.data_dir else pathlib.Path("data")
+    store_path = pathlib.Path(args.results_store) if args.results_store else pathlib.Path(data_dir, RESULTS_STORE_NAME)
+    output_dir = pathlib.Path(args.output_dir) if args.output_dir else pathlib.Path(data_dir, WEB_PAYLOAD_DIR_NAME)
+    if not store_path.exists():
+        raise FileNotFoundError("Results store '%s' not found" % store_path)
+    make_dir_if_not_exists(output_dir)
+
+    results_store = ResultsStore(store_path)
+    columns = [column for column, _ in SUMMARY_COLUMNS]
+    suites = []
+    bundles = []
+    legacy_files = 0
+    legacy_bytes = 0
+    stored_tests = set(results_store.get_test_names())
+    for suite_name in results_store.get_suite_names():
+        suite_tests = [name for name in results_store.get_suite_test_names(suite_name) if name in stored_tests]
+        summaries = results_store.get_summaries(suite_tests)
+        suites.append({'name': suite_name, 'tests': suite_tests,
+                       'rows': [[to_json_value(value) for value in row] for row in summaries.itertuples(index=False)]})
+
+        # Equity line dei test della suite (le date sono comuni a tutti i test)
+        equity_lines = []
+        dates = None
+        for test_name in suite_tests:
+            series = results_store.get_series(test_name, ['date', 'amount_usd', 'amount_btc'])
+            if dates is None:
+                dates = series['date']
+            elif not np.array_equal(dates, series['date']):
+                raise ValueError("Test %s of suite %s has different dates" % (test_name, suite_name))
+            equity_lines.append((series['amount_usd'], series['amount_btc']))
+        dates = [str(date) for date in dates] if dates is not None else []
+        bundle = {
+            'version': WEB_PAYLOAD_VERSION,
+            'suite': suite_name,
+            'tests': suite_tests,
+            'dates': dates,
+            'scales': {'equity_usd': 10 ** USD_DECIMALS, 'equity_btc': 10 ** BTC_DECIMALS},
+            'equity_usd': [delta_encode(equity_usd, USD_DECIMALS) for equity_usd, _ in equity_lines],
+            'equity_btc': [delta_encode(equity_btc, BTC_DECIMALS) for _, equity_btc in equity_lines]
+        }
+        if args.overview_points:
+            indexes = overview_indexes(len(dates), args.overview_points)
+            suites[-1]['overview'] = {
+                'dates': [dates[idx] for idx in indexes],
+                'scales': {'equity_usd': 10 ** OVERVIEW_USD_DECIMALS, 'equity_btc': 10 ** OVERVIEW_BTC_DECIMALS},
+                'equity_usd': [delta_encode(equity_usd[indexes], OVERVIEW_USD_DECIMALS) for equity_usd, _ in equity_lines],
+                'equity_btc': [delta_encode(equity_btc[indexes], OVERVIEW_BTC_DECIMALS) for _, equity_btc in equity_lines]
+            }
+        bundles.append(dict(write_bundle(output_dir, "equity-%s.json.gz" % suite_name, bundle, args.gzip_level),
+                            suite=suite_name, tests=len(suite_tests)))
+
+        legacy_files += 1 + 2 * len(suite_tests)
+        legacy_bytes += legacy_payload_bytes(summaries, equity_lines)
+
+    bundles.insert(0, write_bundle(output_dir, "summaries.json.gz", {'version': WEB_PAYLOAD_VERSION, 'columns': columns, 'suites': suites},
+                                   args.gzip_level))
+    index = {'version': WEB_PAYLOAD_VERSION, 'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+             'bundles': bundles}
+    with atomic_output_path(pathlib.Path(output_dir, "index.json")) as output_path:
+        with output_path.open('w') as index_file:
+            json.dump(index, index_file, separators=(',', ':'), sort_keys=True)
+
+    payload_bytes = sum(bundle['bytes'] for bundle in bundles) + pathlib.Path(output_dir, "index.json").stat().st_size
+    print("Web payload: %d suites, %d tests -> %d files, %d bytes (previously %d files, %d bytes uncompressed)" % (
+        len(suites), sum(len(suite['tests']) for suite in suites), len(bundles) + 1, payload_bytes, legacy_files, legacy_bytes))
+
+if __name__ == "__main__":
+    main()
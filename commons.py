@@ -2,10 +2,10 @@
 commons.py
     Funzioni e dati condivisi fra gli script.
 """
+import contextlib
 import datetime
+import os
 import pathlib
-import pandas as pd
-import numpy as np
 
 # Prima data disponibile
 # CoinMarketCap's historical data only goes back to 28/04/2013
@@ -13,17 +13,6 @@ FIRST_DATE = datetime.date(2013, 4, 28)
 # Percentage factor
 PERC_FACTOR = 100
 
-def annualized_sharpe(returns, N=52):
-    """
-    Calculate the annualised Sharpe ratio of a returns stream 
-    based on a number of trading periods, N. N defaults to 52,
-    which then assumes a stream of weekly returns.
-
-    The function assumes that the returns are the excess of 
-    those compared to a benchmark.
-    """
-    return np.sqrt(N) * returns.expanding().mean() / returns.expanding().std()
-
 def daterange(start_date, end_date, step = 1):
     """
         Generatore di tutte le date comprese in un intervallo specificato.
@@ -41,6 +30,22 @@ def make_dir_if_not_exists(dir):
     if not path.exists():
         path.mkdir(parents=True)
 
+@contextlib.contextmanager
+def atomic_output_path(file_path):
+    """
+        Fornisce un percorso temporaneo (univoco per processo) su cui scrivere un file,
+        rinominato nel percorso definitivo solo a scrittura completata.
+        [Yields a temporary path, atomically renamed to file_path on success.]
+    """
+    file_path = pathlib.Path(file_path)
+    tmp_path = file_path.with_name(".%s.%d.tmp%s" % (file_path.stem, os.getpid(), file_path.suffix))
+    try:
+        yield tmp_path
+        os.replace(str(tmp_path), str(file_path))
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
 class Config(dict):
     def __getattr__(self, key):
         if key in self:
@@ -2,29 +2,36 @@
 
 """
 convert_excel_results_to_json.py
-    Converte i file con i risultati in excel in corrispondenti file json.
+    Genera i file json con i riepiloghi delle suite di test (e, se richiesto, le equity line
+    dei test) dall'archivio dei risultati (results_store.py). Con l'opzione --excel converte
+    invece i file con i risultati in excel (generati dalle versioni precedenti).
 """
 
 import argparse
 import pandas as pd
 import pathlib
 from commons import Config
+from results_store import ResultsStore, RESULTS_STORE_NAME, write_json_records, write_json_values
 
 
 # Configurazione (global)
 config = Config()
 
-def log(level, text):
+def log(level, fmt, *args):
     """
-    Logga una stringa su standard output (se il livello è congruo).
+    Logga un messaggio su standard output (se il livello è congruo), formattandolo solo se stampato.
     """
     if level <= config.verbosity:
-        print (text)
+        print (fmt % args if args else fmt)
 
 def main(args=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-d", "--data_dir", help="Specify data directory. If not specified ./data/ is used.")
+    parser.add_argument("-r", "--results_store", help="Results store (SQLite database). If not specified " + RESULTS_STORE_NAME + " in the data directory is used.")
+    parser.add_argument("-q", "--equity_lines", help="Also generates the json files of the equity lines (USD and BTC) of all the tests in the results store", action="store_true")
+    parser.add_argument("-x", "--excel", help="Converts the test suite results Excel files instead of reading the results store", action="store_true")
+    parser.add_argument("-v", "--verbosity_level", help="Verbosity level (0=None, 1=Minimal, 2=Info)", type=int, default=1)
 
     # assert that args is a list
     if(args is not None):
@@ -34,12 +41,30 @@ def main(args=None):
     
     parse_options(args)
 
-    for file_name in config.data_dir.glob("test_suite_results-*.xlsx"):
-        json_file_name = file_name.with_suffix('.json')
-        print("Converting file '%s' to '%s'" % (file_name, json_file_name))
-        dataframe = pd.read_excel(file_name)
-        dataframe.to_json(path_or_buf=json_file_name, orient='records')
-        
+    if config.excel:
+        for file_name in config.data_dir.glob("test_suite_results-*.xlsx"):
+            json_file_name = file_name.with_suffix('.json')
+            log(1, "Converting file '%s' to '%s'", file_name, json_file_name)
+            dataframe = pd.read_excel(file_name)
+            dataframe.to_json(path_or_buf=json_file_name, orient='records')
+        return
+
+    if not config.results_store.exists():
+        raise FileNotFoundError("Results store '%s' not found" % config.results_store)
+    results_store = ResultsStore(config.results_store)
+    for suite_name in results_store.get_suite_names():
+        json_file_name = pathlib.Path(config.data_dir, "%s.json" % suite_name)
+        log(1, "Writing suite '%s' to '%s'", suite_name, json_file_name)
+        write_json_records(results_store.get_suite(suite_name), json_file_name)
+    if config.equity_lines:
+        test_names = results_store.get_test_names()
+        log(1, "Writing equity lines of %d tests", len(test_names))
+        for test_name in test_names:
+            log(2, "Writing equity lines of test '%s'", test_name)
+            series = results_store.get_series(test_name, ['amount_usd', 'amount_btc'])
+            write_json_values(series['amount_usd'], pathlib.Path(config.data_dir, "equity-usd_%s.json" % test_name))
+            write_json_values(series['amount_btc'], pathlib.Path(config.data_dir, "equity-btc_%s.json" % test_name))
+
 
 def parse_options(args):
     """
@@ -53,5 +78,14 @@ def parse_options(args):
     else:
         config.data_dir = pathlib.Path("data")
 
+    config.results_store = pathlib.Path(args.results_store) if args.results_store else pathlib.Path(config.data_dir, RESULTS_STORE_NAME)
+    config.equity_lines = args.equity_lines
+    config.excel = args.excel
+
+    # Verbosity
+    if args.verbosity_level < 0 or args.verbosity_level > 2:
+        raise ValueError("Invalid verbosity level (must be between 0 and 2)")
+    config.verbosity = args.verbosity_level
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -12,13 +12,30 @@ fetch_cmc_historical_data.py
 import sys
 import re
 import argparse
+import concurrent.futures
 import datetime
+import gzip
+import os
 import pathlib
 
 import requests
-from bs4 import BeautifulSoup
-
-from commons import daterange, make_dir_if_not_exists, FIRST_DATE
+from bs4 import BeautifulSoup, SoupStrainer
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+from commons import atomic_output_path, make_dir_if_not_exists, FIRST_DATE
+from fetch_manifest import cadence_dates, CADENCES, FetchManifest, group_gaps, WEEKDAYS
+from http_fetcher import FetchError, HttpFetcher
+from pipeline import Pipeline
+from snapshot_store import SnapshotStore
+
+# URL di base delle pagine storiche (la data yyyymmdd viene aggiunta in coda)
+DEFAULT_BASE_URL = "https://coinmarketcap.com/historical/"
+# Colonne dei file CSV
+HEADINGS = ["date", "rank", "name", "symbol", "marketcapusd","priceusd",
+    "pricebtc","circulatingsupply","volume24h","perf1h","perf24h","perf7d"]
 
 def parse_options(args):
     """
@@ -58,24 +75,50 @@ def parse_options(args):
     else:
         data_dir = pathlib.Path("data")
 
+    # Download concorrente
+    if args.concurrency < 1:
+        raise ValueError("Invalid concurrency parameter (must be >= 1)")
+    if args.rate is not None and args.rate <= 0:
+        raise ValueError("Invalid rate parameter (must be > 0)")
+    if args.retries < 0:
+        raise ValueError("Invalid retries parameter (must be >= 0)")
+
+    # Archivio delle pagine HTML
+    if args.reparse and not args.archive_dir:
+        raise ValueError("The --reparse option requires the archive directory (--archive_dir)")
+    if args.workers is not None and args.workers < 1:
+        raise ValueError("Invalid workers parameter (must be >= 1)")
+    if args.queue_size < 1:
+        raise ValueError("Invalid queue_size parameter (must be >= 1)")
+
+    # L'output JSON non è ancora implementato (generate_json_file non scrive i dati): il
+    # manifest registrerebbe come scaricate date senza dati
+    if args.json and not args.store:
+        raise ValueError("The --json output is not implemented yet: the snapshots can be saved as CSV files or in the store (--store)")
+
     return start_date, end_date, data_dir
 
 
-def download_html(date):
+def download_html(date, fetcher=None, base_url=DEFAULT_BASE_URL):
     """
     Download HTML MarketCap snapshots from CoinMarketCap.
+    Se specificato, utilizza il client HTTP condiviso (sessione, limite di frequenza e
+    ripetizioni), i cui errori (FetchError, con la causa del fallimento) vengono propagati al
+    chiamante; altrimenti effettua una singola richiesta e restituisce None in caso di errore.
     """
 
     datestring = date.strftime("%Y%m%d")
-    url = "https://coinmarketcap.com/historical/" + datestring + "/"
+    url = base_url.rstrip("/") + "/" + datestring + "/"
+
+    print("Opening url: %s" % url)
+    if fetcher:
+        return fetcher.get_text(url)
 
     try:
-        print("Opening url: %s" % url)
         page = requests.get(url,timeout=10)
         if page.status_code != 200:
-            raise Exception("Failed to load page") 
+            raise Exception("Failed to load page")
         html = page.text
-        #page.close()
 
     except Exception as e:
         print("Error fetching historical snapshot data from " + url)
@@ -84,52 +127,95 @@ def download_html(date):
     return html
 
 
+def find_row_cells(cells):
+    """
+    Individua, fra gli elementi di una riga della tabella, quelli da cui estrarre i dati.
+    cells contiene, per ogni elemento discendente della riga (in ordine di documento), la
+    tupla (tag, classi, attributi, funzione che restituisce il testo dell'elemento).
+    Per ogni dato viene considerato il primo elemento corrispondente, come con row.find().
+    """
+    found = {}
+    for tag, classes, attrs, get_text in cells:
+        if tag == "td":
+            found.setdefault("rank", get_text)
+            if "col-symbol" in classes:
+                found.setdefault("symbol", get_text)
+            if "market-cap" in classes:
+                found.setdefault("market-cap", attrs)
+            if "circulating-supply" in classes:
+                found.setdefault("circulating-supply", attrs)
+            if "percent-change" in classes:
+                found.setdefault("percent-change-%s" % attrs.get("data-timespan"), attrs)
+        elif tag == "a":
+            if "currency-name-container" in classes:
+                found.setdefault("name", get_text)
+            if "price" in classes:
+                found.setdefault("price", attrs)
+            if "volume" in classes:
+                found.setdefault("volume", attrs)
+    return found
+
+
+def build_dataset(found, datestring):
+    """
+    Costruisce i valori di una riga a partire dagli elementi individuati da find_row_cells.
+    """
+    try:
+        dataset = {}
+        dataset["date"] = datestring
+        dataset["rank"] = found["rank"]().replace("\n", "").strip()
+        dataset["name"] = found["name"]().strip()
+        dataset["symbol"] = found["symbol"]().strip()
+        dataset["marketcapusd"] = found["market-cap"]['data-usd']
+        if dataset["marketcapusd"].strip() == "?":
+            dataset["marketcapusd"] = "0.0"
+        dataset["priceusd"] = found["price"]['data-usd']
+        dataset["pricebtc"] = found["price"]['data-btc']
+        dataset["circulatingsupply"] = found["circulating-supply"]['data-sort']
+        dataset["volume24h"] = found["volume"]['data-usd']
+    except KeyError as e:
+        raise ValueError("Missing field %s in snapshot row" % e)
+    for timespan in ["1h", "24h", "7d"]:
+        dataset["perf" + timespan] = found.get("percent-change-" + timespan, {}).get('data-sort', "")
+    return dataset
+
+
 def extract_data(html, date):
     """
     Extract the price history from the HTML.
     The CoinMarketCap historical data page has just one HTML table.
     This table contains the data we want.
     It's got one header row with the column names.
+    Con lxml (se installato) la pagina viene analizzata dal parser HTML di libxml2, altrimenti
+    BeautifulSoup costruisce solo l'albero della tabella (SoupStrainer); ogni riga viene poi
+    letta con una sola scansione dei suoi elementi.
     """
 
-    soup = BeautifulSoup(html, "html.parser")
-    table = soup.find("table", attrs={"class":"summary-table"})
-
     # The first tr contains the field names.
-    headings = ["date", "rank", "name", "symbol", "marketcapusd","priceusd",
-        "pricebtc","circulatingsupply","volume24h","perf1h","perf24h","perf7d"]
+    headings = list(HEADINGS)
+    datestring = date.strftime("%Y-%m-%d")
 
     rows = []
-    for row in table.find_all("tr")[1:]:
-        dataset = {}
-        dataset["date"] = date.strftime("%Y-%m-%d")
-        dataset["rank"] = row.find("td").get_text().replace("\n", "").strip()
-        dataset["name"] = row.find("a", attrs = {"class": "currency-name-container"}).get_text().strip()
-        dataset["symbol"] = row.find("td", attrs = {"class": "col-symbol"}).get_text().strip()
-        dataset["marketcapusd"] = row.find("td", attrs = {"class": "market-cap"})['data-usd']
-        if dataset["marketcapusd"].strip() == "?":
-            dataset["marketcapusd"] = "0.0"
-        dataset["priceusd"] = row.find("a", attrs = {"class": "price"})['data-usd']
-        dataset["pricebtc"] = row.find("a", attrs = {"class": "price"})['data-btc']
-        dataset["circulatingsupply"] = row.find("td", attrs = {"class": "circulating-supply"})['data-sort']
-        dataset["volume24h"] = row.find("a", attrs = {"class": "volume"})['data-usd']
-        try:
-            dataset["perf1h"] = row.find("td",
-                attrs = {"class": "percent-change", "data-timespan": "1h"})['data-sort']
-        except:
-            dataset["perf1h"] = ""
-        try:
-            dataset["perf24h"] = row.find("td",
-                attrs = {"class": "percent-change", "data-timespan": "24h"})['data-sort']
-        except:
-            dataset["perf24h"] = ""
-        try:
-            dataset["perf7d"] = row.find("td",
-                attrs = {"class": "percent-change", "data-timespan": "7d"})['data-sort']
-        except:
-            dataset["perf7d"] = ""
-        
-        rows.append(dataset)
+    if lxml_etree is not None:
+        document = lxml_etree.fromstring(html.encode("utf-8"), lxml_etree.HTMLParser(encoding="utf-8"))
+        table = next((table for table in document.iter("table") if "summary-table" in table.get("class", "").split()), None)
+        if table is None:
+            raise ValueError("Snapshot table not found")
+        for row in list(table.iter("tr"))[1:]:
+            cells = ((element.tag, element.get("class", "").split(), element.attrib, lambda element=element: "".join(element.itertext()))
+                     for element in row.iter("td", "a"))
+            rows.append(build_dataset(find_row_cells(cells), datestring))
+    else:
+        # In fase di parsing l'attributo class non è ancora suddiviso nelle singole classi
+        is_summary_table = lambda value: value is not None and "summary-table" in (value if isinstance(value, list) else value.split())
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("table", attrs={"class": is_summary_table}))
+        table = soup.find("table", attrs={"class":"summary-table"})
+        if table is None:
+            raise ValueError("Snapshot table not found")
+        for row in table.find_all("tr")[1:]:
+            cells = ((element.name, element.get("class", []), element.attrs, element.get_text)
+                     for element in row.find_all(["td", "a"]))
+            rows.append(build_dataset(find_row_cells(cells), datestring))
 
     return headings, rows
 
@@ -155,6 +241,168 @@ def generate_json_file(outfile, headings, rows):
     print("")
 
 
+def snapshot_output_path(data_dir, date, json_output):
+    """
+    Restituisce il percorso del file dello snapshot di una data (CSV o JSON).
+    """
+    return pathlib.Path(data_dir, date.strftime("%Y-%m-%d") + (".json" if json_output else ".csv"))
+
+
+def write_snapshot_file(data_dir, date, json_output, headings, rows):
+    """
+    Salva su file (CSV o JSON, in modo atomico) i dati estratti dallo snapshot di una data.
+    """
+    with atomic_output_path(snapshot_output_path(data_dir, date, json_output)) as output_path:
+        with output_path.open('w') as outfile:
+            if json_output:
+                generate_json_file(outfile, headings, rows)
+            else:
+                generate_csv_file(outfile, headings, rows)
+
+
+def save_snapshot(date, headings, rows, data_dir, json_output, store=None):
+    """
+    Salva i dati estratti dallo snapshot di una data nell'archivio consolidato (se
+    specificato) oppure su file. Restituisce il numero di righe salvate.
+    Se non è stata estratta nessuna riga lo snapshot non viene salvato (ValueError), per cui
+    la data resta mancante.
+    """
+    if not rows:
+        raise ValueError("No data extracted from the snapshot of %s" % date)
+    if store:
+        store.append(date, headings, rows)
+    else:
+        write_snapshot_file(data_dir, date, json_output, headings, rows)
+    return len(rows)
+
+
+def record_snapshot(manifest, date, rows, data_dir, json_output, store=None):
+    """
+    Registra nel manifest il salvataggio dello snapshot di una data.
+    """
+    if store:
+        manifest.set_stored(date, rows)
+    else:
+        manifest.set_fetched(date, snapshot_output_path(data_dir, date, json_output), rows)
+
+
+def archive_page_path(archive_dir, date):
+    """
+    Restituisce il percorso della pagina HTML (compressa) di una data nell'archivio.
+    """
+    return pathlib.Path(archive_dir, date.strftime("%Y-%m-%d") + ".html.gz")
+
+
+def archive_page(archive_dir, date, html):
+    """
+    Salva nell'archivio la pagina HTML di una data, compressa con gzip.
+    """
+    with atomic_output_path(archive_page_path(archive_dir, date)) as output_path:
+        with gzip.open(str(output_path), "wt", encoding="utf-8") as page_file:
+            page_file.write(html)
+
+
+def read_archived_page(archive_dir, date):
+    """
+    Legge dall'archivio la pagina HTML di una data.
+    """
+    with gzip.open(str(archive_page_path(archive_dir, date)), "rt", encoding="utf-8") as page_file:
+        return page_file.read()
+
+
+def get_archived_dates(archive_dir, start_date, end_date):
+    """
+    Restituisce le date (comprese nell'intervallo) delle pagine presenti nell'archivio.
+    """
+    dates = []
+    for page_path in pathlib.Path(archive_dir).glob("*.html.gz"):
+        try:
+            date = datetime.datetime.strptime(page_path.name[:-len(".html.gz")], "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        if start_date <= date <= end_date:
+            dates.append(date)
+    return sorted(dates)
+
+
+def get_failure_cause(error):
+    """
+    Restituisce la causa del fallimento di una data, indipendente dalla data, come coppia
+    (tipo, codice di stato HTTP). Il tipo è 'temporary' per gli errori temporanei persistiti
+    dopo tutte le ripetizioni (codici di stato RETRY_STATUS_CODES, errori della richiesta), per
+    cui conviene ripetere il download più tardi; 'permanent' per gli altri errori di download
+    (ad esempio HTTP status 404); 'error' per gli errori di estrazione o scrittura dei dati.
+    """
+    if isinstance(error, FetchError):
+        return ('temporary' if error.temporary else 'permanent', error.status)
+    return ('error', None)
+
+
+def build_fetch_pipeline(data_dir, fetcher, base_url, json_output, archive_dir, parse_executor, parse_workers, queue_size, store=None):
+    """
+    Costruisce la pipeline di download degli snapshot: download (thread che attendono la
+    rete), estrazione dei dati (su un pool di processi) e scrittura dei file (o dell'archivio
+    consolidato), collegate da code limitate. Il risultato di ogni data è il numero di righe salvate.
+    """
+    def download(date, _):
+        print("Fetching date: %s" % date)
+        # Gli errori del download (FetchError) arrivano alla pipeline con la loro causa
+        html = download_html(date, fetcher, base_url)
+        if not html:
+            raise FetchError("Empty snapshot page of %s" % date)
+        # La pagina viene archiviata prima dell'estrazione, per poterla rielaborare anche se l'estrazione fallisce
+        if archive_dir:
+            archive_page(archive_dir, date, html)
+        return html
+
+    def parse(date, html):
+        return parse_executor.submit(extract_data, html, date).result()
+
+    def write(date, data):
+        headings, rows = data
+        return save_snapshot(date, headings, rows, data_dir, json_output, store)
+
+    pipeline = Pipeline(queue_size)
+    pipeline.add_stage("download", download, fetcher.concurrency)
+    pipeline.add_stage("parse", parse, parse_workers)
+    pipeline.add_stage("write", write, 1)
+    return pipeline
+
+
+def parse_archived_page(archive_dir, date):
+    """
+    Estrae i dati dalla pagina HTML archiviata di una data (senza accesso alla rete).
+    """
+    return extract_data(read_archived_page(archive_dir, date), date)
+
+
+def reparse_archive(start_date, end_date, data_dir, json_output, archive_dir, manifest, workers, store=None):
+    """
+    Rigenera gli snapshot di tutte le pagine archiviate nell'intervallo: l'estrazione dei
+    dati avviene su un pool di processi, il salvataggio nel processo principale.
+    Restituisce le date rigenerate e quelle per cui si è verificato un errore.
+    """
+    dates = get_archived_dates(archive_dir, start_date, end_date)
+    print("%d archived pages to reparse" % len(dates))
+    reparsed = []
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(parse_archived_page, archive_dir, date): date for date in dates}
+        for future in concurrent.futures.as_completed(futures):
+            date = futures[future]
+            try:
+                headings, rows = future.result()
+                saved_rows = save_snapshot(date, headings, rows, data_dir, json_output, store)
+            except Exception as e:
+                print("Error reparsing date %s: %s" % (date, e))
+                manifest.set_failed(date, e)
+                failed.append(date)
+                continue
+            record_snapshot(manifest, date, saved_rows, data_dir, json_output, store)
+            reparsed.append(date)
+    return reparsed, failed
+
+
 def main(args=None):
     parser = argparse.ArgumentParser()
 
@@ -165,6 +413,25 @@ def main(args=None):
                                                 "data until today. Same format as in start_date "
                                                 "'yyyy-mm-dd'.", type=str)
     parser.add_argument("--json", help="If present, produces json files instead of a csv", action="store_true")
+    parser.add_argument("-c", "--concurrency", help="Maximum number of pages downloaded at the same time", type=int, default=4)
+    parser.add_argument("-r", "--rate", help="Maximum number of requests per second. If not specified there is no limit.", type=float)
+    parser.add_argument("--retries", help="Number of retries of a failed request (with exponential backoff)", type=int, default=3)
+    parser.add_argument("--backoff", help="Wait (in seconds) before the first retry, doubled at each retry", type=float, default=1.0)
+    parser.add_argument("--timeout", help="Timeout (in seconds) of each request", type=float, default=10)
+    parser.add_argument("--base_url", help="Base URL of the historical snapshots. If not specified " + DEFAULT_BASE_URL + " is used.",
+                        default=DEFAULT_BASE_URL)
+    parser.add_argument("--cadence", help="Dates to retrieve: every day or one day per week (the day specified by --weekday)",
+                        choices=CADENCES, default='weekly')
+    parser.add_argument("--weekday", help="Day of the week of the weekly snapshots (default sunday, as used by the backtest)",
+                        choices=WEEKDAYS, default='sunday')
+    parser.add_argument("--refetch", help="Downloads again also the snapshots already available and valid", action="store_true")
+    parser.add_argument("-a", "--archive_dir", help="Directory where the downloaded HTML pages are stored (gzip compressed)")
+    parser.add_argument("--reparse", help="Rebuilds the snapshot files from the pages stored in the archive directory, "
+                                          "without downloading", action="store_true")
+    parser.add_argument("--store", help="Appends the snapshots to the consolidated store (SQLite database) instead of writing a file per date")
+    parser.add_argument("-w", "--workers", help="Number of worker processes used to parse the pages (both when downloading and with --reparse). "
+                                                "If not specified all the CPUs are used.", type=int)
+    parser.add_argument("-q", "--queue_size", help="Maximum number of pages waiting between two stages of the download pipeline", type=int, default=8)
 
     # assert that args is a list
     if(args is not None):
@@ -174,19 +441,67 @@ def main(args=None):
     
     start_date, end_date, data_dir = parse_options(args)
     make_dir_if_not_exists(data_dir)
+    if args.archive_dir:
+        make_dir_if_not_exists(args.archive_dir)
+    store = SnapshotStore(args.store) if args.store else None
 
-    for date in daterange(start_date, end_date):
-        print("Fetching date: %s" % date)
-        html = download_html(date)
-        if html:
-            headings, rows = extract_data(html, date)
-            basefilename = date.strftime("%Y-%m-%d")
-            if args.json:
-                with pathlib.Path(data_dir, basefilename + ".json").open('w') as outfile:
-                    generate_json_file(outfile, headings, rows)
+    # Rielaborazione delle pagine archiviate
+    if args.reparse:
+        manifest = FetchManifest(data_dir).load()
+        try:
+            reparsed, failed = reparse_archive(start_date, end_date, data_dir, args.json, args.archive_dir, manifest,
+                                               args.workers or os.cpu_count(), store)
+        finally:
+            manifest.save()
+        print("Reparsed %d snapshots, %d failed" % (len(reparsed), len(failed)))
+        return
+
+    # Scarico solo le date (secondo la cadenza) per cui non è disponibile un file valido (o
+    # che non sono presenti nell'archivio consolidato)
+    manifest = FetchManifest(data_dir).load()
+    dates = cadence_dates(start_date, end_date, args.cadence, args.weekday)
+    if store:
+        stored_dates = set(store.get_dates(start_date, end_date))
+        missing = [date for date in dates if args.refetch or date not in stored_dates]
+    else:
+        missing = [date for date in dates
+                   if args.refetch or not manifest.is_valid(date, snapshot_output_path(data_dir, date, args.json), HEADINGS)]
+    print("%d dates in period, %d already available, %d to fetch" % (len(dates), len(dates) - len(missing), len(missing)))
+
+    fetcher = HttpFetcher(concurrency=args.concurrency, rate=args.rate, retries=args.retries, backoff=args.backoff,
+                          timeout=args.timeout)
+    parse_workers = args.workers or os.cpu_count()
+    parse_executor = concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers)
+    pipeline = build_fetch_pipeline(data_dir, fetcher, args.base_url, args.json, args.archive_dir, parse_executor, parse_workers,
+                                    args.queue_size, store)
+    fetched = 0
+    failed = []
+    causes = {}
+    try:
+        for date, result in pipeline.run(missing):
+            if isinstance(result, Exception):
+                print("Error processing date %s: %s" % (date, result))
+                manifest.set_failed(date, result)
+                failed.append(date)
+                causes[date] = get_failure_cause(result)
             else:
-                with pathlib.Path(data_dir, basefilename + ".csv").open('w') as outfile:
-                    generate_csv_file(outfile, headings, rows)
+                record_snapshot(manifest, date, result, data_dir, args.json, store)
+                fetched += 1
+    finally:
+        parse_executor.shutdown()
+        fetcher.close()
+        manifest.save()
+    for line in pipeline.get_report():
+        print(line)
+
+    # Lacune nei dati (date ancora mancanti, raggruppate in intervalli con la stessa causa)
+    print("Fetched %d snapshots, %d failed" % (fetched, len(failed)))
+    for first_date, last_date in group_gaps(failed, 1 if args.cadence == 'daily' else 7, causes):
+        count = len(cadence_dates(first_date, last_date, args.cadence, args.weekday))
+        print("Gap: %s - %s (%d dates, %s): %s" % (first_date, last_date, count, causes[last_date][0], manifest.get_error(last_date)))
+    temporary = [date for date in failed if causes[date][0] == 'temporary']
+    if temporary:
+        print("%d dates failed with temporary errors and are worth fetching again" % len(temporary))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
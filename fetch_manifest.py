@@ -0,0 +1,154 @@
+"""
+fetch_manifest.py
+    Registro (manifest) degli snapshot scaricati: per ogni data indica se il file è presente
+    e valido (dimensione, data di modifica e numero di righe al momento della verifica) oppure
+    l'ultimo errore di download, in modo da scaricare solo le date mancanti e riportare le
+    lacune (gap) nei dati.
+"""
+import datetime
+import json
+import pathlib
+
+from commons import atomic_output_path, daterange, make_dir_if_not_exists
+from market_data import CACHE_DIR_NAME
+
+# Nome del file del manifest (nella cartella della cache dei dati)
+FETCH_MANIFEST_NAME = "fetch_manifest.json"
+# Versione del formato del manifest
+FETCH_MANIFEST_VERSION = 1
+# Cadenze di download supportate
+CADENCES = ['daily', 'weekly']
+# Giorni della settimana (per l'ancoraggio della cadenza settimanale)
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def cadence_dates(start_date, end_date, cadence='weekly', weekday='sunday'):
+    """
+    Restituisce le date comprese nell'intervallo secondo la cadenza specificata: tutti i
+    giorni (daily) oppure un giorno alla settimana (weekly), nel giorno indicato.
+    """
+    if cadence == 'daily':
+        return list(daterange(start_date, end_date))
+    first_date = start_date + datetime.timedelta((WEEKDAYS.index(weekday) - start_date.weekday()) % 7)
+    if first_date > end_date:
+        return []
+    return list(daterange(first_date, end_date, 7))
+
+
+def group_gaps(dates, cadence_days, causes=None):
+    """
+    Raggruppa le date mancanti in intervalli consecutivi (secondo la cadenza). Se specificato,
+    causes contiene la causa del fallimento di ciascuna data (data -> causa) e le date
+    consecutive con cause diverse vengono separate in intervalli distinti.
+    Restituisce una lista di coppie (prima data, ultima data).
+    """
+    causes = causes or {}
+    gaps = []
+    for date in sorted(dates):
+        if gaps and (date - gaps[-1][1]).days == cadence_days and causes.get(date) == causes.get(gaps[-1][1]):
+            gaps[-1] = (gaps[-1][0], date)
+        else:
+            gaps.append((date, date))
+    return gaps
+
+
+def count_csv_rows(file_path, headings, date):
+    """
+    Verifica che un file CSV contenga l'intestazione attesa ed almeno una riga della data
+    specificata. Restituisce il numero di righe di dati (ValueError se il file non è valido).
+    """
+    with open(str(file_path)) as csv_file:
+        lines = csv_file.read().splitlines()
+    if not lines or lines[0] != ";".join(headings):
+        raise ValueError("Invalid header in file %s" % file_path)
+    rows = [line for line in lines[1:] if line]
+    if not rows or not rows[0].startswith(date.strftime("%Y-%m-%d") + ";"):
+        raise ValueError("No data rows in file %s" % file_path)
+    return len(rows)
+
+
+class FetchManifest:
+    """
+    Stato degli snapshot scaricati in una cartella dei dati (data -> voce).
+    [Manifest of downloaded snapshots.]
+    """
+
+    def __init__(self, data_dir, cache_dir=None):
+        self.data_dir = pathlib.Path(data_dir)
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else pathlib.Path(data_dir, CACHE_DIR_NAME)
+        self.entries = {}
+
+    def get_manifest_path(self):
+        return pathlib.Path(self.cache_dir, FETCH_MANIFEST_NAME)
+
+    def load(self):
+        """
+        Legge il manifest (un manifest mancante o di versione diversa viene ignorato).
+        """
+        try:
+            with self.get_manifest_path().open() as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get('version') == FETCH_MANIFEST_VERSION:
+                self.entries = manifest['entries']
+        except (OSError, ValueError, KeyError):
+            self.entries = {}
+        return self
+
+    def save(self):
+        """
+        Scrive il manifest (in modo atomico).
+        """
+        make_dir_if_not_exists(self.cache_dir)
+        with atomic_output_path(self.get_manifest_path()) as output_path:
+            with output_path.open('w') as manifest_file:
+                json.dump({'version': FETCH_MANIFEST_VERSION, 'entries': self.entries}, manifest_file, indent=1, sort_keys=True)
+
+    def is_valid(self, date, file_path, headings):
+        """
+        Verifica se il file dello snapshot della data specificata è presente e valido.
+        Un file già verificato non viene riletto se dimensione e data di modifica non sono
+        cambiate; altrimenti viene verificato (vedi count_csv_rows) ed il manifest aggiornato.
+        """
+        key = date.strftime("%Y-%m-%d")
+        try:
+            stat = pathlib.Path(file_path).stat()
+        except FileNotFoundError:
+            self.entries.pop(key, None)
+            return False
+        entry = self.entries.get(key, {})
+        if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return True
+        try:
+            rows = count_csv_rows(file_path, headings, date)
+        except (OSError, ValueError) as e:
+            self.set_failed(date, e)
+            return False
+        self.entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': rows}
+        return True
+
+    def set_fetched(self, date, file_path, rows):
+        """
+        Registra il download di uno snapshot.
+        """
+        stat = pathlib.Path(file_path).stat()
+        self.entries[date.strftime("%Y-%m-%d")] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': rows}
+
+    def set_stored(self, date, rows):
+        """
+        Registra il salvataggio di uno snapshot nell'archivio consolidato.
+        """
+        self.entries[date.strftime("%Y-%m-%d")] = {'rows': rows, 'store': True}
+
+    def set_failed(self, date, error):
+        """
+        Registra il fallimento del download (o della verifica) di uno snapshot.
+        """
+        key = date.strftime("%Y-%m-%d")
+        failures = self.entries.get(key, {}).get('failures', 0)
+        self.entries[key] = {'error': str(error), 'failures': failures + 1}
+
+    def get_error(self, date):
+        """
+        Restituisce l'ultimo errore registrato per la data (None se non presente).
+        """
+        return self.entries.get(date.strftime("%Y-%m-%d"), {}).get('error')
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+
+"""
+generate_synthetic_data.py
+    Genera snapshot settimanali sintetici nello stesso formato CSV prodotto da
+    fetch_cmc_historical_data.py, per test e benchmark su dati di dimensione arbitraria.
+    Le market cap seguono una passeggiata aleatoria logaritmica (la cui volatilità determina
+    il ricambio nei rank), con nuove coin quotate e coin rimosse ogni settimana; BTC è sempre
+    al primo rank, come nei dati reali. A parità di parametri e seed i file generati sono identici.
+"""
+import argparse
+import datetime
+import math
+import pathlib
+
+import numpy as np
+
+from commons import make_dir_if_not_exists, FIRST_DATE
+from fetch_cmc_historical_data import HEADINGS, write_snapshot_file
+
+# Market cap iniziale di BTC (USD) e offerta circolante iniziale delle coin
+INITIAL_BTC_MARKET_CAP = 1e10
+INITIAL_SUPPLY = 1e7
+
+
+def format_value(value):
+    """
+    Converte un valore numerico nella stringa scritta nel file CSV.
+    """
+    return repr(float(value))
+
+
+def generate_snapshots(start_date, weeks, coins, rows=None, churn=0.15, listings=2.0, delisting_perc=0.5, symbol_reuse_perc=5.0, seed=0):
+    """
+    Genera gli snapshot sintetici di weeks settimane a partire da start_date.
+    coins è il numero iniziale di coin; rows il numero massimo di coin (per rank) di ogni
+    snapshot (tutte se non specificato); churn la volatilità settimanale del logaritmo delle
+    market cap; listings il numero medio di nuove coin quotate ogni settimana; delisting_perc
+    la probabilità (in percentuale) che una coin venga rimossa in una settimana;
+    symbol_reuse_perc la probabilità che una nuova coin riutilizzi il simbolo di una coin rimossa
+    (con nome diverso, come avviene nei dati reali).
+    Restituisce un generatore di coppie (data, righe), con le righe nel formato di extract_data
+    (dizionari colonna -> stringa).
+    """
+    rng = np.random.default_rng(seed)
+    names = ["Bitcoin"] + ["Synthetic Coin %d" % idx for idx in range(1, coins)]
+    symbols = ["BTC"] + ["SYN%d" % idx for idx in range(1, coins)]
+    # Market cap iniziali decrescenti con il rank (legge di potenza), BTC sempre al primo posto
+    log_cap = math.log(INITIAL_BTC_MARKET_CAP) - 1.3 * np.log(np.arange(1, coins + 1)) + rng.normal(0.0, 0.3, coins)
+    log_cap[0] = math.log(INITIAL_BTC_MARKET_CAP)
+    supply = INITIAL_SUPPLY * rng.uniform(0.1, 10.0, coins)
+    supply[0] = INITIAL_SUPPLY
+    alive = np.ones(coins, dtype=bool)
+    previous_price = np.full(coins, np.nan)
+
+    for week_idx in range(weeks):
+        date = start_date + datetime.timedelta(weeks=week_idx)
+        if week_idx > 0:
+            # Passeggiata aleatoria delle market cap ed emissione di nuove unità
+            volatility = np.full(len(log_cap), churn)
+            volatility[0] = churn / 2
+            log_cap += rng.normal(0.002, 1.0, len(log_cap)) * volatility
+            supply *= 1 + np.abs(rng.normal(0.0, 0.002, len(supply)))
+
+            # Coin rimosse (mai BTC)
+            delisted = alive & (rng.uniform(0.0, 100.0, len(alive)) < delisting_perc)
+            delisted[0] = False
+            alive &= ~delisted
+
+            # Nuove coin, con market cap tra le più basse
+            new_coins = rng.poisson(listings)
+            if new_coins > 0:
+                floor = log_cap[alive].min()
+                dead_symbols = [symbols[idx] for idx in np.flatnonzero(~alive)]
+                for _ in range(new_coins):
+                    idx = len(names)
+                    names.append("Synthetic Coin %d" % idx)
+                    if dead_symbols and rng.uniform(0.0, 100.0) < symbol_reuse_perc:
+                        symbols.append(dead_symbols[rng.integers(len(dead_symbols))])
+                    else:
+                        symbols.append("SYN%d" % idx)
+                log_cap = np.concatenate([log_cap, floor + rng.uniform(0.0, 3.0, new_coins)])
+                supply = np.concatenate([supply, INITIAL_SUPPLY * rng.uniform(0.1, 10.0, new_coins)])
+                alive = np.concatenate([alive, np.ones(new_coins, dtype=bool)])
+                previous_price = np.concatenate([previous_price, np.full(new_coins, np.nan)])
+
+        market_cap = np.exp(log_cap)
+        price = market_cap / supply
+        btc_price = price[0]
+        # Ordine per market cap decrescente, con BTC al primo rank
+        order = np.flatnonzero(alive)
+        order = order[np.argsort(-market_cap[order], kind='stable')]
+        order = np.concatenate([[0], order[order != 0]])
+        if rows is not None:
+            order = order[:rows]
+        volume = market_cap * rng.uniform(0.01, 0.1, len(market_cap))
+        perf1h = rng.normal(0.0, 1.0, len(market_cap))
+        perf24h = rng.normal(0.0, 4.0, len(market_cap))
+
+        datestring = date.strftime("%Y-%m-%d")
+        snapshot_rows = []
+        for rank, idx in enumerate(order, 1):
+            snapshot_rows.append({
+                "date": datestring,
+                "rank": str(rank),
+                "name": names[idx],
+                "symbol": symbols[idx],
+                "marketcapusd": format_value(market_cap[idx]),
+                "priceusd": format_value(price[idx]),
+                "pricebtc": format_value(price[idx] / btc_price),
+                "circulatingsupply": format_value(supply[idx]),
+                "volume24h": format_value(volume[idx]),
+                "perf1h": "%.2f" % perf1h[idx],
+                "perf24h": "%.2f" % perf24h[idx],
+                "perf7d": "%.2f" % ((price[idx] / previous_price[idx] - 1) * 100) if np.isfinite(previous_price[idx]) else ""
+            })
+        previous_price = np.where(alive, price, np.nan)
+        yield date, snapshot_rows
+
+
+def write_synthetic_data(data_dir, start_date, weeks, coins, **kwargs):
+    """
+    Genera gli snapshot sintetici (vedi generate_snapshots) e li salva come file CSV nella
+    cartella specificata. Restituisce le date generate.
+    """
+    make_dir_if_not_exists(data_dir)
+    dates = []
+    for date, rows in generate_snapshots(start_date, weeks, coins, **kwargs):
+        write_snapshot_file(data_dir, date, False, HEADINGS, rows)
+        dates.append(date)
+    return dates
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-d",  "--data_dir", help="Output directory of the synthetic CSV files", required=True)
+    parser.add_argument("-s",  "--start_date", help="First date (yyyy-mm-dd). If not specified " + FIRST_DATE.strftime("%Y-%m-%d") + " is used.", type=str)
+    parser.add_argument("-w",  "--weeks", help="Number of weekly snapshots", type=int, default=260)
+    parser.add_argument("-n",  "--coins", help="Initial number of coins", type=int, default=200)
+    parser.add_argument("-r",  "--rows", help="Maximum number of coins (by rank) of each snapshot. If not specified all the listed coins are written.", type=int)
+    parser.add_argument("-c",  "--churn", help="Weekly volatility of the logarithm of the market caps (higher values reshuffle the ranks more)", type=float, default=0.15)
+    parser.add_argument("-l",  "--listings", help="Mean number of new coins listed each week", type=float, default=2.0)
+    parser.add_argument("-dl", "--delisting_perc", help="Weekly probability (in percentage) that a coin is delisted", type=float, default=0.5)
+    parser.add_argument("-sr", "--symbol_reuse_perc", help="Probability (in percentage) that a new coin reuses the symbol of a delisted one", type=float, default=5.0)
+    parser.add_argument("--seed", help="Seed of the random number generator", type=int, default=0)
+
+    # assert that args is a list
+    if(args is not None):
+        args = parser.parse_args(args)
+    else:
+        args = parser.parse_args()
+
+    if args.weeks < 1:
+        raise ValueError("Invalid weeks parameter (must be >= 1)")
+    if args.coins < 1:
+        raise ValueError("Invalid coins parameter (must be >= 1)")
+    if args.rows is not None and args.rows < 1:
+        raise ValueError("Invalid rows parameter (must be >= 1)")
+    start_date = datetime.datetime.strptime(args.start_date, "%Y-%m-%d").date() if args.start_date else FIRST_DATE
+
+    dates = write_synthetic_data(pathlib.Path(args.data_dir), start_date, args.weeks, args.coins, rows=args.rows, churn=args.churn,
+                                 listings=args.listings, delisting_perc=args.delisting_perc, symbol_reuse_perc=args.symbol_reuse_perc,
+                                 seed=args.seed)
+    print("Generated %d snapshots (%s - %s) in '%s'" % (len(dates), dates[0], dates[-1], args.data_dir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+holdings.py
+    Quantità detenute di ciascuna coin in uno o più run (ad esempio le strategie di un batch),
+    in forma sparsa: vengono memorizzate solo le coin detenute da almeno un run, per cui la
+    memoria ed il tempo di aggiornamento non dipendono dal numero complessivo di coin.
+"""
+import numpy as np
+
+
+class SparseHoldings:
+    """
+    Quantità detenute per run e coin: id delle coin detenute da almeno un run e matrice
+    (run x coin detenute) delle quantità. Le colonne delle coin non più detenute da nessun
+    run restano libere (id -1) e vengono riutilizzate per le nuove coin.
+    [Sparse per-run coin holdings keyed by interned coin id.]
+    """
+
+    def __init__(self, runs_number=1):
+        self.coin_ids = np.zeros(0, dtype=np.int64)
+        self.sizes = np.zeros((runs_number, 0))
+        # Numero di run che detengono la coin di ciascuna colonna
+        self.holders = np.zeros(0, dtype=np.int64)
+
+    def get_coin_ids(self):
+        """
+        Restituisce gli id delle coin detenute da almeno un run, uno per colonna della
+        matrice delle quantità (-1 per le colonne libere).
+        """
+        return self.coin_ids
+
+    def get(self, run_idx, coin_rows, rows_number):
+        """
+        Restituisce la matrice (run specificati x righe dello snapshot) delle quantità
+        detenute. coin_rows contiene la riga di ciascuna coin detenuta, nell'ordine di
+        get_coin_ids (-1 per le coin non presenti nello snapshot, che vengono perse).
+        """
+        sizes = np.zeros((len(run_idx), rows_number))
+        found = coin_rows >= 0
+        sizes[:, coin_rows[found]] = self.sizes[np.asarray(run_idx)[:, np.newaxis], np.flatnonzero(found)]
+        return sizes
+
+    def set(self, run_idx, coin_ids, sizes):
+        """
+        Sostituisce le quantità detenute dai run specificati con quelle indicate (matrice run x
+        coin): le coin non indicate o con quantità non positiva non sono più detenute da tali run.
+        Le quantità degli altri run non cambiano.
+        """
+        run_idx = np.asarray(run_idx)
+        positive = sizes > 0
+        held = positive.any(axis=0)
+        held_ids = np.asarray(coin_ids, dtype=np.int64)[held]
+        held_sizes = np.where(positive[:, held], sizes[:, held], 0.0)
+
+        if len(run_idx) == len(self.sizes):
+            # Aggiornamento di tutti i run
+            self.coin_ids = held_ids
+            self.sizes = np.empty_like(held_sizes)
+            self.sizes[run_idx] = held_sizes
+            self.holders = np.count_nonzero(self.sizes > 0, axis=0)
+            return
+
+        # Quantità precedenti dei run specificati azzerate, liberando le colonne non più detenute
+        self.holders -= np.count_nonzero(self.sizes[run_idx] > 0, axis=0)
+        self.sizes[run_idx] = 0.0
+        self.coin_ids[self.holders == 0] = -1
+
+        # Colonne delle coin detenute: quelle già presenti, altrimenti le colonne libere
+        # (aggiungendone se necessario)
+        order = np.argsort(self.coin_ids, kind='stable')
+        idx = np.minimum(np.searchsorted(self.coin_ids, held_ids, sorter=order), max(len(order) - 1, 0))
+        found = self.coin_ids[order[idx]] == held_ids if len(order) else np.zeros(len(held_ids), dtype=bool)
+        columns = np.empty(len(held_ids), dtype=np.int64)
+        columns[found] = order[idx[found]]
+        new_coin_ids, new_columns = np.unique(held_ids[~found], return_inverse=True)
+        free = np.flatnonzero(self.holders == 0)
+        if len(free) < len(new_coin_ids):
+            added = len(new_coin_ids) - len(free)
+            self.coin_ids = np.concatenate([self.coin_ids, np.full(added, -1, dtype=np.int64)])
+            self.sizes = np.concatenate([self.sizes, np.zeros((len(self.sizes), added))], axis=1)
+            self.holders = np.concatenate([self.holders, np.zeros(added, dtype=np.int64)])
+            free = np.flatnonzero(self.holders == 0)
+        self.coin_ids[free[:len(new_coin_ids)]] = new_coin_ids
+        columns[~found] = free[new_columns.reshape(-1)]
+        self.sizes[run_idx[:, np.newaxis], columns] = held_sizes
+        self.holders += np.count_nonzero(self.sizes[run_idx] > 0, axis=0)
+
+    def clear(self, run_idx):
+        """
+        Azzera le quantità detenute dai run specificati (ad esempio al termine del loro test).
+        """
+        self.set(run_idx, np.zeros(0, dtype=np.int64), np.zeros((len(run_idx), 0)))
+
+    def get_proportional(self, run_idx, reference_idx, rtol):
+        """
+        Restituisce per ciascuno dei run specificati se le quantità detenute sono proporzionali,
+        con un fattore positivo e a meno della tolleranza relativa rtol su ogni coin, a quelle
+        del corrispondente run di riferimento (reference_idx).
+        """
+        sizes = self.sizes[run_idx]
+        reference = self.sizes[reference_idx]
+        totals = reference.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = sizes.sum(axis=1, keepdims=True) / totals
+        close = np.abs(sizes - scale * reference) <= rtol * np.abs(sizes)
+        return close.all(axis=1) & (totals[:, 0] > 0) & (scale[:, 0] > 0)
+
+    def get_run_holdings(self, run):
+        """
+        Restituisce le quantità detenute da un run (id della coin -> quantità).
+        """
+        held = np.flatnonzero(self.sizes[run] > 0)
+        return {int(self.coin_ids[idx]): float(self.sizes[run, idx]) for idx in held}
@@ -0,0 +1,110 @@
+"""
+http_fetcher.py
+    Client HTTP per il download concorrente di pagine (da più thread): sessione con pool
+    di connessioni riutilizzate, limite di frequenza (token bucket) e ripetizione delle
+    richieste fallite con attesa esponenziale (exponential backoff).
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Codici di stato HTTP per cui la richiesta viene ripetuta
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """
+    Errore nel download di una pagina (dopo eventuali ripetizioni): status è il codice di
+    stato HTTP (None per gli altri errori della richiesta), temporary indica un errore
+    temporaneo persistito dopo tutte le ripetizioni, per cui il download può riuscire se
+    ripetuto più tardi.
+    """
+
+    def __init__(self, message, status=None, temporary=False):
+        super().__init__(message)
+        self.status = status
+        self.temporary = temporary
+
+
+class TokenBucket:
+    """
+    Limitatore di frequenza: ogni richiesta consuma un token ed i token vengono
+    ricaricati alla frequenza specificata (token al secondo), fino ad un massimo di
+    capacity token (numero di richieste consecutive ammesse senza attesa).
+    [Thread-safe token bucket rate limiter.]
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Attende la disponibilità di un token e lo consuma.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpFetcher:
+    """
+    Client HTTP condiviso fra più thread per il download concorrente di pagine.
+    [Pooled, rate-limited HTTP client with retries.]
+    """
+
+    def __init__(self, concurrency=1, rate=None, retries=3, backoff=1.0, timeout=10):
+        # Numero massimo di richieste contemporanee
+        self.concurrency = concurrency
+        # Numero di ripetizioni di una richiesta fallita ed attesa iniziale (secondi)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Limite di frequenza (richieste al secondo, None = nessun limite)
+        self.bucket = TokenBucket(rate) if rate else None
+        # Sessione con un pool di connessioni pari al numero di richieste contemporanee
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_text(self, url):
+        """
+        Scarica una pagina e ne restituisce il contenuto testuale.
+        Gli errori della richiesta (connessione, timeout, connessione interrotta durante la
+        ricezione del contenuto, ecc.) ed i codici di stato temporanei (RETRY_STATUS_CODES)
+        vengono ripetuti fino a retries volte, con attesa backoff * 2^tentativo; gli altri codici
+        di stato causano subito una FetchError.
+        """
+        attempt = 0
+        while True:
+            if self.bucket:
+                self.bucket.acquire()
+            try:
+                page = self.session.get(url, timeout=self.timeout)
+                if page.status_code == 200:
+                    return page.text
+                if page.status_code not in RETRY_STATUS_CODES:
+                    raise FetchError("Failed to load page %s (HTTP status %d)" % (url, page.status_code), page.status_code)
+                status, cause = page.status_code, "HTTP status %d" % page.status_code
+            except requests.RequestException as e:
+                status, cause = None, str(e)
+            if attempt >= self.retries:
+                raise FetchError("Failed to load page %s (%s, after %d attempts)" % (url, cause, attempt + 1), status, True)
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def close(self):
+        self.session.close()
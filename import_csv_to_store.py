@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+"""
+import_csv_to_store.py
+    Importa i file CSV degli snapshot della cartella dei dati nell'archivio consolidato
+    SQLite (snapshot_store.py). I file già importati con lo stesso contenuto (hash)
+    vengono saltati.
+"""
+import argparse
+import csv
+import datetime
+import pathlib
+
+from market_data import file_digest, SNAPSHOT_FILE_GLOB
+from snapshot_store import SnapshotStore, STORE_FILE_NAME
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-d",   "--data_dir", help="Specify data directory. If not specified ./data/ is used.")
+    parser.add_argument("-o",   "--store", help="Snapshot store (SQLite database). If not specified " + STORE_FILE_NAME + " in the data directory is used.")
+
+    # assert that args is a list
+    if(args is not None):
+        args = parser.parse_args(args)
+    else:
+        args = parser.parse_args()
+
+    data_dir = pathlib.Path(args.data_dir) if args.data_dir else pathlib.Path("data")
+    store = SnapshotStore(args.store if args.store else pathlib.Path(data_dir, STORE_FILE_NAME))
+    stored_digests = store.get_digests()
+
+    imported = 0
+    skipped = 0
+    failed = 0
+    for csv_file_path in sorted(data_dir.glob(SNAPSHOT_FILE_GLOB)):
+        date = datetime.datetime.strptime(csv_file_path.stem, "%Y-%m-%d").date()
+        digest = file_digest(csv_file_path)
+        if stored_digests.get(date) == digest:
+            skipped += 1
+            continue
+        try:
+            with csv_file_path.open(newline='') as csv_file:
+                reader = csv.DictReader(csv_file, delimiter=";")
+                rows = list(reader)
+                store.append(date, reader.fieldnames or [], rows, digest)
+        except Exception as e:
+            print("Error importing file %s: %s" % (csv_file_path, e))
+            failed += 1
+            continue
+        imported += 1
+    print("Imported %d snapshots, %d already up to date, %d failed" % (imported, skipped, failed))
+
+if __name__ == "__main__":
+    main()
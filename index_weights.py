@@ -0,0 +1,198 @@
+"""
+index_weights.py
+    Calcolo dei pesi delle coin nel paniere (market cap con limite massimo per coin).
+"""
+import numpy as np
+
+
+def capped_weights(market_caps, weight_cap):
+    """
+    Calcola i pesi proporzionali alla market cap con un limite massimo (weight cap) per
+    ogni coin, in forma chiusa (water-filling): ordinate le coin per market cap decrescente,
+    le prime k vengono fissate al cap ed il peso residuo (1 - k * cap) viene distribuito in
+    proporzione alla market cap fra le rimanenti, scegliendo il minimo k per cui nessuna
+    delle rimanenti supera il cap.
+    [Closed-form capped market-cap weights.]
+
+    market_caps ha forma (..., N): l'ultimo asse contiene le coin del paniere, gli assi
+    precedenti (ad esempio le settimane di un pannello) vengono risolti insieme.
+    weight_cap (frazione, non percentuale) è uno scalare o un array compatibile (broadcast)
+    con gli assi precedenti di market_caps: ad esempio con market_caps di forma (W, N) e
+    weight_cap di forma (C, 1) si ottengono i pesi di tutti i cap per tutte le settimane,
+    con forma (C, W, N).
+    Le market cap non valide (NaN) hanno peso nullo.
+    """
+    market_caps = np.nan_to_num(np.asarray(market_caps, dtype=float))
+    cap = np.asarray(weight_cap, dtype=float)[..., np.newaxis]
+    coins = market_caps.shape[-1]
+
+    # Market cap ordinate in modo decrescente e somme dei valori dalla posizione k in poi
+    order = np.argsort(-market_caps, axis=-1, kind='stable')
+    sorted_caps = np.take_along_axis(market_caps, order, axis=-1)
+    rest = np.cumsum(sorted_caps[..., ::-1], axis=-1)[..., ::-1]
+
+    # Peso residuo se le prime k coin sono fissate al cap
+    capped = np.arange(coins)
+    residual = 1.0 - capped * cap
+    # La coin in posizione k (la maggiore fra le non fissate) non deve superare il cap
+    admissible = sorted_caps * residual <= cap * rest
+    first_capped = np.where(admissible.any(axis=-1), admissible.argmax(axis=-1), coins)[..., np.newaxis]
+
+    residual, rest = np.broadcast_arrays(residual, rest)
+    k = np.minimum(first_capped, coins - 1)
+    k_residual = np.take_along_axis(residual, k, axis=-1)
+    k_rest = np.take_along_axis(rest, k, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(k_rest > 0, k_residual / k_rest, 0.0)
+
+    sorted_weights = np.where(capped < first_capped, cap, sorted_caps * factor)
+    weights = np.empty_like(sorted_weights)
+    np.put_along_axis(weights, np.broadcast_to(order, sorted_weights.shape), sorted_weights, axis=-1)
+    return weights
+
+
+def panel_capped_weights(market_caps, rank, crypto_number, weight_cap_perc):
+    """
+    Calcola i pesi di tutte le settimane di un pannello (matrici settimane x rank) per un
+    paniere delle prime crypto_number coin per rank con cap weight_cap_perc (percentuale).
+    Le coin fuori dal paniere hanno peso nullo.
+    """
+    in_basket = (rank >= 1) & (rank <= crypto_number)
+    # Colonne (rank) che contengono almeno una coin del paniere
+    columns = int(np.flatnonzero(in_basket.any(axis=0)).max()) + 1 if in_basket.any() else 0
+    weights = np.zeros(market_caps.shape)
+    basket_caps = np.where(in_basket[:, :columns], market_caps[:, :columns], 0.0)
+    weights[:, :columns] = capped_weights(basket_caps, weight_cap_perc / 100.0)
+    return weights
+
+
+def top_capped_weights(market_caps, totals, weight_cap):
+    """
+    Calcola gli stessi pesi di capped_weights per market cap (settimane x coin, non negative)
+    di cui è già nota la somma (totals, una per settimana), in O(N) per settimana: solo le
+    coin che possono raggiungere il cap (al più 1 / cap + 1, selezionate con argpartition)
+    vengono ordinate, e la somma nota sostituisce le somme cumulative delle rimanenti.
+    [Capped weights from precomputed market-cap sums.]
+    """
+    weeks, coins = market_caps.shape
+    if coins == 0:
+        return np.zeros((weeks, 0))
+    top = min(coins, int(np.ceil(1.0 / weight_cap)) + 1) if weight_cap > 0 else coins
+    if top < coins:
+        candidates = np.argpartition(-market_caps, top - 1, axis=-1)[:, :top]
+    else:
+        candidates = np.broadcast_to(np.arange(coins), market_caps.shape)
+    # Candidate ordinate per market cap decrescente (a parità di market cap, per posizione)
+    top_caps = np.take_along_axis(market_caps, candidates, axis=-1)
+    order = np.lexsort((candidates, -top_caps), axis=-1)
+    candidates = np.take_along_axis(candidates, order, axis=-1)
+    top_caps = np.take_along_axis(top_caps, order, axis=-1)
+
+    # Peso residuo e market cap delle coin non fissate se le prime k coin sono fissate al cap
+    capped = np.arange(top)
+    residual = 1.0 - capped * weight_cap
+    rest = np.maximum(totals[:, np.newaxis] - (np.cumsum(top_caps, axis=-1) - top_caps), 0.0)
+    admissible = top_caps * residual <= weight_cap * rest
+    first_capped = np.where(admissible.any(axis=-1), admissible.argmax(axis=-1), top)[:, np.newaxis]
+
+    k = np.minimum(first_capped, top - 1)
+    k_residual = 1.0 - k * weight_cap
+    # Market cap delle coin non fissate sommata direttamente (la differenza con la somma
+    # nota perde precisione se le coin fissate hanno market cap molto maggiori)
+    not_capped = np.ones(market_caps.shape, dtype=bool)
+    np.put_along_axis(not_capped, candidates, capped >= k, axis=-1)
+    k_rest = np.where(not_capped, market_caps, 0.0).sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(k_rest > 0, k_residual / k_rest, 0.0)
+
+    weights = market_caps * factor
+    np.put_along_axis(weights, candidates, np.where(capped < first_capped, weight_cap, top_caps * factor), axis=-1)
+    return weights
+
+
+class BasketIndex:
+    """
+    Indice per settimana delle coin di un pannello in ordine di rank, fino a crypto_number
+    coin, calcolato una sola volta e condiviso da tutti i panieri con un numero di coin
+    minore o uguale: posizioni delle righe negli snapshot, rank, market cap e relative somme
+    cumulative. I pesi di un paniere di N coin si ottengono in O(N) per settimana, senza
+    rileggere i dati del pannello.
+    [Shared per-week rank-order index with market-cap prefix sums.]
+    """
+
+    def __init__(self, panel, crypto_number):
+        # Numero massimo di coin dei panieri serviti dall'indice
+        self.crypto_number = crypto_number
+        columns = panel.get_basket_columns(crypto_number)
+        rank = panel.get_columns('rank', columns)
+        in_basket = (rank >= 1) & (rank <= crypto_number)
+        # Posizioni delle righe ordinate per rank (le righe fuori dai panieri in fondo)
+        rank = np.where(in_basket, rank, np.iinfo(np.int64).max)
+        self.positions = np.argsort(rank, axis=1, kind='stable')
+        self.rank = np.take_along_axis(rank, self.positions, axis=1)
+        market_caps = np.where(in_basket, np.nan_to_num(panel.get_columns('marketcapusd', columns)), 0.0)
+        self.market_caps = np.take_along_axis(market_caps, self.positions, axis=1)
+        # Somme cumulative delle market cap in ordine di rank (colonna n: somma delle prime n coin)
+        self.prefix_sums = np.concatenate([np.zeros((len(rank), 1)), np.cumsum(self.market_caps, axis=1)], axis=1)
+
+    def get_weights(self, crypto_number, weight_cap_perc):
+        """
+        Restituisce la matrice (settimane x righe iniziali degli snapshot) dei pesi del paniere
+        delle prime crypto_number coin per rank con cap weight_cap_perc (percentuale), come
+        panel_capped_weights sulle colonne di SnapshotPanel.get_basket_columns(crypto_number).
+        """
+        if crypto_number > self.crypto_number:
+            raise ValueError("Basket of %d coins exceeds the index size (%d)" % (crypto_number, self.crypto_number))
+        weeks = len(self.rank)
+        # Numero di coin del paniere in ciascuna settimana (le prime in ordine di rank)
+        counts = np.count_nonzero(self.rank <= crypto_number, axis=1)
+        size = int(counts.max()) if weeks else 0
+        basket = np.arange(size) < counts[:, np.newaxis]
+        market_caps = np.where(basket, self.market_caps[:, :size], 0.0)
+        totals = self.prefix_sums[np.arange(weeks), counts]
+        rank_weights = top_capped_weights(market_caps, totals, weight_cap_perc / 100.0)
+
+        # Pesi riportati alle posizioni delle righe negli snapshot
+        week_idx, basket_idx = np.nonzero(basket)
+        positions = self.positions[week_idx, basket_idx]
+        weights = np.zeros((weeks, int(positions.max()) + 1 if len(positions) else 0))
+        weights[week_idx, positions] = rank_weights[week_idx, basket_idx]
+        return weights
+
+
+class WeightsTable:
+    """
+    Pesi delle coin per ogni settimana di un pannello, calcolati una sola volta per ogni
+    combinazione (numero di coin, cap) e condivisi fra tutti i test che la utilizzano
+    (ad esempio con fee o date di inizio diverse).
+    [Per-week basket weights shared across fees and start dates.]
+    """
+
+    def __init__(self, panel, crypto_number=None):
+        self.panel = panel
+        self.weights = {}
+        # Indice delle coin per rank condiviso da tutti i numeri di coin (vedi BasketIndex),
+        # costruito alla prima richiesta per almeno crypto_number coin
+        self.crypto_number = crypto_number
+        self.index = None
+
+    def get_index(self, crypto_number):
+        """
+        Restituisce l'indice delle coin per rank, ricostruendolo se non comprende
+        crypto_number coin.
+        """
+        if self.index is None or crypto_number > self.index.crypto_number:
+            self.index = BasketIndex(self.panel, max(crypto_number, self.crypto_number or 0))
+        return self.index
+
+    def get_weights(self, crypto_number, weight_cap_perc):
+        """
+        Restituisce la matrice (settimane x righe iniziali degli snapshot) dei pesi per la
+        combinazione specificata: le colonne sono le prime righe di ogni snapshot che
+        comprendono le coin del paniere (vedi SnapshotPanel.get_basket_columns); le righe
+        successive hanno peso nullo.
+        """
+        key = (crypto_number, weight_cap_perc)
+        if key not in self.weights:
+            self.weights[key] = self.get_index(crypto_number).get_weights(crypto_number, weight_cap_perc)
+        return self.weights[key]
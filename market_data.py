@@ -0,0 +1,512 @@
+"""
+market_data.py
+    Caricamento dei dati storici settimanali in un pannello condiviso in memoria.
+    I file CSV vengono letti una sola volta e il pannello viene poi utilizzato
+    da tutte le strategie analizzate.
+    I file CSV vengono inoltre convertiti in una cache binaria (un file .npy per campo)
+    che viene letta in memory-mapping nelle esecuzioni successive.
+    Vengono lette tutte le coin di ogni snapshot: le righe delle settimane sono memorizzate
+    una di seguito all'altra (formato CSR), senza completare le settimane con meno coin,
+    ed ogni coin è identificata da un id numerico stabile fra tutti gli snapshot.
+"""
+import datetime
+import errno
+import hashlib
+import json
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+# Numero massimo predefinito di coin (per rank) lette da ogni snapshot (None: tutte)
+MAX_RANK = None
+# Campi numerici memorizzati nel pannello
+PANEL_FIELDS = ['priceusd', 'pricebtc', 'marketcapusd']
+# Nome della directory della cache binaria (all'interno della directory dati)
+CACHE_DIR_NAME = ".cache"
+# Versione del formato della cache
+CACHE_VERSION = 3
+# Pattern dei file CSV degli snapshot
+SNAPSHOT_FILE_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9].csv"
+
+
+def snapshot_file_path(data_dir, date):
+    """
+    Restituisce il percorso del file CSV relativo alla data specificata.
+    """
+    return pathlib.Path(data_dir, date.strftime("%Y-%m-%d.csv"))
+
+
+def read_snapshot_csv(csv_file_path, max_rank=MAX_RANK):
+    """
+    Legge un file CSV generato da fetch_cmc_historical_data.py (le prime max_rank righe,
+    tutte se non specificato).
+    """
+    # round_trip: conversione esatta dei valori (il parser predefinito può differire di un ulp)
+    # Solo i campi vuoti sono valori mancanti: simboli e nomi come "NAN" o "NULL" restano stringhe
+    return pd.read_csv(csv_file_path, sep=";", index_col='rank', nrows=max_rank, float_precision='round_trip',
+                       keep_default_na=False, na_values=[''], dtype={'symbol': str, 'name': str})
+
+
+def file_digest(file_path):
+    """
+    Calcola l'hash SHA-1 del contenuto di un file.
+    """
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def intern_coin(coin_ids, symbol, name):
+    """
+    Restituisce l'id numerico della coin (simbolo, nome), aggiungendola al dizionario
+    coin_ids se non ancora presente. Il nome distingue coin diverse con lo stesso simbolo.
+    """
+    return coin_ids.setdefault((symbol, name), len(coin_ids))
+
+
+def parse_snapshot(csv_file_path, coin_ids, max_rank=MAX_RANK):
+    """
+    Legge un file CSV e ne restituisce i valori come array numerici (uno per riga).
+    Le coin sono convertite in id numerici tramite il dizionario coin_ids (aggiornato
+    con le coin non ancora presenti, vedi intern_coin).
+    """
+    df = read_snapshot_csv(csv_file_path, max_rank)
+    rank = df.index.values.astype(np.int64)
+    symbol_id = np.array([intern_coin(coin_ids, symbol, name) for symbol, name in zip(df.symbol.fillna(''), df.name.fillna(''))],
+                         dtype=np.int64)
+    fields = {field: pd.to_numeric(df[field], errors='coerce').values.astype(float) for field in PANEL_FIELDS}
+    return rank, symbol_id, fields
+
+
+def segment_index(starts, lengths):
+    """
+    Restituisce le posizioni degli elementi di più segmenti consecutivi di un array
+    (segmento i: da starts[i] per lengths[i] elementi), concatenate.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.repeat(np.asarray(starts, dtype=np.int64) - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class SnapshotPanel:
+    """
+    Pannello (settimane x coin ordinate per rank x campi) con i dati degli snapshot, in formato
+    CSR: i valori di tutte le righe sono concatenati in array monodimensionali e le righe della
+    settimana i sono quelle comprese fra offsets[i] e offsets[i + 1].
+    [Ragged (CSR) in-memory panel of the weekly snapshots, with interned coin ids.]
+    """
+
+    def __init__(self, dates, offsets, rank, symbol_id, coins, fields, errors=None, digests=None, max_rank=MAX_RANK):
+        # Date degli snapshot caricati (una per settimana del pannello)
+        self.dates = list(dates)
+        self.week_index = {date: idx for idx, date in enumerate(self.dates)}
+        # Posizione della prima riga di ogni settimana (più la posizione finale)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Rank di ciascuna riga
+        self.rank = rank
+        # Id numerico della coin di ciascuna riga
+        self.symbol_id = symbol_id
+        # Tabella id -> (simbolo, nome), simbolo e nome della coin di ciascun id
+        self.coins = [tuple(coin) for coin in coins]
+        self.coin_ids = {coin: idx for idx, coin in enumerate(self.coins)}
+        self.symbols = [symbol for symbol, _ in self.coins]
+        self.names = [name for _, name in self.coins]
+        # Id della prima coin (per ordine di comparsa) di ciascun simbolo
+        self.symbol_ids = {}
+        for idx, symbol in enumerate(self.symbols):
+            self.symbol_ids.setdefault(symbol, idx)
+        # Campi numerici (dizionario nome campo -> array con un valore per riga)
+        self.fields = fields
+        # Errori riscontrati durante il caricamento (data -> eccezione)
+        self.errors = errors if errors is not None else {}
+        # Hash SHA-1 dei file sorgente (data -> hash)
+        self.digests = digests if digests is not None else {}
+        # Numero massimo di coin lette da ogni snapshot (None: tutte)
+        self.max_rank = max_rank
+        # Righe ordinate per settimana ed id della coin (per la ricerca delle coin, vedi find_rows)
+        self.sorted_rows = None
+
+    @classmethod
+    def load(cls, data_dir, dates, max_rank=MAX_RANK, use_cache=True):
+        """
+        Carica in memoria gli snapshot relativi alle date specificate (le prime max_rank
+        coin di ogni snapshot, tutte se non specificato).
+        Se use_cache è True i dati vengono letti dalla cache binaria (aggiornata se necessario),
+        altrimenti vengono letti direttamente i file CSV.
+        Le date per cui non è possibile leggere il file vengono registrate in 'errors'.
+        """
+        if use_cache:
+            return SnapshotCache(data_dir).refresh().get_panel(dates, max_rank)
+
+        loaded_dates = []
+        rows = []
+        errors = {}
+        digests = {}
+        coin_ids = {}
+        for date in sorted(set(dates)):
+            try:
+                csv_file_path = snapshot_file_path(data_dir, date)
+                rows.append(parse_snapshot(csv_file_path, coin_ids, max_rank))
+                digests[date] = file_digest(csv_file_path)
+                loaded_dates.append(date)
+            except Exception as e:
+                errors[date] = e
+
+        offsets = np.concatenate([[0], np.cumsum([len(row[0]) for row in rows], dtype=np.int64)])
+        rank = np.concatenate([row[0] for row in rows]) if rows else np.zeros(0, dtype=np.int64)
+        symbol_id = np.concatenate([row[1] for row in rows]) if rows else np.zeros(0, dtype=np.int64)
+        fields = {field: np.concatenate([row[2][field] for row in rows]) if rows else np.zeros(0) for field in PANEL_FIELDS}
+        coins = sorted(coin_ids, key=coin_ids.get)
+        return cls(loaded_dates, offsets, rank, symbol_id, coins, fields, errors, digests, max_rank)
+
+    def get_digest(self, date):
+        """
+        Restituisce l'hash del file sorgente dello snapshot della data specificata
+        (None se lo snapshot non è disponibile).
+        """
+        return self.digests.get(date)
+
+    def get_week_index(self, date):
+        """
+        Restituisce l'indice della settimana del pannello per la data specificata.
+        Se lo snapshot non è stato caricato rilancia l'errore riscontrato in fase di lettura.
+        """
+        if date in self.week_index:
+            return self.week_index[date]
+        if date in self.errors:
+            raise self.errors[date]
+        raise KeyError("Snapshot not loaded for date %s" % date)
+
+    def get_coin_id(self, symbol, name):
+        """
+        Restituisce l'id numerico della coin specificata (-1 se non presente).
+        """
+        return self.coin_ids.get((symbol, name), -1)
+
+    def get_symbol_id(self, symbol):
+        """
+        Restituisce l'id numerico della prima coin (per ordine di comparsa) con il simbolo
+        specificato (-1 se non presente).
+        """
+        return self.symbol_ids.get(symbol, -1)
+
+    def get_rows_number(self, week_idx):
+        """
+        Restituisce il numero di coin presenti nello snapshot della settimana specificata.
+        """
+        return int(self.offsets[week_idx + 1] - self.offsets[week_idx])
+
+    def get_rows(self, week_idx):
+        """
+        Restituisce l'intervallo (slice) delle righe della settimana specificata negli array del pannello.
+        """
+        return slice(int(self.offsets[week_idx]), int(self.offsets[week_idx + 1]))
+
+    def get_positions(self):
+        """
+        Restituisce la posizione di ciascuna riga all'interno del proprio snapshot (0 per la prima coin).
+        """
+        lengths = np.diff(self.offsets)
+        return np.arange(self.offsets[-1]) - np.repeat(self.offsets[:-1], lengths)
+
+    def get_columns(self, field, columns):
+        """
+        Restituisce la matrice densa (settimane x columns) delle prime columns righe di ogni
+        settimana del campo specificato ('rank' o uno dei PANEL_FIELDS), completata con NaN
+        (0 per il rank) nelle settimane con meno righe.
+        """
+        values = self.rank if field == 'rank' else self.fields[field]
+        lengths = np.diff(self.offsets)
+        present = np.arange(columns) < lengths[:, np.newaxis]
+        matrix = np.zeros((len(self.dates), columns), dtype=values.dtype) if field == 'rank' else np.full((len(self.dates), columns), np.nan)
+        matrix[present] = values[(self.offsets[:-1, np.newaxis] + np.arange(columns))[present]]
+        return matrix
+
+    def get_basket_columns(self, crypto_number):
+        """
+        Restituisce il numero di righe iniziali di ogni settimana sufficiente a comprendere
+        tutte le coin con rank fino a crypto_number.
+        """
+        in_basket = (self.rank >= 1) & (self.rank <= crypto_number)
+        if not in_basket.any():
+            return 0
+        return int(self.get_positions()[in_basket].max()) + 1
+
+    def find_rows(self, week_idx, coin_ids):
+        """
+        Restituisce la posizione nello snapshot della settimana specificata di ciascuna
+        delle coin indicate (-1 per le coin non presenti). La ricerca è binaria sulle righe
+        della settimana ordinate per id, calcolate una sola volta per tutto il pannello.
+        """
+        if self.sorted_rows is None:
+            week = np.repeat(np.arange(len(self.dates)), np.diff(self.offsets))
+            self.sorted_rows = np.lexsort((self.symbol_id, week))
+            self.sorted_ids = self.symbol_id[self.sorted_rows]
+        rows = self.get_rows(week_idx)
+        week_ids = self.sorted_ids[rows]
+        coin_ids = np.asarray(coin_ids, dtype=np.int64)
+        if len(week_ids) == 0:
+            return np.full(len(coin_ids), -1, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(week_ids, coin_ids), len(week_ids) - 1)
+        found = week_ids[idx] == coin_ids
+        return np.where(found, self.sorted_rows[rows][idx] - rows.start, -1)
+
+    def get_active_rows(self, week_idx, columns, coin_ids):
+        """
+        Restituisce le posizioni (ordinate) delle righe della settimana specificata da
+        elaborare: le prime columns righe (le coin che possono avere peso nel paniere) e
+        quelle delle coin indicate (ad esempio le coin detenute), se presenti. Le altre
+        righe non hanno né peso né quantità detenuta e non modificano i risultati.
+        Restituisce inoltre, per ciascuna delle coin indicate, l'indice della sua riga
+        fra quelle restituite (-1 se non presente).
+        """
+        top = np.arange(min(columns, self.get_rows_number(week_idx)), dtype=np.int64)
+        coin_rows = self.find_rows(week_idx, coin_ids)
+        extra = coin_rows >= len(top)
+        if not extra.any():
+            return top, coin_rows
+        extra_rows = np.unique(coin_rows[extra])
+        coin_rows[extra] = len(top) + np.searchsorted(extra_rows, coin_rows[extra])
+        return np.concatenate([top, extra_rows]), coin_rows
+
+    def get_dataframe(self, date):
+        """
+        Restituisce lo snapshot della data specificata come DataFrame indicizzato per rank,
+        con lo stesso formato ottenuto dalla lettura del file CSV.
+        """
+        rows = self.get_rows(self.get_week_index(date))
+        symbol_id = self.symbol_id[rows]
+        df = pd.DataFrame(
+            {
+                'date': date.strftime("%Y-%m-%d"),
+                'name': [self.names[sid] for sid in symbol_id],
+                'symbol': [self.symbols[sid] for sid in symbol_id],
+                'marketcapusd': self.fields['marketcapusd'][rows],
+                'priceusd': self.fields['priceusd'][rows],
+                'pricebtc': self.fields['pricebtc'][rows]
+            },
+            index=pd.Index(self.rank[rows], name='rank')
+        )
+        return df
+
+
+class SnapshotCache:
+    """
+    Cache binaria degli snapshot CSV presenti nella directory dati.
+    Ogni campo è memorizzato in un file .npy (le righe di tutti i file CSV ordinati per data,
+    concatenate; il file offsets contiene la posizione della prima riga di ogni file), letto
+    in memory-mapping. Il manifest registra mtime, dimensione e hash di ogni file sorgente:
+    un file viene riletto solo se il suo contenuto cambia.
+    [Binary columnar cache of the snapshot CSV files with automatic invalidation.]
+    """
+
+    def __init__(self, data_dir, cache_dir=None):
+        self.data_dir = pathlib.Path(data_dir)
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else pathlib.Path(data_dir, CACHE_DIR_NAME)
+        self.manifest = None
+        self.arrays = None
+
+    def get_manifest_path(self):
+        """
+        Restituisce il percorso del manifest della cache.
+        """
+        return pathlib.Path(self.cache_dir, "manifest.json")
+
+    def get_array_path(self, name, generation):
+        """
+        Restituisce il percorso del file .npy di un campo per la generazione specificata.
+        """
+        return pathlib.Path(self.cache_dir, "%s-%d.npy" % (name, generation))
+
+    def load_manifest(self):
+        """
+        Legge il manifest della cache. Restituisce None se assente o non compatibile.
+        """
+        try:
+            with self.get_manifest_path().open() as infile:
+                manifest = json.load(infile)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != CACHE_VERSION:
+            return None
+        return manifest
+
+    def load_arrays(self, manifest):
+        """
+        Apre in memory-mapping i file .npy della generazione indicata dal manifest.
+        """
+        if manifest['rows'] == 0:
+            arrays = {name: np.zeros(0, dtype=np.int64) for name in ['rank', 'symbol_id']}
+            arrays.update({field: np.zeros(0) for field in PANEL_FIELDS})
+            arrays['offsets'] = np.zeros(1, dtype=np.int64)
+            return arrays
+        return {name: np.load(str(self.get_array_path(name, manifest['generation'])), mmap_mode='r')
+                for name in ['offsets', 'rank', 'symbol_id'] + PANEL_FIELDS}
+
+    def refresh(self):
+        """
+        Verifica la validità della cache rispetto ai file CSV e la ricostruisce se necessario.
+        """
+        manifest = self.load_manifest()
+        arrays = None
+        if manifest is not None:
+            try:
+                arrays = self.load_arrays(manifest)
+            except (OSError, ValueError):
+                manifest = None
+        old_files = manifest['files'] if manifest else {}
+
+        files = {}
+        to_parse = []
+        manifest_changed = False
+        for csv_file_path in sorted(self.data_dir.glob(SNAPSHOT_FILE_GLOB)):
+            date_key = csv_file_path.stem
+            stat = csv_file_path.stat()
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            old_entry = old_files.get(date_key)
+            if old_entry and old_entry['mtime_ns'] == entry['mtime_ns'] and old_entry['size'] == entry['size']:
+                files[date_key] = old_entry
+                continue
+            # mtime o dimensione modificati: verifico l'hash del contenuto
+            entry['sha1'] = file_digest(csv_file_path)
+            manifest_changed = True
+            if old_entry and old_entry.get('sha1') == entry['sha1']:
+                entry.update({k: v for k, v in old_entry.items() if k in ('row', 'error')})
+                files[date_key] = entry
+            else:
+                files[date_key] = entry
+                to_parse.append(csv_file_path)
+
+        if manifest is not None and not to_parse and set(files) == set(old_files):
+            # Contenuto invariato: al più aggiorno mtime e dimensione nel manifest
+            if manifest_changed:
+                manifest['files'] = files
+                self.write_manifest(manifest)
+            self.manifest = manifest
+            self.arrays = arrays
+            return self
+
+        self.rebuild(manifest, arrays, files, to_parse)
+        return self
+
+    def write_manifest(self, manifest):
+        """
+        Scrive (in modo atomico) il manifest della cache.
+        """
+        manifest_path = self.get_manifest_path()
+        tmp_path = manifest_path.with_suffix(".tmp")
+        with tmp_path.open('w') as outfile:
+            json.dump(manifest, outfile)
+        os.replace(str(tmp_path), str(manifest_path))
+
+    def rebuild(self, old_manifest, old_arrays, files, to_parse):
+        """
+        Ricostruisce i file della cache, riutilizzando le righe dei file CSV non modificati.
+        """
+        coins = old_manifest['coins'] if old_manifest else []
+        coin_ids = {tuple(coin): idx for idx, coin in enumerate(coins)}
+        generation = old_manifest['generation'] + 1 if old_manifest else 1
+        to_parse = set(to_parse)
+
+        date_keys = sorted(files)
+        rows = [date_key for date_key in date_keys
+                if 'error' not in files[date_key] or pathlib.Path(self.data_dir, date_key + ".csv") in to_parse]
+        segments = {name: [] for name in ['rank', 'symbol_id'] + PANEL_FIELDS}
+
+        row = 0
+        for date_key in rows:
+            entry = files[date_key]
+            csv_file_path = pathlib.Path(self.data_dir, date_key + ".csv")
+            if csv_file_path in to_parse:
+                entry.pop('row', None)
+                entry.pop('error', None)
+                try:
+                    rank, symbol_id, fields = parse_snapshot(csv_file_path, coin_ids)
+                except Exception as e:
+                    entry['error'] = str(e)
+                    continue
+                segments['rank'].append(rank)
+                segments['symbol_id'].append(symbol_id)
+                for field in PANEL_FIELDS:
+                    segments[field].append(fields[field])
+            else:
+                old_row = entry['row']
+                old_rows = slice(int(old_arrays['offsets'][old_row]), int(old_arrays['offsets'][old_row + 1]))
+                for name in segments:
+                    segments[name].append(np.asarray(old_arrays[name][old_rows]))
+            entry['row'] = row
+            row += 1
+        new_arrays = {name: np.concatenate(values) if values else np.zeros(0, dtype=float if name in PANEL_FIELDS else np.int64)
+                      for name, values in segments.items()}
+        new_arrays['offsets'] = np.concatenate([[0], np.cumsum([len(values) for values in segments['rank']], dtype=np.int64)])
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, array in new_arrays.items():
+            array_path = self.get_array_path(name, generation)
+            tmp_path = array_path.with_suffix(".tmp")
+            with tmp_path.open('wb') as outfile:
+                np.save(outfile, array)
+            os.replace(str(tmp_path), str(array_path))
+
+        manifest = {
+            'version': CACHE_VERSION,
+            'generation': generation,
+            'rows': row,
+            'files': files,
+            'coins': [list(coin) for coin in sorted(coin_ids, key=coin_ids.get)]
+        }
+        self.write_manifest(manifest)
+
+        # Rimuovo i file delle generazioni precedenti
+        for old_file in self.cache_dir.glob("*.npy"):
+            if not old_file.name.endswith("-%d.npy" % generation):
+                try:
+                    old_file.unlink()
+                except OSError:
+                    pass
+
+        self.manifest = manifest
+        self.arrays = self.load_arrays(manifest)
+
+    def get_panel(self, dates, max_rank=MAX_RANK):
+        """
+        Restituisce un SnapshotPanel con le righe della cache relative alle date specificate
+        (le prime max_rank righe di ogni snapshot, tutte se non specificato).
+        """
+        loaded_dates = []
+        rows = []
+        errors = {}
+        digests = {}
+        for date in sorted(set(dates)):
+            entry = self.manifest['files'].get(date.strftime("%Y-%m-%d"))
+            if entry is None:
+                csv_file_path = snapshot_file_path(self.data_dir, date)
+                errors[date] = FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(csv_file_path))
+            elif 'error' in entry:
+                errors[date] = ValueError(entry['error'])
+            else:
+                loaded_dates.append(date)
+                rows.append(entry['row'])
+                digests[date] = entry['sha1']
+
+        offsets = np.asarray(self.arrays['offsets'])
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = offsets[rows]
+        lengths = offsets[rows + 1] - starts
+        if max_rank is not None:
+            lengths = np.minimum(lengths, max_rank)
+        index = segment_index(starts, lengths)
+        fields = {field: np.asarray(self.arrays[field][index]) for field in PANEL_FIELDS}
+        return SnapshotPanel(loaded_dates, np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]), np.asarray(self.arrays['rank'][index]),
+                             np.asarray(self.arrays['symbol_id'][index]), self.manifest['coins'], fields, errors, digests, max_rank)
+
+    def get_dates(self):
+        """
+        Restituisce le date degli snapshot validi presenti nella cache.
+        """
+        return [datetime.datetime.strptime(date_key, "%Y-%m-%d").date()
+                for date_key, entry in sorted(self.manifest['files'].items()) if 'error' not in entry]
@@ -0,0 +1,159 @@
+"""
+metrics.py
+    Calcolo incrementale (online) degli indicatori di rischio e rendimento di una o più
+    strategie: ad ogni settimana simulata gli indicatori vengono aggiornati in tempo costante
+    (media e varianza dei rendimenti con l'algoritmo di Welford, massimi e minimi progressivi),
+    con operazioni vettoriali su tutte le strategie insieme.
+"""
+import numpy as np
+
+from commons import PERC_FACTOR
+
+# Numero di periodi (settimane) in un anno, per gli indicatori annualizzati
+PERIODS_PER_YEAR = 52
+# Indicatori calcolati ad ogni settimana (nell'ordine delle colonne dei risultati)
+METRICS_VALUES = ['expanding_max', 'drawdown', 'drawdown_perc', 'max_drawdown', 'max_drawdown_perc',
+                  'amount_usd_weekly_returns', 'amount_btc_weekly_returns', 'amount_usd_sharpe_ratio', 'amount_btc_sharpe_ratio',
+                  'amount_usd_sortino_ratio', 'amount_btc_sortino_ratio', 'amount_usd_volatility', 'amount_btc_volatility',
+                  'calmar_ratio', 'turnover']
+
+
+class ReturnsAccumulator:
+    """
+    Statistiche progressive dei rendimenti settimanali di una serie di valori (una per run):
+    numero, media e somma dei quadrati degli scarti (Welford), somma dei quadrati dei
+    rendimenti negativi (per la downside deviation). I metodi vanno chiamati con gli avvisi
+    di NumPy per divisioni per zero disabilitati (vedi OnlineMetrics.update).
+    [Welford accumulator of periodic returns.]
+    """
+
+    def __init__(self, runs_number):
+        self.first = np.full(runs_number, np.nan)
+        self.previous = np.full(runs_number, np.nan)
+        self.count = np.zeros(runs_number, dtype=np.int64)
+        self.mean = np.zeros(runs_number)
+        self.m2 = np.zeros(runs_number)
+        self.downside = np.zeros(runs_number)
+
+    def update(self, values, run_idx):
+        """
+        Aggiunge i valori di una settimana dei run specificati.
+        Restituisce i rendimenti della settimana (NaN alla prima settimana).
+        """
+        returns = values / self.previous[run_idx] - 1
+        valid = np.isfinite(returns)
+        count = self.count[run_idx] + valid
+        delta = np.where(valid, returns - self.mean[run_idx], 0.0)
+        mean = self.mean[run_idx] + np.where(valid, delta / np.maximum(count, 1), 0.0)
+        self.m2[run_idx] += np.where(valid, delta * (returns - mean), 0.0)
+        self.downside[run_idx] += np.where(valid & (returns < 0), np.square(np.where(valid, returns, 0.0)), 0.0)
+        self.mean[run_idx] = mean
+        self.count[run_idx] = count
+        self.first[run_idx] = np.where(np.isnan(self.first[run_idx]), values, self.first[run_idx])
+        self.previous[run_idx] = values
+        return returns
+
+    def get_std(self, run_idx):
+        """
+        Deviazione standard campionaria dei rendimenti (NaN con meno di due rendimenti).
+        """
+        count = self.count[run_idx]
+        return np.where(count > 1, np.sqrt(self.m2[run_idx] / (count - 1)), np.nan)
+
+    def get_sharpe(self, run_idx):
+        """
+        Sharpe ratio annualizzato (rendimenti assunti in eccesso rispetto al benchmark).
+        """
+        return np.sqrt(PERIODS_PER_YEAR) * self.mean[run_idx] / self.get_std(run_idx)
+
+    def get_sortino(self, run_idx):
+        """
+        Sortino ratio annualizzato: come lo Sharpe ratio, ma con la sola deviazione dei
+        rendimenti negativi (NaN se non ci sono rendimenti negativi).
+        """
+        count = self.count[run_idx]
+        downside = self.downside[run_idx]
+        downside_deviation = np.sqrt(downside / count)
+        return np.where((count > 0) & (downside > 0), np.sqrt(PERIODS_PER_YEAR) * self.mean[run_idx] / downside_deviation, np.nan)
+
+    def get_volatility(self, run_idx):
+        """
+        Volatilità annualizzata dei rendimenti (in percentuale).
+        """
+        return np.sqrt(PERIODS_PER_YEAR) * self.get_std(run_idx) * PERC_FACTOR
+
+    def get_annualized_return(self, run_idx):
+        """
+        Rendimento annuo composto dal primo valore (in percentuale; NaN alla prima settimana).
+        """
+        count = self.count[run_idx]
+        growth = self.previous[run_idx] / self.first[run_idx]
+        return np.where(count > 0, (np.power(growth, PERIODS_PER_YEAR / np.maximum(count, 1)) - 1) * PERC_FACTOR, np.nan)
+
+
+class OnlineMetrics:
+    """
+    Indicatori di più run (ad esempio le strategie di un batch), aggiornati una settimana
+    alla volta: drawdown e massimo drawdown della equity line in USD, Sharpe ratio, Sortino
+    ratio e volatilità delle equity line in USD e BTC, Calmar ratio (rendimento annuo composto
+    su massimo drawdown percentuale) e turnover annualizzato (controvalore delle transazioni
+    sul valore medio del portafoglio, in percentuale).
+    [Vectorized online risk/return metrics.]
+    """
+
+    def __init__(self, runs_number=1):
+        self.usd = ReturnsAccumulator(runs_number)
+        self.btc = ReturnsAccumulator(runs_number)
+        self.expanding_max = np.full(runs_number, -np.inf)
+        self.max_drawdown = np.zeros(runs_number)
+        self.max_drawdown_perc = np.zeros(runs_number)
+        self.weeks = np.zeros(runs_number, dtype=np.int64)
+        self.amount_usd_sum = np.zeros(runs_number)
+        self.transactions_amount_usd_sum = np.zeros(runs_number)
+
+    def update(self, amount_usd, amount_btc, transactions_amount_usd, run_idx=None):
+        """
+        Aggiunge i valori di una settimana dei run specificati (tutti se non specificati).
+        Restituisce gli indicatori aggiornati (nome -> array con un valore per run, vedi METRICS_VALUES).
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.update_runs(amount_usd, amount_btc, transactions_amount_usd, slice(None) if run_idx is None else run_idx)
+
+    def update_runs(self, amount_usd, amount_btc, transactions_amount_usd, run_idx):
+        """
+        Aggiornamento degli indicatori (le divisioni per zero producono NaN o inf, senza avvisi).
+        """
+        step = {}
+        step['amount_usd_weekly_returns'] = self.usd.update(amount_usd, run_idx)
+        step['amount_btc_weekly_returns'] = self.btc.update(amount_btc, run_idx)
+
+        expanding_max = np.fmax(self.expanding_max[run_idx], amount_usd)
+        drawdown = amount_usd - expanding_max
+        drawdown_perc = drawdown / expanding_max * PERC_FACTOR
+        first_week = self.weeks[run_idx] == 0
+        max_drawdown = np.where(first_week, drawdown, np.fmin(self.max_drawdown[run_idx], drawdown))
+        max_drawdown_perc = np.where(first_week, drawdown_perc, np.fmin(self.max_drawdown_perc[run_idx], drawdown_perc))
+        self.expanding_max[run_idx] = expanding_max
+        self.max_drawdown[run_idx] = max_drawdown
+        self.max_drawdown_perc[run_idx] = max_drawdown_perc
+        step['expanding_max'] = expanding_max
+        step['drawdown'] = drawdown
+        step['drawdown_perc'] = drawdown_perc
+        step['max_drawdown'] = max_drawdown
+        step['max_drawdown_perc'] = max_drawdown_perc
+
+        step['amount_usd_sharpe_ratio'] = self.usd.get_sharpe(run_idx)
+        step['amount_btc_sharpe_ratio'] = self.btc.get_sharpe(run_idx)
+        step['amount_usd_sortino_ratio'] = self.usd.get_sortino(run_idx)
+        step['amount_btc_sortino_ratio'] = self.btc.get_sortino(run_idx)
+        step['amount_usd_volatility'] = self.usd.get_volatility(run_idx)
+        step['amount_btc_volatility'] = self.btc.get_volatility(run_idx)
+        step['calmar_ratio'] = np.where(max_drawdown_perc < 0, self.usd.get_annualized_return(run_idx) / np.abs(max_drawdown_perc), np.nan)
+
+        weeks = self.weeks[run_idx] + 1
+        self.weeks[run_idx] = weeks
+        self.amount_usd_sum[run_idx] += amount_usd
+        self.transactions_amount_usd_sum[run_idx] += transactions_amount_usd
+        mean_amount_usd = self.amount_usd_sum[run_idx] / weeks
+        step['turnover'] = self.transactions_amount_usd_sum[run_idx] / mean_amount_usd * PERIODS_PER_YEAR / weeks * PERC_FACTOR
+        return step
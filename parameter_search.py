@@ -0,0 +1,80 @@
+"""
+parameter_search.py
+    Ricerca adattiva della migliore configurazione fra un insieme di strategie (successive
+    halving), in alternativa al test completo di tutte le combinazioni di parametri: tutte le
+    strategie vengono prima testate (insieme, con batch_backtest) sulle prime settimane del
+    periodo, e solo la frazione migliore secondo l'indicatore scelto passa al turno
+    successivo, con un periodo più lungo, fino all'ultimo turno sull'intero periodo.
+"""
+import math
+
+import numpy as np
+
+from batch_backtest import simulate_batch
+from commons import daterange, PERC_FACTOR
+
+# Indicatori utilizzabili per confrontare le strategie (valori maggiori sono migliori)
+SEARCH_OBJECTIVES = ['amount_usd_sharpe_ratio', 'amount_usd_sortino_ratio', 'roi_usd', 'max_drawdown_perc', 'calmar_ratio']
+# Valori riportati per ogni strategia (alla fine del periodo su cui è stata testata)
+SEARCH_VALUES = ['roi_usd', 'max_drawdown_perc', 'amount_usd_sharpe_ratio', 'amount_usd_sortino_ratio', 'calmar_ratio']
+
+
+def halving_schedule(candidates_number, total_weeks, eta, min_weeks):
+    """
+    Restituisce le settimane testate in ciascun turno (crescenti, l'ultimo pari a total_weeks):
+    ogni turno dura eta volte il precedente, il primo almeno min_weeks settimane, ed i turni
+    sono al più quanti servono per ridurre i candidati ad uno (dividendoli ogni volta per eta).
+    """
+    rungs = 0
+    while total_weeks / eta ** (rungs + 1) >= min_weeks and candidates_number / eta ** (rungs + 1) >= 1:
+        rungs += 1
+    return [math.ceil(total_weeks / eta ** (rungs - rung)) for rung in range(rungs + 1)]
+
+
+def get_values(values, initial_amount_usd):
+    """
+    Restituisce i valori dell'ultima settimana di un test (vedi SEARCH_VALUES).
+    """
+    last = {name: float(values[name][-1]) for name in SEARCH_VALUES if name != 'roi_usd'}
+    last['roi_usd'] = (float(values['amount_usd'][-1]) - initial_amount_usd) / initial_amount_usd * PERC_FACTOR
+    return last
+
+
+def search_strategies(panel, weights_table, strategies, start_date, end_date, initial_amount_usd, objective,
+                      eta=3, min_weeks=13, keep=1, profiler=None):
+    """
+    Ricerca con successive halving della strategia migliore secondo l'indicatore objective
+    (vedi SEARCH_OBJECTIVES) fra quelle specificate, dalla data di inizio indicata: ad ogni
+    turno (vedi halving_schedule) proseguono la frazione 1 / eta dei candidati (almeno keep)
+    con i valori migliori; i valori non definiti sono considerati i peggiori.
+    Restituisce per ogni strategia un dizionario con le settimane su cui è stata testata
+    ('weeks'), l'eventuale test sull'intero periodo ('full_period') ed i valori alla fine di
+    tali settimane (vedi SEARCH_VALUES), oltre al numero di settimane simulate ed al numero di
+    settimane che richiederebbe il test completo di tutte le strategie.
+    """
+    dates = [date for date in daterange(start_date, end_date, 7) if date in panel.week_index]
+    total_weeks = len(dates)
+    candidates = [{'weeks': 0, 'full_period': False} for _ in strategies]
+    if total_weeks == 0:
+        return candidates, 0, 0
+
+    survivors = list(range(len(strategies)))
+    simulated_weeks = 0
+    schedule = halving_schedule(len(strategies), total_weeks, eta, min_weeks)
+    for rung, weeks in enumerate(schedule):
+        runs = [(strategies[idx], start_date) for idx in survivors]
+        batch_results = simulate_batch(panel, weights_table, runs, dates[weeks - 1], initial_amount_usd, profiler)
+        scores = np.full(len(survivors), -np.inf)
+        for position, (idx, (run_dates, values)) in enumerate(zip(survivors, batch_results)):
+            simulated_weeks += len(run_dates)
+            candidates[idx]['weeks'] = len(run_dates)
+            candidates[idx]['full_period'] = weeks == total_weeks
+            if len(run_dates):
+                candidates[idx].update(get_values(values, initial_amount_usd))
+                score = candidates[idx][objective]
+                scores[position] = score if np.isfinite(score) else -np.inf
+        if rung < len(schedule) - 1:
+            kept = max(keep, math.ceil(len(survivors) / eta))
+            order = np.argsort(-scores, kind='stable')
+            survivors = sorted(survivors[position] for position in order[:kept])
+    return candidates, simulated_weeks, total_weeks * len(strategies)
@@ -0,0 +1,142 @@
+"""
+pipeline.py
+    Elaborazione a flusso (pipeline) di una sequenza di elementi attraverso più fasi, ciascuna
+    con i propri thread worker, collegate da code di dimensione limitata: una fase lenta
+    blocca le precedenti (backpressure) invece di accumulare elementi in memoria.
+    Per ogni fase vengono misurati elementi elaborati, errori, latenza e tempo di attesa
+    sulla coda successiva.
+"""
+import queue
+import threading
+import time
+
+# Marcatore di fine flusso inviato ai worker di una fase
+END_OF_STREAM = object()
+
+
+class StageStats:
+    """
+    Contatori di una fase della pipeline.
+    [Per-stage throughput and latency counters.]
+    """
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        # Tempo complessivo di elaborazione, latenza massima ed attesa sulla coda successiva (secondi)
+        self.busy_time = 0.0
+        self.max_latency = 0.0
+        self.blocked_time = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, latency, blocked=0.0, error=False):
+        with self.lock:
+            self.items += 1
+            self.errors += 1 if error else 0
+            self.busy_time += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.blocked_time += blocked
+
+    def get_report(self, elapsed):
+        """
+        Restituisce una riga di riepilogo: throughput (elementi al secondo sul tempo totale),
+        latenza media e massima, utilizzo dei worker ed attesa per backpressure.
+        """
+        mean_latency = self.busy_time / self.items if self.items else 0.0
+        utilization = self.busy_time / (elapsed * self.workers) * 100 if elapsed > 0 else 0.0
+        return "%-10s workers %3d  items %6d  errors %4d  %8.2f items/s  latency mean %8.1f ms max %8.1f ms  busy %5.1f%%  blocked %7.2f s" % (
+            self.name, self.workers, self.items, self.errors, self.items / elapsed if elapsed > 0 else 0.0,
+            mean_latency * 1000, self.max_latency * 1000, utilization, self.blocked_time)
+
+
+class Pipeline:
+    """
+    Pipeline di fasi collegate da code limitate.
+    Ogni fase è una funzione function(chiave, valore) che restituisce il valore per la fase
+    successiva; il valore iniziale di ogni elemento è l'elemento stesso (che ne è anche la
+    chiave). Un'eccezione in una fase termina l'elaborazione dell'elemento.
+    [Bounded-queue, multi-stage streaming pipeline.]
+    """
+
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stages = []
+        self.stats = []
+        self.elapsed = 0.0
+
+    def add_stage(self, name, function, workers=1):
+        self.stages.append((function, workers))
+        self.stats.append(StageStats(name, workers))
+
+    def run(self, items):
+        """
+        Elabora gli elementi. Restituisce, nell'ordine di completamento, le coppie
+        (elemento, risultato dell'ultima fase) oppure (elemento, eccezione).
+        """
+        items = list(items)
+        start = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = queue.Queue()
+        threads = []
+
+        def close_stage(stage_idx):
+            for _ in range(self.stages[stage_idx][1]):
+                queues[stage_idx].put(END_OF_STREAM)
+
+        def feed():
+            for item in items:
+                queues[0].put((item, item))
+            close_stage(0)
+
+        def work(stage_idx, remaining, lock):
+            function = self.stages[stage_idx][0]
+            stats = self.stats[stage_idx]
+            last_stage = stage_idx == len(self.stages) - 1
+            while True:
+                task = queues[stage_idx].get()
+                if task is END_OF_STREAM:
+                    break
+                key, value = task
+                task_start = time.perf_counter()
+                try:
+                    output = function(key, value)
+                except Exception as e:
+                    stats.add(time.perf_counter() - task_start, error=True)
+                    results.put((key, e))
+                    continue
+                latency = time.perf_counter() - task_start
+                if last_stage:
+                    results.put((key, output))
+                    stats.add(latency)
+                else:
+                    queues[stage_idx + 1].put((key, output))
+                    stats.add(latency, blocked=time.perf_counter() - task_start - latency)
+            # L'ultimo worker della fase chiude la fase successiva
+            with lock:
+                remaining[0] -= 1
+                closing = remaining[0] == 0
+            if closing and not last_stage:
+                close_stage(stage_idx + 1)
+
+        threads.append(threading.Thread(target=feed, daemon=True))
+        for stage_idx, (_, workers) in enumerate(self.stages):
+            remaining, lock = [workers], threading.Lock()
+            for _ in range(workers):
+                threads.append(threading.Thread(target=work, args=(stage_idx, remaining, lock), daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(len(items)):
+                yield results.get()
+        finally:
+            self.elapsed = time.perf_counter() - start
+        for thread in threads:
+            thread.join()
+
+    def get_report(self):
+        """
+        Restituisce le righe di riepilogo di tutte le fasi.
+        """
+        return [stats.get_report(self.elapsed) for stats in self.stats]
@@ -0,0 +1,111 @@
+"""
+profiling.py
+    Misura del tempo (wall time) e delle allocazioni di memoria per fase dell'elaborazione
+    (caricamento dei dati, pesi, simulazione, indicatori, esportazione), con un riepilogo
+    finale. Se disabilitato, il costo delle chiamate è trascurabile.
+"""
+import sys
+import time
+
+
+class Profiler:
+    """
+    Tempo complessivo, numero di esecuzioni e variazione dei blocchi di memoria allocati
+    (sys.getallocatedblocks) per ogni fase. Le fasi possono essere delimitate con il context
+    manager phase() oppure, nei cicli, con switch() (che chiude la fase corrente ed apre la
+    successiva) e stop(). Le fasi non vanno annidate.
+    [Per-phase wall time and allocation counters.]
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stats = {}
+        self.current = None
+        self.start_time = 0.0
+        self.start_blocks = 0
+
+    def reset(self):
+        self.stats = {}
+        self.current = None
+
+    def switch(self, name):
+        """
+        Chiude la fase corrente (se presente) ed inizia la fase specificata.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        blocks = sys.getallocatedblocks()
+        if self.current is not None:
+            self.add(self.current, now - self.start_time, blocks - self.start_blocks)
+        self.current = name
+        self.start_time = now
+        self.start_blocks = blocks
+
+    def stop(self):
+        """
+        Chiude la fase corrente (se presente).
+        """
+        if not self.enabled or self.current is None:
+            return
+        self.add(self.current, time.perf_counter() - self.start_time, sys.getallocatedblocks() - self.start_blocks)
+        self.current = None
+
+    def phase(self, name):
+        """
+        Context manager che misura la fase specificata.
+        """
+        return ProfilerPhase(self, name)
+
+    def add(self, name, seconds, blocks, calls=1):
+        entry = self.stats.setdefault(name, [0, 0.0, 0])
+        entry[0] += calls
+        entry[1] += seconds
+        entry[2] += blocks
+
+    def get_stats(self):
+        """
+        Restituisce i contatori delle fasi (nome -> [esecuzioni, secondi, blocchi allocati]).
+        """
+        return {name: list(entry) for name, entry in self.stats.items()}
+
+    def merge(self, stats):
+        """
+        Aggiunge i contatori di un altro profiler (ad esempio di un processo worker).
+        """
+        for name, (calls, seconds, blocks) in stats.items():
+            self.add(name, seconds, blocks, calls)
+
+    def get_report(self, elapsed, order=()):
+        """
+        Restituisce le righe del riepilogo: per ogni fase esecuzioni, tempo complessivo,
+        percentuale del tempo totale elapsed, tempo medio e blocchi di memoria allocati
+        (al netto di quelli liberati). Le fasi sono elencate nell'ordine specificato e poi
+        per nome. Con più processi worker i tempi sono sommati su tutti i processi.
+        """
+        names = [name for name in order if name in self.stats] + sorted(name for name in self.stats if name not in order)
+        lines = ["%-10s %10s %10s %7s %12s %14s" % ("phase", "calls", "time (s)", "%", "mean (us)", "alloc blocks")]
+        for name in names:
+            calls, seconds, blocks = self.stats[name]
+            lines.append("%-10s %10d %10.3f %6.1f%% %12.1f %14d" % (name, calls, seconds, seconds / elapsed * 100 if elapsed > 0 else 0.0,
+                                                                 seconds / calls * 1e6 if calls else 0.0, blocks))
+        lines.append("%-10s %10s %10.3f" % ("total", "", elapsed))
+        return lines
+
+
+class ProfilerPhase:
+    """
+    Context manager di una fase del profiler.
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.switch(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.stop()
+        return False
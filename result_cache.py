@@ -0,0 +1,133 @@
+"""
+result_cache.py
+    Cache dei risultati dei test delle strategie, indirizzata per contenuto: la chiave è
+    l'hash dei parametri del test (strategia, fee, capitale iniziale, periodo) e degli hash
+    dei file sorgente delle settimane analizzate, per cui un risultato non viene mai servito
+    se i dati da cui è stato calcolato sono cambiati.
+    La dimensione complessiva della cache è limitata: oltre il limite vengono rimossi i
+    risultati usati meno di recente (LRU).
+"""
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+
+from commons import atomic_output_path, make_dir_if_not_exists
+
+# Nome della sottocartella (della cartella della cache dei dati) che contiene i risultati
+RESULT_CACHE_DIR_NAME = "results"
+# Versione del formato dei risultati (fa parte della chiave)
+RESULT_CACHE_VERSION = 3
+# Dimensione massima predefinita della cache (MB)
+DEFAULT_MAX_MB = 256
+# Estensione dei file dei risultati
+RESULT_FILE_SUFFIX = ".pkl"
+
+
+def result_key(parameters, digests):
+    """
+    Calcola la chiave di un risultato a partire dai parametri del test (dizionario
+    serializzabile in JSON) e dagli hash dei file sorgente (data -> hash, None per le
+    settimane non disponibili).
+    """
+    content = {
+        'version': RESULT_CACHE_VERSION,
+        'parameters': parameters,
+        'digests': [[date.strftime("%Y-%m-%d"), digest] for date, digest in sorted(digests.items())]
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache su disco dei risultati dei test (un file per risultato).
+    L'ultimo utilizzo di un risultato è registrato come data di modifica del suo file.
+    [Content-addressed, size-bounded LRU cache of strategy test results.]
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_bytes = max_bytes
+        # Statistiche di utilizzo
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.evictions = 0
+
+    def get_entry_path(self, key):
+        return pathlib.Path(self.cache_dir, key + RESULT_FILE_SUFFIX)
+
+    def get(self, key):
+        """
+        Restituisce il risultato con la chiave specificata (None se non presente).
+        """
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(str(entry_path), "rb") as entry_file:
+                data = entry_file.read()
+            entry = pickle.loads(data)
+            os.utime(str(entry_path))
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_read += len(data)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Salva un risultato (in modo atomico, per l'uso da più processi).
+        """
+        make_dir_if_not_exists(self.cache_dir)
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        with atomic_output_path(self.get_entry_path(key)) as output_path:
+            with open(str(output_path), "wb") as entry_file:
+                entry_file.write(data)
+
+    def get_entries(self):
+        """
+        Restituisce le coppie (percorso, stat) dei risultati presenti in cache.
+        """
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for entry_path in self.cache_dir.glob("*" + RESULT_FILE_SUFFIX):
+            # I file temporanei (in scrittura) non fanno parte della cache
+            if entry_path.name.startswith("."):
+                continue
+            try:
+                entries.append((entry_path, entry_path.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def evict(self):
+        """
+        Rimuove i risultati usati meno di recente fino a rientrare nella dimensione massima.
+        """
+        entries = sorted(self.get_entries(), key=lambda entry: entry[1].st_mtime_ns)
+        size = sum(stat.st_size for _, stat in entries)
+        for entry_path, stat in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                entry_path.unlink()
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+
+    def get_stats(self):
+        """
+        Restituisce le statistiche di utilizzo e l'occupazione corrente della cache.
+        """
+        entries = self.get_entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes_read': self.bytes_read,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(stat.st_size for _, stat in entries)
+        }
@@ -0,0 +1,223 @@
+"""
+results_store.py
+    Archivio dei risultati dei test in un unico database SQLite, in sostituzione dei file
+    Excel: per ogni test vengono salvati il riepilogo (una riga della tabella dei test) ed i
+    valori settimanali in formato colonnare (un array binario NumPy per ogni colonna), per ogni
+    suite l'elenco ordinato dei test. I file JSON per la pagina Web vengono generati
+    direttamente dall'archivio; l'esportazione su Excel è facoltativa.
+"""
+import datetime
+import json
+import pathlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from commons import atomic_output_path
+
+# Nome predefinito del database (nella cartella dei dati)
+RESULTS_STORE_NAME = "results.sqlite"
+# Colonne del riepilogo di un test (nell'ordine dei file di riepilogo) e relativo tipo SQLite
+SUMMARY_COLUMNS = [('start_date', 'TEXT'), ('end_date', 'TEXT'), ('initial_amount_usd', 'INTEGER'), ('crypto_number', 'INTEGER'),
+                   ('weight_cap_perc', 'INTEGER'), ('rebalance_period_weeks', 'INTEGER'), ('profit_usd', 'REAL'), ('profit_btc', 'REAL'),
+                   ('roi_usd', 'REAL'), ('roi_btc', 'REAL'), ('tot_transactions_number', 'INTEGER'),
+                   ('tot_transactions_amount_usd', 'REAL'), ('tot_transactions_amount_btc', 'REAL'),
+                   ('tot_transaction_fees_usd', 'REAL'), ('tot_transaction_fees_btc', 'REAL'),
+                   ('max_drawdown', 'REAL'), ('max_drawdown_perc', 'REAL'), ('amount_usd_sharpe_ratio', 'REAL'), ('amount_btc_sharpe_ratio', 'REAL'),
+                   ('amount_usd_sortino_ratio', 'REAL'), ('amount_btc_sortino_ratio', 'REAL'), ('amount_usd_volatility', 'REAL'),
+                   ('amount_btc_volatility', 'REAL'), ('calmar_ratio', 'REAL'), ('turnover', 'REAL')]
+# Colonne del riepilogo che contengono date
+DATE_COLUMNS = ['start_date', 'end_date']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    name TEXT PRIMARY KEY,
+    %s,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS test_series (
+    name TEXT NOT NULL,
+    series TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (name, series)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS suites (
+    name TEXT PRIMARY KEY,
+    tests TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+""" % ",\n    ".join("%s %s" % column for column in SUMMARY_COLUMNS)
+
+
+def convert_summary_value(value, column_type):
+    """
+    Converte un valore del riepilogo (anche di tipo NumPy o data) nel tipo SQLite.
+    """
+    if value is None:
+        return None
+    if column_type == 'TEXT':
+        return value.strftime("%Y-%m-%d") if isinstance(value, (datetime.date, pd.Timestamp)) else str(value)
+    return int(value) if column_type == 'INTEGER' else float(value)
+
+
+def to_column_array(values):
+    """
+    Converte una colonna di valori settimanali in un array NumPy (le date in datetime64[D]).
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype('datetime64[D]')
+    return np.ascontiguousarray(values)
+
+
+def write_json_values(values, json_file_path):
+    """
+    Scrive una serie di valori su file JSON (lista di valori, in modo atomico).
+    """
+    with atomic_output_path(json_file_path) as output_path:
+        pd.Series(values).to_json(path_or_buf=output_path, orient='values')
+
+
+def write_json_records(dataframe, json_file_path):
+    """
+    Scrive una tabella su file JSON (lista di record, in modo atomico).
+    """
+    with atomic_output_path(json_file_path) as output_path:
+        dataframe.to_json(path_or_buf=output_path, orient='records')
+
+
+class ResultsStore:
+    """
+    Database SQLite con i risultati (riepiloghi e valori settimanali) dei test delle strategie.
+    [Columnar SQLite results store.]
+    """
+
+    def __init__(self, store_path):
+        self.store_path = pathlib.Path(store_path)
+
+    def connect(self):
+        """
+        Apre una connessione al database, creando le tabelle se non esistono.
+        Più processi possono scrivere contemporaneamente: le scritture attendono il lock.
+        """
+        connection = sqlite3.connect(str(self.store_path), timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        # Colonne del riepilogo aggiunte dopo la creazione del database
+        existing = set(row[1] for row in connection.execute("PRAGMA table_info(tests)"))
+        for column, column_type in SUMMARY_COLUMNS:
+            if column not in existing:
+                connection.execute("ALTER TABLE tests ADD COLUMN %s %s" % (column, column_type))
+        return connection
+
+    def put_test(self, name, summary, series):
+        """
+        Salva (sostituendo quelli eventualmente presenti) riepilogo e valori settimanali di un
+        test in una singola transazione. series è un dizionario (o DataFrame) colonna -> valori.
+        """
+        columns = [to_column_array(series[column]) for column in series]
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO tests (name, %s, updated_at) VALUES (%s)" % (
+                    ", ".join(column for column, _ in SUMMARY_COLUMNS), ", ".join("?" * (len(SUMMARY_COLUMNS) + 2))),
+                    [name] + [convert_summary_value(summary.get(column), column_type) for column, column_type in SUMMARY_COLUMNS] +
+                    [datetime.datetime.now().isoformat()])
+                connection.execute("DELETE FROM test_series WHERE name = ?", (name,))
+                connection.executemany("INSERT INTO test_series (name, series, dtype, data) VALUES (?, ?, ?, ?)",
+                                       [(name, str(column), values.dtype.str, values.tobytes()) for column, values in zip(series, columns)])
+        finally:
+            connection.close()
+
+    def put_suite(self, name, test_names):
+        """
+        Salva l'elenco ordinato dei test di una suite.
+        """
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO suites (name, tests, updated_at) VALUES (?, ?, ?)",
+                                   (name, json.dumps(list(test_names)), datetime.datetime.now().isoformat()))
+        finally:
+            connection.close()
+
+    def has_test(self, name):
+        connection = self.connect()
+        try:
+            return connection.execute("SELECT 1 FROM tests WHERE name = ?", (name,)).fetchone() is not None
+        finally:
+            connection.close()
+
+    def get_test_names(self):
+        connection = self.connect()
+        try:
+            return [row[0] for row in connection.execute("SELECT name FROM tests ORDER BY name")]
+        finally:
+            connection.close()
+
+    def get_suite_names(self):
+        connection = self.connect()
+        try:
+            return [row[0] for row in connection.execute("SELECT name FROM suites ORDER BY name")]
+        finally:
+            connection.close()
+
+    def get_series(self, name, series_names=None):
+        """
+        Restituisce i valori settimanali di un test (colonna -> array NumPy), limitati alle
+        colonne specificate (tutte se non specificate). KeyError se il test non è presente.
+        """
+        connection = self.connect()
+        try:
+            if series_names is None:
+                cursor = connection.execute("SELECT series, dtype, data FROM test_series WHERE name = ?", (name,))
+            else:
+                cursor = connection.execute("SELECT series, dtype, data FROM test_series WHERE name = ? AND series IN (%s)" %
+                                            ", ".join("?" * len(series_names)), [name] + list(series_names))
+            series = {column: np.frombuffer(data, dtype=np.dtype(dtype)) for column, dtype, data in cursor}
+        finally:
+            connection.close()
+        if not series:
+            raise KeyError("Test %s not found in %s" % (name, self.store_path))
+        return series
+
+    def get_summaries(self, test_names):
+        """
+        Restituisce un DataFrame con i riepiloghi dei test specificati (nello stesso ordine;
+        i test non presenti vengono ignorati).
+        """
+        connection = self.connect()
+        try:
+            rows = {}
+            for offset in range(0, len(test_names), 500):
+                names = test_names[offset:offset + 500]
+                cursor = connection.execute("SELECT name, %s FROM tests WHERE name IN (%s)" % (
+                    ", ".join(column for column, _ in SUMMARY_COLUMNS), ", ".join("?" * len(names))), names)
+                rows.update((row[0], row[1:]) for row in cursor)
+        finally:
+            connection.close()
+        summaries = pd.DataFrame([rows[name] for name in test_names if name in rows], columns=[column for column, _ in SUMMARY_COLUMNS])
+        for column in DATE_COLUMNS:
+            summaries[column] = pd.to_datetime(summaries[column])
+        return summaries
+
+    def get_suite_test_names(self, name):
+        """
+        Restituisce l'elenco ordinato dei test di una suite (KeyError se non presente).
+        """
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT tests FROM suites WHERE name = ?", (name,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            raise KeyError("Suite %s not found in %s" % (name, self.store_path))
+        return json.loads(row[0])
+
+    def get_suite(self, name):
+        """
+        Restituisce il DataFrame con i riepiloghi dei test di una suite (KeyError se non presente).
+        """
+        return self.get_summaries(self.get_suite_test_names(name))
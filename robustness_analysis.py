@@ -0,0 +1,98 @@
+"""
+robustness_analysis.py
+    Analisi di robustezza dei risultati di un insieme di strategie (bootstrap a blocchi):
+    a partire dai rendimenti settimanali delle equity line in USD (StrategyTestResult) vengono
+    generati molti percorsi alternativi ricampionando a blocchi le settimane del periodo
+    testato, e per ogni percorso vengono calcolati rendimento, massimo drawdown e Sharpe ratio.
+    Le settimane ricampionate sono le stesse per tutte le strategie (un percorso corrisponde ad
+    una sequenza alternativa del mercato), per cui le strategie restano confrontabili percorso
+    per percorso; tutti i percorsi e le strategie vengono valutati insieme con operazioni
+    vettoriali. A parità di seed i risultati sono identici.
+"""
+import numpy as np
+
+from commons import PERC_FACTOR
+from metrics import PERIODS_PER_YEAR
+
+# Valori calcolati per ogni percorso
+ROBUSTNESS_VALUES = ['roi_usd', 'max_drawdown_perc', 'amount_usd_sharpe_ratio']
+# Numero massimo di valori (percorsi x settimane x strategie) elaborati insieme
+CHUNK_VALUES = 4000000
+
+
+def block_bootstrap_indices(rng, weeks_number, paths_number, block_weeks):
+    """
+    Restituisce la matrice (percorsi x settimane) degli indici delle settimane ricampionate
+    con il bootstrap a blocchi circolare: ogni percorso è formato da blocchi di block_weeks
+    settimane consecutive (proseguendo dall'inizio del periodo dopo l'ultima settimana), con
+    inizio scelto a caso. Con block_weeks pari a 1 le settimane vengono ricampionate
+    indipendentemente.
+    """
+    blocks_number = -(-weeks_number // block_weeks)
+    starts = rng.integers(0, weeks_number, size=(paths_number, blocks_number))
+    indices = (starts[:, :, np.newaxis] + np.arange(block_weeks)) % weeks_number
+    return indices.reshape(paths_number, -1)[:, :weeks_number]
+
+
+def evaluate_paths(returns, first_amount_usd, indices, initial_amount_usd):
+    """
+    Calcola i valori di ciascun percorso (vedi ROBUSTNESS_VALUES) per ogni strategia.
+    returns è la matrice (settimane x strategie) dei rendimenti settimanali, first_amount_usd
+    il valore di ogni strategia alla prima settimana (da cui partono i percorsi), indices la
+    matrice (percorsi x settimane) delle settimane ricampionate.
+    Restituisce un dizionario nome -> matrice (percorsi x strategie).
+    """
+    path_returns = returns[indices]
+    amount_usd = first_amount_usd * np.cumprod(1 + path_returns, axis=1)
+    values = {}
+    values['roi_usd'] = (amount_usd[:, -1] - initial_amount_usd) / initial_amount_usd * PERC_FACTOR
+    # Il massimo progressivo parte dal valore della prima settimana, come in OnlineMetrics
+    expanding_max = np.maximum(np.maximum.accumulate(amount_usd, axis=1), first_amount_usd)
+    values['max_drawdown_perc'] = np.minimum((amount_usd / expanding_max - 1).min(axis=1) * PERC_FACTOR, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values['amount_usd_sharpe_ratio'] = np.sqrt(PERIODS_PER_YEAR) * path_returns.mean(axis=1) / path_returns.std(axis=1, ddof=1)
+    return values
+
+
+def simulate_bootstrap(results, initial_amount_usd, paths_number, block_weeks, seed=0):
+    """
+    Valuta le strategie (risultati dei test con le stesse date) su paths_number percorsi
+    ricampionati con il bootstrap a blocchi (vedi block_bootstrap_indices).
+    Restituisce i valori storici (nome -> array con un valore per strategia) ed i valori dei
+    percorsi (nome -> matrice percorsi x strategie).
+    """
+    amount_usd = np.array([result.amount_usd for result in results], dtype=float).T
+    first_amount_usd = amount_usd[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = amount_usd[1:] / amount_usd[:-1] - 1
+    returns = np.where(np.isfinite(returns), returns, 0.0)
+    weeks_number = len(returns)
+
+    historical = evaluate_paths(returns, first_amount_usd, np.arange(weeks_number)[np.newaxis, :], initial_amount_usd)
+    historical = {name: values[0] for name, values in historical.items()}
+    if weeks_number == 0:
+        return historical, {name: np.full((paths_number, len(results)), np.nan) for name in ROBUSTNESS_VALUES}
+
+    # Indici generati tutti insieme, per cui i risultati non dipendono dalla suddivisione in blocchi
+    indices = block_bootstrap_indices(np.random.default_rng(seed), weeks_number, paths_number, block_weeks)
+    chunk_paths = max(1, CHUNK_VALUES // (weeks_number * max(len(results), 1)))
+    paths = {name: np.empty((paths_number, len(results))) for name in ROBUSTNESS_VALUES}
+    for first_path in range(0, paths_number, chunk_paths):
+        chunk = slice(first_path, first_path + chunk_paths)
+        for name, values in evaluate_paths(returns, first_amount_usd, indices[chunk], initial_amount_usd).items():
+            paths[name][chunk] = values
+    return historical, paths
+
+
+def get_confidence_interval(values, confidence_perc):
+    """
+    Restituisce media, mediana ed estremi dell'intervallo di confidenza (percentili) dei valori
+    dei percorsi di una strategia, ignorando i valori non definiti (NaN o infiniti).
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {'mean': np.nan, 'median': np.nan, 'ci_low': np.nan, 'ci_high': np.nan}
+    tail_perc = (100 - confidence_perc) / 2
+    return {'mean': float(np.mean(values)), 'median': float(np.median(values)),
+            'ci_low': float(np.percentile(values, tail_perc)), 'ci_high': float(np.percentile(values, 100 - tail_perc))}
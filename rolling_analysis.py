@@ -0,0 +1,139 @@
+"""
+rolling_analysis.py
+    Analisi walk-forward di un insieme di strategie: ogni strategia viene testata a partire da
+    ogni settimana di un intervallo di date di inizio, fino alla data finale oppure su finestre
+    di lunghezza fissa, e per ciascuna finestra vengono calcolati rendimento, massimo drawdown
+    e Sharpe ratio.
+    Tutte le finestre vengono simulate insieme (batch_backtest) in un'unica passata sulle
+    settimane, condividendo pesi, prezzi e righe degli snapshot. Le operazioni del test sono
+    omogenee nel capitale: per ogni strategia e fase del ribilanciamento viene simulato per
+    intero solo il run che inizia per primo, mentre gli altri vengono simulati finché le
+    quantità detenute non diventano proporzionali alle sue (dopo pochi ribilanciamenti, o
+    subito in assenza di commissioni) e proseguono poi come copie riscalate di esso.
+"""
+import bisect
+import datetime
+
+import numpy as np
+
+from batch_backtest import simulate_batch
+from commons import daterange, PERC_FACTOR
+from metrics import OnlineMetrics
+
+# Valori calcolati per ogni finestra
+ROLLING_VALUES = ['roi_usd', 'max_drawdown_perc', 'amount_usd_sharpe_ratio']
+# Statistiche della distribuzione dei valori fra le finestre (nome -> percentile; media e
+# deviazione standard non sono percentili)
+ROLLING_STATISTICS = {'mean': None, 'std': None, 'min': 0, 'p5': 5, 'p25': 25, 'median': 50, 'p75': 75, 'p95': 95, 'max': 100}
+# Valori settimanali delle finestre ricostruiti dal run di riferimento
+SERIES_VALUES = ['amount_usd', 'amount_btc', 'transactions_amount_usd']
+
+
+def rolling_windows(dates, first_start_date, last_start_date, end_date, window_weeks=None, step_weeks=1):
+    """
+    Restituisce le finestre analizzate, come coppie (indice della settimana iniziale, indice
+    della settimana finale) nelle date specificate (ordinate, ad esempio quelle del pannello):
+    una finestra ogni step_weeks settimane fra first_start_date e last_start_date (le date
+    non presenti vengono saltate). Le finestre terminano alla data finale o, se window_weeks è
+    specificato, dopo window_weeks settimane (solo le finestre complete entro la data finale).
+    """
+    week_index = {date: idx for idx, date in enumerate(dates)}
+    windows = []
+    for start_date in daterange(first_start_date, min(last_start_date, end_date), 7 * step_weeks):
+        if start_date not in week_index:
+            continue
+        window_end_date = end_date
+        if window_weeks is not None:
+            window_end_date = start_date + datetime.timedelta(weeks=window_weeks - 1)
+            if window_end_date > end_date:
+                break
+        windows.append((week_index[start_date], bisect.bisect_right(dates, window_end_date) - 1))
+    return windows
+
+
+def simulate_rolling(panel, weights_table, strategies, windows, initial_amount_usd, profiler=None):
+    """
+    Esegue il test di ciascuna strategia su ciascuna finestra (vedi rolling_windows).
+    Restituisce per ogni strategia un dizionario nome -> array con un valore per finestra
+    (vedi ROLLING_VALUES), il numero di settimane effettivamente simulate ed il numero di
+    settimane che richiederebbe il test separato di ogni finestra.
+    """
+    # Un run per ogni strategia e finestra: il primo run di ogni fase del ribilanciamento è il
+    # riferimento degli altri e prosegue fino all'ultima settimana delle finestre della fase
+    runs = []
+    end_dates = []
+    proportional_to = []
+    for strategy in strategies:
+        period = strategy.rebalance_period_weeks
+        phase_end = {}
+        for start_idx, end_idx in windows:
+            phase_end[start_idx % period] = max(phase_end.get(start_idx % period, end_idx), end_idx)
+        references = {}
+        for start_idx, end_idx in windows:
+            phase = start_idx % period
+            if phase in references:
+                proportional_to.append(references[phase])
+            else:
+                references[phase] = len(runs)
+                proportional_to.append(-1)
+                end_idx = phase_end[phase]
+            runs.append((strategy, panel.dates[start_idx]))
+            end_dates.append(panel.dates[end_idx])
+    proportional_to = np.array(proportional_to, dtype=np.int64)
+    batch_results = simulate_batch(panel, weights_table, runs, None, initial_amount_usd, profiler, end_dates, proportional_to)
+
+    # Valori settimanali di ogni run (settimane dalla prima data di inizio x run)
+    first_week = min([start_idx for start_idx, _ in windows], default=0)
+    window_start = np.array([start_idx for start_idx, _ in windows] * len(strategies), dtype=np.int64) - first_week
+    window_end = np.array([end_idx for _, end_idx in windows] * len(strategies), dtype=np.int64) - first_week
+    weeks_number = int(window_end.max()) + 1 if len(runs) else 0
+    series = {name: np.full((weeks_number, len(runs)), np.nan) for name in SERIES_VALUES}
+    simulated = np.array([len(dates) for dates, _ in batch_results], dtype=np.int64)
+    for run, (_, values) in enumerate(batch_results):
+        for name in SERIES_VALUES:
+            series[name][window_start[run]:window_start[run] + simulated[run], run] = values[name]
+    # Settimane dei run interrotti: valori del run di riferimento, riscalati
+    for run in np.flatnonzero(window_start + simulated <= window_end):
+        reference = proportional_to[run]
+        last = window_start[run] + simulated[run] - 1
+        scale = series['amount_usd'][last, run] / series['amount_usd'][last, reference]
+        for name in SERIES_VALUES:
+            series[name][last + 1:window_end[run] + 1, run] = series[name][last + 1:window_end[run] + 1, reference] * scale
+
+    # Indicatori di ogni finestra, aggiornati settimana per settimana come nel test di una strategia
+    metrics = OnlineMetrics(len(runs))
+    values = {name: np.full(len(runs), np.nan) for name in ROLLING_VALUES}
+    for week in range(weeks_number):
+        run_idx = np.flatnonzero((window_start <= week) & (week <= window_end))
+        step = metrics.update(series['amount_usd'][week, run_idx], series['amount_btc'][week, run_idx],
+                              series['transactions_amount_usd'][week, run_idx], run_idx)
+        values['max_drawdown_perc'][run_idx] = step['max_drawdown_perc']
+        values['amount_usd_sharpe_ratio'][run_idx] = step['amount_usd_sharpe_ratio']
+    final_amount_usd = series['amount_usd'][window_end, np.arange(len(runs))]
+    values['roi_usd'] = (final_amount_usd - initial_amount_usd) / initial_amount_usd * PERC_FACTOR
+
+    results = []
+    for strategy_idx in range(len(strategies)):
+        strategy_runs = slice(strategy_idx * len(windows), (strategy_idx + 1) * len(windows))
+        results.append({name: values[name][strategy_runs] for name in ROLLING_VALUES})
+    return results, int(simulated.sum()), int((window_end - window_start + 1).sum())
+
+
+def get_distribution(values):
+    """
+    Restituisce le statistiche della distribuzione dei valori fra le finestre (vedi
+    ROLLING_STATISTICS), ignorando i valori non definiti (NaN o infiniti).
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    distribution = {}
+    for name, percentile in ROLLING_STATISTICS.items():
+        if len(values) == 0:
+            distribution[name] = np.nan
+        elif name == 'mean':
+            distribution[name] = float(np.mean(values))
+        elif name == 'std':
+            distribution[name] = float(np.std(values, ddof=1)) if len(values) > 1 else np.nan
+        else:
+            distribution[name] = float(np.percentile(values, percentile))
+    return distribution
@@ -14,33 +14,12 @@
 # I test sono effettuati assumendo un invesimento iniziale di 10000 USD.
 
 
-# Test con data di inizio 3/1/2016
-# ---
-# Fee = 0.00%
-python3 backtest_strategy.py -s 2016-01-03 -e 2018-07-01 -au 10000 -f 0.0 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-# Fee = 0.10%
-python3 backtest_strategy.py -s 2016-01-03 -e 2018-07-01 -au 10000 -f 0.1 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-# Fee = 0.20%
-python3 backtest_strategy.py -s 2016-01-03 -e 2018-07-01 -au 10000 -f 0.2 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-
-# Test con data di inizio 1/1/2017
-# ---
-# Fee = 0.00%
-python3 backtest_strategy.py -s 2017-01-01 -e 2018-07-01 -au 10000 -f 0.0 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-# Fee = 0.10%
-python3 backtest_strategy.py -s 2017-01-01 -e 2018-07-01 -au 10000 -f 0.1 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-# Fee = 0.20%
-python3 backtest_strategy.py -s 2017-01-01 -e 2018-07-01 -au 10000 -f 0.2 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-
-# Test con data di inizio 7/1/2018
-# ---
-# Fee = 0.00%
-python3 backtest_strategy.py -s 2018-01-07 -e 2018-07-01 -au 10000 -f 0.0 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-# Fee = 0.10%
-python3 backtest_strategy.py -s 2018-01-07 -e 2018-07-01 -au 10000 -f 0.1 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-# Fee = 0.20%
-python3 backtest_strategy.py -s 2018-01-07 -e 2018-07-01 -au 10000 -f 0.2 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
-
-# Converto risultati
-python3 convert_excel_results_to_json.py
+# Test con data di inizio 3/1/2016, 1/1/2017 e 7/1/2018, con fee 0.00%, 0.10% e 0.20%.
+# Tutte le combinazioni sono analizzate in un'unica esecuzione: i dati ed i pesi
+# vengono calcolati una sola volta e condivisi fra date di inizio e fee.
+# I risultati sono salvati nell'archivio dei risultati (data/results.sqlite) e viene generato
+# un file JSON di riepilogo per ogni coppia data di inizio/fee (aggiungere -x per i file Excel).
+python3 backtest_strategy.py -s 2016-01-03 2017-01-01 2018-01-07 -e 2018-07-01 -au 10000 -f 0.0 0.1 0.2 -rpw 1 2 4 13 26 -cn 5 10 15 20 25 -wc 15 20 30 50 -v 1 -j
 
+# Genero i dati compatti per la pagina Web (riepiloghi, equity line e grafici di insieme)
+python3 build_web_payload.py -p 52
@@ -0,0 +1,173 @@
+"""
+snapshot_store.py
+    Archivio consolidato degli snapshot in un unico database SQLite, in alternativa ai file
+    CSV giornalieri: ogni snapshot viene aggiunto (o sostituito) in una singola transazione
+    ed i dati delle date richieste vengono letti con query sull'indice per data.
+"""
+import datetime
+import errno
+import hashlib
+import io
+import os
+import pathlib
+import sqlite3
+
+import numpy as np
+
+from market_data import intern_coin, MAX_RANK, PANEL_FIELDS, SnapshotPanel
+
+# Nome predefinito del database (nella cartella dei dati)
+STORE_FILE_NAME = "snapshots.sqlite"
+# Numero massimo di date lette con una singola query (parametri della clausola IN)
+QUERY_DATES = 500
+# Colonne degli snapshot (stesse colonne dei file CSV) e relativo tipo SQLite
+STORE_COLUMNS = [('date', 'TEXT'), ('rank', 'INTEGER'), ('name', 'TEXT'), ('symbol', 'TEXT'),
+                 ('marketcapusd', 'REAL'), ('priceusd', 'REAL'), ('pricebtc', 'REAL'), ('circulatingsupply', 'REAL'),
+                 ('volume24h', 'REAL'), ('perf1h', 'REAL'), ('perf24h', 'REAL'), ('perf7d', 'REAL')]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    date TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    sha1 TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    %s,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (date, position)
+) WITHOUT ROWID;
+""" % ",\n    ".join("%s %s" % column for column in STORE_COLUMNS)
+
+
+def convert_value(value, column_type):
+    """
+    Converte il valore testuale di una colonna nel tipo SQLite (None se vuoto o non valido).
+    """
+    if column_type == 'TEXT':
+        return value
+    try:
+        return int(value) if column_type == 'INTEGER' else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def rows_digest(headings, rows):
+    """
+    Calcola l'hash SHA-1 delle righe di uno snapshot nel formato CSV di
+    fetch_cmc_historical_data.generate_csv_file (lo stesso hash del file CSV).
+    """
+    text = io.StringIO()
+    text.write(";".join(headings) + "\n")
+    for row in rows:
+        text.write(";".join(row[heading] for heading in headings) + "\n")
+    return hashlib.sha1(text.getvalue().encode('utf-8')).hexdigest()
+
+
+class SnapshotStore:
+    """
+    Database SQLite con tutti gli snapshot (una riga per coin per data).
+    [Consolidated, date-indexed SQLite snapshot store.]
+    """
+
+    def __init__(self, store_path):
+        self.store_path = pathlib.Path(store_path)
+
+    def connect(self):
+        """
+        Apre una connessione al database, creando le tabelle se non esistono.
+        Le connessioni non vengono condivise fra thread: ogni operazione ne apre una.
+        """
+        connection = sqlite3.connect(str(self.store_path))
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def append(self, date, headings, rows, digest=None):
+        """
+        Aggiunge lo snapshot di una data (sostituendo quello eventualmente presente) in una
+        singola transazione. rows è la lista di dizionari colonna -> valore testuale prodotta
+        da fetch_cmc_historical_data.extract_data.
+        """
+        missing = [name for name, _ in STORE_COLUMNS if name not in headings]
+        if missing:
+            raise ValueError("Missing columns in snapshot of %s: %s" % (date, ", ".join(missing)))
+        date_key = date.strftime("%Y-%m-%d")
+        digest = digest or rows_digest(headings, rows)
+        values = [[convert_value(row[name], column_type) if name != 'date' else date_key for name, column_type in STORE_COLUMNS] + [position]
+                  for position, row in enumerate(rows)]
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM snapshot_rows WHERE date = ?", (date_key,))
+                connection.executemany("INSERT INTO snapshot_rows (%s, position) VALUES (%s)" % (
+                    ", ".join(name for name, _ in STORE_COLUMNS), ", ".join("?" * (len(STORE_COLUMNS) + 1))), values)
+                connection.execute("INSERT OR REPLACE INTO snapshots (date, rows, sha1, updated_at) VALUES (?, ?, ?, ?)",
+                                   (date_key, len(rows), digest, datetime.datetime.now().isoformat()))
+        finally:
+            connection.close()
+
+    def get_digests(self, start_date=None, end_date=None):
+        """
+        Restituisce gli hash degli snapshot presenti nell'intervallo (data -> hash).
+        """
+        connection = self.connect()
+        try:
+            cursor = connection.execute("SELECT date, sha1 FROM snapshots WHERE date BETWEEN ? AND ? ORDER BY date",
+                                        (start_date.strftime("%Y-%m-%d") if start_date else "0000-00-00",
+                                         end_date.strftime("%Y-%m-%d") if end_date else "9999-99-99"))
+            return {datetime.datetime.strptime(date_key, "%Y-%m-%d").date(): digest for date_key, digest in cursor}
+        finally:
+            connection.close()
+
+    def get_dates(self, start_date=None, end_date=None):
+        """
+        Restituisce le date degli snapshot presenti nell'intervallo.
+        """
+        return sorted(self.get_digests(start_date, end_date))
+
+    def get_panel(self, dates, max_rank=MAX_RANK):
+        """
+        Restituisce un SnapshotPanel con le prime max_rank righe (tutte se non specificato)
+        degli snapshot delle date specificate. Vengono lette solo le righe delle date richieste
+        (clausola IN sulla chiave primaria, QUERY_DATES date per query), per cui ad esempio il
+        backtest settimanale su un archivio giornaliero non legge gli snapshot degli altri giorni.
+        """
+        dates = sorted(set(dates))
+        if not dates:
+            return SnapshotPanel([], [0], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), [],
+                                 {field: np.zeros(0) for field in PANEL_FIELDS}, max_rank=max_rank)
+        digests = self.get_digests(dates[0], dates[-1])
+        loaded_dates = [date for date in dates if date in digests]
+        week_index = {date.strftime("%Y-%m-%d"): idx for idx, date in enumerate(loaded_dates)}
+        errors = {date: FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), "%s in %s" % (date, self.store_path))
+                  for date in dates if date not in digests}
+
+        lengths = np.zeros(len(loaded_dates), dtype=np.int64)
+        rank = []
+        symbol_id = []
+        fields = {field: [] for field in PANEL_FIELDS}
+        coin_ids = {}
+        connection = self.connect()
+        try:
+            date_keys = list(week_index)
+            for first in range(0, len(date_keys), QUERY_DATES):
+                # Le date sono ordinate, per cui le righe delle query successive seguono le precedenti
+                chunk = date_keys[first:first + QUERY_DATES]
+                parameters = chunk + ([max_rank] if max_rank is not None else [])
+                cursor = connection.execute("SELECT date, rank, symbol, name, %s FROM snapshot_rows WHERE date IN (%s)%s ORDER BY date, position" %
+                                            (", ".join(PANEL_FIELDS), ", ".join("?" * len(chunk)),
+                                             " AND position < ?" if max_rank is not None else ""), parameters)
+                for row in cursor:
+                    lengths[week_index[row[0]]] += 1
+                    rank.append(row[1] or 0)
+                    symbol_id.append(intern_coin(coin_ids, row[2] or '', row[3] or ''))
+                    for field_idx, field in enumerate(PANEL_FIELDS):
+                        fields[field].append(row[4 + field_idx] if row[4 + field_idx] is not None else np.nan)
+        finally:
+            connection.close()
+
+        coins = sorted(coin_ids, key=coin_ids.get)
+        return SnapshotPanel(loaded_dates, np.concatenate([[0], np.cumsum(lengths)]), np.array(rank, dtype=np.int64),
+                             np.array(symbol_id, dtype=np.int64), coins, {field: np.array(values, dtype=float) for field, values in fields.items()},
+                             errors, {date: digests[date] for date in loaded_dates}, max_rank)